@@ -1,5 +1,19 @@
 // Background script for MCP Agent extension
 
+// Text Fragment directive (#:~:text=start,end) that makes the browser scroll to
+// and highlight the text natively; '-', ',' and '&' are reserved in it
+function encodeFragmentText(text) {
+  return encodeURIComponent(text).replace(/-/g, '%2D').replace(/,/g, '%2C').replace(/&/g, '%26');
+}
+
+function withTextFragment(url, anchor, anchorEnd) {
+  let directive = `:~:text=${encodeFragmentText(anchor)}`;
+  if (anchorEnd) {
+    directive += `,${encodeFragmentText(anchorEnd)}`;
+  }
+  return url.includes('#') ? `${url}${directive}` : `${url}#${directive}`;
+}
+
 // Listen for messages from the popup
 chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
   if (request.action === "getPageContent") {
@@ -47,16 +61,19 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
   
   // Handle opening URLs with search highlighting
   if (request.action === "openUrlWithHighlight") {
-    const { url, searchTerms } = request;
+    const { url, searchTerms, anchor, anchorEnd } = request;
     
     if (!url) {
       sendResponse({ error: "URL is required" });
       return;
     }
     
-    // Create a URL with search terms parameter
+    // Results with an anchor jump straight to the matching text; older
+    // results fall back to highlighting the search terms
     let urlToOpen = url;
-    if (searchTerms && searchTerms.trim() !== '') {
+    if (anchor) {
+      urlToOpen = withTextFragment(url, anchor, anchorEnd);
+    } else if (searchTerms && searchTerms.trim() !== '') {
       const separator = url.includes('?') ? '&' : '?';
       urlToOpen = `${url}${separator}smarthighlight=${encodeURIComponent(searchTerms)}`;
     }
@@ -70,11 +87,13 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
           // Remove this listener
           chrome.tabs.onUpdated.removeListener(listener);
           
-          // Send message to content script to highlight terms
+          // Send message to content script to highlight the result
           setTimeout(() => {
             chrome.tabs.sendMessage(tab.id, {
               action: 'highlight',
-              searchTerms: searchTerms
+              searchTerms: searchTerms,
+              anchor: anchor,
+              anchorEnd: anchorEnd
             }).catch(err => console.log("Content script may not be ready yet"));
           }, 500);
         }
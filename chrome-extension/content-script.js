@@ -1,110 +1,206 @@
-// Content script to highlight search terms on a page
+// Content script to highlight search results on a page
 
-// Function to create a wrapper for text nodes
-function wrapTextWithHighlight(textNode, searchTerm) {
+const SKIP_TAGS = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEXTAREA']);
+// Give up on the end anchor if it is not found this far past the start
+const MAX_RANGE_CHARS = 20000;
+
+// Add the highlight styles once
+function addHighlightStyle() {
+  if (document.getElementById('smart-bookmark-style')) return;
+  const style = document.createElement('style');
+  style.id = 'smart-bookmark-style';
+  style.textContent = `
+    .smart-bookmark-highlight {
+      background-color: #FFFF00;
+      color: #000000;
+      border-radius: 2px;
+      box-shadow: 0 0 0 1px rgba(0, 0, 0, 0.1);
+    }
+    ::highlight(smart-bookmark) {
+      background-color: #FFFF00;
+      color: #000000;
+    }
+  `;
+  document.head.appendChild(style);
+}
+
+// Walker over the page's visible text nodes
+function createTextWalker() {
+  return document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT, {
+    acceptNode: node => SKIP_TAGS.has(node.parentNode.nodeName)
+      ? NodeFilter.FILTER_REJECT
+      : NodeFilter.FILTER_ACCEPT
+  });
+}
+
+function normalizeText(text) {
+  return text.replace(/\s+/g, ' ').trim().toLowerCase();
+}
+
+// Find the server's anchor snippets in one pass over the text nodes, stopping
+// as soon as they are found. Returns a Range from the start snippet to the end
+// snippet (or just the start snippet), or null.
+function findAnchorRange(anchor, anchorEnd) {
+  const start = normalizeText(anchor);
+  const end = anchorEnd ? normalizeText(anchorEnd) : null;
+  if (!start) return null;
+
+  const walker = createTextWalker();
+  let text = '';         // whitespace-collapsed, lowercased text seen so far
+  const positions = [];  // for each character of `text`: [textNode, offset]
+  let startAt = -1;
+  let node;
+
+  while ((node = walker.nextNode())) {
+    const value = node.nodeValue;
+    const scannedTo = text.length;
+    for (let i = 0; i < value.length; i++) {
+      let ch = value[i];
+      if (/\s/.test(ch)) {
+        if (text.length === 0 || text[text.length - 1] === ' ') continue;
+        ch = ' ';
+      }
+      text += ch.toLowerCase();
+      positions.push([node, i]);
+    }
+
+    // Only search the newly added text (plus an overlap for matches across nodes)
+    if (startAt < 0) {
+      startAt = text.indexOf(start, Math.max(0, scannedTo - start.length));
+      if (startAt < 0) continue;
+    }
+    if (!end) {
+      return makeRange(positions, startAt, startAt + start.length);
+    }
+    const endAt = text.indexOf(end, Math.max(startAt, scannedTo - end.length));
+    if (endAt >= 0) {
+      return makeRange(positions, startAt, endAt + end.length);
+    }
+    if (text.length - startAt > MAX_RANGE_CHARS) break;
+  }
+  return startAt >= 0 ? makeRange(positions, startAt, startAt + start.length) : null;
+}
+
+function makeRange(positions, from, to) {
+  const [startNode, startOffset] = positions[from];
+  const [endNode, endOffset] = positions[to - 1];
+  const range = document.createRange();
+  range.setStart(startNode, startOffset);
+  range.setEnd(endNode, endOffset + 1);
+  return range;
+}
+
+// Highlight a result chunk located by its anchor snippets and scroll to it
+function highlightAnchor(anchor, anchorEnd) {
+  const range = findAnchorRange(anchor, anchorEnd);
+  if (!range) return 0;
+
+  if (window.CSS && CSS.highlights && typeof Highlight !== 'undefined') {
+    // CSS Custom Highlight API: paints the range without touching the DOM
+    addHighlightStyle();
+    CSS.highlights.set('smart-bookmark', new Highlight(range));
+  } else {
+    const selection = window.getSelection();
+    selection.removeAllRanges();
+    selection.addRange(range);
+  }
+
+  const target = range.startContainer.parentElement;
+  if (target) {
+    target.scrollIntoView({
+      behavior: 'smooth',
+      block: 'center'
+    });
+  }
+  return 1;
+}
+
+function escapeRegExp(text) {
+  return text.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+}
+
+// Fallback for results without anchors: highlight the query words, using a
+// single pattern for all of them and one pass over the text nodes
+function highlightSearchTerms(searchTerms) {
+  if (!searchTerms || searchTerms.trim() === '') return 0;
+
+  // Terms to highlight (split by spaces, remove short ones)
+  const terms = searchTerms.split(/\s+/).filter(term => term.length > 2).map(escapeRegExp);
+  if (terms.length === 0) return 0;
+  const regex = new RegExp(terms.join('|'), 'gi');
+
+  // Collect matching nodes first: wrapping them while walking would move the walker
+  const walker = createTextWalker();
+  const matches = [];
+  let node;
+  while ((node = walker.nextNode())) {
+    regex.lastIndex = 0;
+    if (node.parentNode.className !== 'smart-bookmark-highlight' && regex.test(node.nodeValue)) {
+      matches.push(node);
+    }
+  }
+
+  addHighlightStyle();
+  matches.forEach(textNode => wrapTextWithHighlight(textNode, regex));
+
+  // Scroll to the first highlight
+  const firstHighlight = document.querySelector('.smart-bookmark-highlight');
+  if (firstHighlight) {
+    firstHighlight.scrollIntoView({
+      behavior: 'smooth',
+      block: 'center'
+    });
+  }
+  return document.querySelectorAll('.smart-bookmark-highlight').length;
+}
+
+// Replace a text node with the same text, its matches wrapped in highlight spans
+function wrapTextWithHighlight(textNode, regex) {
   const text = textNode.nodeValue;
-  const regex = new RegExp(searchTerm, 'gi');
-  
-  if (!regex.test(text)) return;
-  
-  const parent = textNode.parentNode;
-  if (!parent) return;
-  
-  // If parent is already a highlight, don't re-highlight
-  if (parent.className === 'smart-bookmark-highlight') return;
-  
-  // Create a fragment to hold the new nodes
   const fragment = document.createDocumentFragment();
   let lastIndex = 0;
   let match;
-  
-  // Reset regex state
+
   regex.lastIndex = 0;
-  
-  // Find and wrap all matches
   while ((match = regex.exec(text)) !== null) {
     // Add text before the match
     if (match.index > lastIndex) {
       fragment.appendChild(document.createTextNode(text.substring(lastIndex, match.index)));
     }
-    
+
     // Create highlighted span for the match
     const highlightSpan = document.createElement('span');
     highlightSpan.className = 'smart-bookmark-highlight';
-    highlightSpan.style.backgroundColor = '#FFFF00';
-    highlightSpan.style.color = '#000000';
     highlightSpan.appendChild(document.createTextNode(match[0]));
     fragment.appendChild(highlightSpan);
-    
+
     lastIndex = regex.lastIndex;
   }
-  
+
   // Add any remaining text
   if (lastIndex < text.length) {
     fragment.appendChild(document.createTextNode(text.substring(lastIndex)));
   }
-  
-  // Replace the original text node with the fragment
-  parent.replaceChild(fragment, textNode);
+
+  textNode.parentNode.replaceChild(fragment, textNode);
 }
 
-// Function to traverse DOM and highlight text
-function highlightSearchTerms(searchTerms) {
-  if (!searchTerms || searchTerms.trim() === '') return;
-  
-  // Create a style element for the highlights
-  const style = document.createElement('style');
-  style.textContent = `
-    .smart-bookmark-highlight {
-      background-color: #FFFF00;
-      color: #000000;
-      border-radius: 2px;
-      box-shadow: 0 0 0 1px rgba(0, 0, 0, 0.1);
-    }
-  `;
-  document.head.appendChild(style);
-  
-  // Terms to highlight (split by spaces, remove empty)
-  const terms = searchTerms.split(' ').filter(term => term.length > 2);
-  
-  // Function to walk the DOM tree
-  function walkDom(node) {
-    if (node.nodeType === Node.TEXT_NODE) {
-      // For text nodes, check and highlight each term
-      terms.forEach(term => wrapTextWithHighlight(node, term));
-    } else {
-      // Skip nodes that shouldn't be modified
-      const tagName = node.tagName && node.tagName.toLowerCase();
-      if (tagName === 'script' || tagName === 'style' || tagName === 'noscript') {
-        return;
-      }
-      
-      // Recursively process child nodes (make a copy as the DOM might change)
-      const children = Array.from(node.childNodes);
-      children.forEach(walkDom);
-    }
-  }
-  
-  // Start processing from the body
-  walkDom(document.body);
-  
-  // Scroll to the first highlight
-  const firstHighlight = document.querySelector('.smart-bookmark-highlight');
-  if (firstHighlight) {
-    firstHighlight.scrollIntoView({
-      behavior: 'smooth',
-      block: 'center'
-    });
+// Highlight a result: its anchor if the server sent one, otherwise the query words
+function highlightResult({ anchor, anchorEnd, searchTerms }) {
+  if (anchor) {
+    const found = highlightAnchor(anchor, anchorEnd);
+    if (found) return found;
   }
+  return highlightSearchTerms(searchTerms);
 }
 
 // Listen for messages from the background script
 chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
-  if (request.action === 'highlight' && request.searchTerms) {
+  if (request.action === 'highlight' && (request.anchor || request.searchTerms)) {
     // Delay slightly to ensure page is fully loaded
     setTimeout(() => {
-      highlightSearchTerms(request.searchTerms);
-      sendResponse({ success: true, count: document.querySelectorAll('.smart-bookmark-highlight').length });
+      const count = highlightResult(request);
+      sendResponse({ success: true, count: count });
     }, 300);
     return true; // Keep the message channel open for the async response
   }
@@ -115,9 +211,9 @@ const urlParams = new URLSearchParams(window.location.search);
 const searchTerms = urlParams.get('smarthighlight');
 if (searchTerms) {
   // Remove the parameter from the URL without reloading
-  const newUrl = window.location.href.replace(/[\?&]smarthighlight=[^&]+/, '');
+  const newUrl = window.location.href.replace(/[\?&]smarthighlight=[^&#]+/, '');
   window.history.replaceState({}, document.title, newUrl);
-  
+
   // Wait for page to load before highlighting
   if (document.readyState === 'loading') {
     document.addEventListener('DOMContentLoaded', () => {
@@ -126,4 +222,4 @@ if (searchTerms) {
   } else {
     setTimeout(() => highlightSearchTerms(searchTerms), 300);
   }
-} 
\ No newline at end of file
+}
@@ -5,6 +5,21 @@ document.addEventListener('DOMContentLoaded', function() {
   const responseContainer = document.getElementById('response-container');
   const addPageBtn = document.getElementById('add-page-btn');
 
+  // Stable per-install id so the agent keeps this user's memory separate
+  function getSessionId() {
+    let sessionId = localStorage.getItem('agentSessionId');
+    if (!sessionId) {
+      sessionId = crypto.randomUUID();
+      localStorage.setItem('agentSessionId', sessionId);
+    }
+    return sessionId;
+  }
+
+  // Page text placed in an HTML attribute
+  function escapeAttribute(text) {
+    return text.replace(/&/g, '&amp;').replace(/"/g, '&quot;').replace(/</g, '&lt;');
+  }
+
   // Function to process a query and show results
   async function processQuery(query) {
     if (!query) {
@@ -16,29 +31,63 @@ document.addEventListener('DOMContentLoaded', function() {
     responseContainer.innerHTML = '<p class="loading">Processing your query...</p>';
 
     try {
-      // Send the query to our endpoint
-      const response = await fetch('http://127.0.0.1:7172/api/query', {
+      // Stream the agent's progress so steps and the answer show up as they happen
+      const response = await fetch('http://127.0.0.1:7172/api/query/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ query: query })
+        body: JSON.stringify({ query: query, session_id: getSessionId() })
       });
 
       if (!response.ok) {
         throw new Error(`Server responded with status: ${response.status}`);
       }
 
-      const data = await response.json();
-      
-      // Display the response
-      responseContainer.innerHTML = `<p><strong>Response:</strong></p><p>${data.result}</p>`;
+      let status = 'Processing your query...';
+      let answer = '';
+      const render = () => {
+        responseContainer.innerHTML = answer
+          ? `<p><strong>Response:</strong></p><p>${answer}</p>`
+          : `<p class="loading">${status}</p>`;
+      };
+
+      await readEventStream(response, event => {
+        if (event.type === 'step') {
+          status = `Step ${event.step}: thinking...`;
+        } else if (event.type === 'tool') {
+          status = `Ran ${event.tool}, planning next step...`;
+        } else if (event.type === 'answer') {
+          answer += event.text;
+        } else if (event.type === 'final') {
+          answer = event.result;
+        }
+        render();
+      });
       
     } catch (error) {
       console.error('Error:', error);
       responseContainer.innerHTML = `<p style="color: red;">Error: ${error.message}</p>`;
     }
   }
+
+  // Read a text/event-stream response body, calling onEvent with each parsed `data:` payload
+  async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const messages = buffer.split('\n\n');
+      buffer = messages.pop();
+      for (const message of messages) {
+        const data = message.split('\n').filter(line => line.startsWith('data: ')).map(line => line.slice(6)).join('\n');
+        if (data) onEvent(JSON.parse(data));
+      }
+    }
+  }
   
   // Function to handle search
   async function searchContent(query) {
@@ -90,7 +139,7 @@ document.addEventListener('DOMContentLoaded', function() {
         resultsHtml += `
           <div class="search-result">
             <div class="search-result-title">${title}</div>
-            <div class="search-result-url" data-url="${url}">${url}</div>
+            <div class="search-result-url" data-url="${url}" data-anchor="${escapeAttribute(metadata.anchor || '')}" data-anchor-end="${escapeAttribute(metadata.anchor_end || '')}">${url}</div>
           </div>
         `;
       });
@@ -106,7 +155,10 @@ document.addEventListener('DOMContentLoaded', function() {
             chrome.runtime.sendMessage({
               action: 'openUrlWithHighlight',
               url: url,
-              searchTerms: queryInput.value.trim()
+              searchTerms: queryInput.value.trim(),
+              // Page text where the matching chunk starts and ends
+              anchor: this.getAttribute('data-anchor'),
+              anchorEnd: this.getAttribute('data-anchor-end')
             }, response => {
               if (response.error) {
                 console.error('Error opening URL:', response.error);
@@ -122,6 +174,25 @@ document.addEventListener('DOMContentLoaded', function() {
     }
   }
 
+  // Poll an ingestion job, showing its progress, until it is done or fails
+  async function waitForIngestJob(jobId) {
+    while (true) {
+      const response = await fetch(`http://127.0.0.1:7172/api/add-page/${jobId}`);
+      if (!response.ok) {
+        throw new Error(`Server responded with status: ${response.status}`);
+      }
+      
+      const job = await response.json();
+      if (job.status === 'done' || job.status === 'error') {
+        return job;
+      }
+      
+      const percent = Math.round((job.progress || 0) * 100);
+      responseContainer.innerHTML = `<p class="loading">Indexing page: ${job.stage} (${percent}%)...</p>`;
+      await new Promise(resolve => setTimeout(resolve, 500));
+    }
+  }
+
   // Handle Enter key press in the query input (acts like submit button)
   queryInput.addEventListener('keypress', function(e) {
     if (e.key === 'Enter') {
@@ -177,8 +248,16 @@ document.addEventListener('DOMContentLoaded', function() {
             
             const data = await serverResponse.json();
             
-            // Display success message
-            responseContainer.innerHTML = `<p style="color: green;">${data.message}</p>`;
+            if (!data.job_id) {
+              const color = data.status === 'error' ? 'red' : 'green';
+              responseContainer.innerHTML = `<p style="color: ${color};">${data.message}</p>`;
+              return;
+            }
+            
+            // Indexing runs in the background; poll until the job finishes
+            const job = await waitForIngestJob(data.job_id);
+            const color = job.status === 'done' ? 'green' : 'red';
+            responseContainer.innerHTML = `<p style="color: ${color};">${job.message}</p>`;
           } catch (error) {
             console.error('Error sending to server:', error);
             responseContainer.innerHTML = `<p style="color: red;">Error adding page: ${error.message}</p>`;
@@ -1,10 +1,13 @@
 
+import asyncio
 import json
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Optional, Union
 
 from mcp import ClientSession
 from pydantic import BaseModel
 
+from tool_catalog import ToolCatalog
+
 
 try:
     from agent import log
@@ -20,6 +23,14 @@ class ToolCallResult(BaseModel):
     arguments: Dict[str, Any]
     result: Union[str, list, dict]
     raw_response: Any
+    call_id: Optional[str] = None
+
+
+class PlannedCall(BaseModel):
+    """One entry of a FUNCTION_CALLS batch"""
+    id: str
+    func_name: str
+    param: Dict[str, Any] = {}
     
 
 def parse_function_call(response_text: str) -> tuple[str, Dict[str, Any]]:
@@ -46,39 +57,140 @@ def parse_function_call(response_text: str) -> tuple[str, Dict[str, Any]]:
         log("parser", f"❌ Failed to parse FUNCTION_CALL: {e}")
         raise
 
-async def execute_tool(session: ClientSession, tools: list[Any], response: str) -> ToolCallResult:
+async def _call_tool(session: ClientSession, catalog: ToolCatalog, tool_name: str,
+                     arguments: Dict[str, Any], call_id: Optional[str] = None) -> ToolCallResult:
+    # Unknown tools and malformed arguments fail here, without a server round trip
+    catalog.validate(tool_name, arguments)
+
+    log("tool", f"⚙️ Calling '{tool_name}' with: {arguments}")
+    result = await session.call_tool(tool_name, arguments=arguments)
+
+    if hasattr(result, 'content'):
+        if isinstance(result.content, list):
+            out = [getattr(item, 'text', str(item)) for item in result.content]
+        else:
+            out = getattr(result.content, 'text', str(result.content))
+    else:
+        out = str(result)
+
+    log("tool", f"✅ {tool_name} result: {out}")
+    return ToolCallResult(
+        tool_name=tool_name,
+        arguments=arguments,
+        result=out,
+        raw_response=result,
+        call_id=call_id
+    )
+
+
+async def execute_tool(session: ClientSession, catalog: ToolCatalog, response: str) -> ToolCallResult:
     """Executes a FUNCTION_CALL via MCP tool session."""
     try:
         tool_name, arguments = parse_function_call(response)
+        return await _call_tool(session, catalog, tool_name, arguments)
+
+    except Exception as e:
+        log("tool", f"⚠️ Execution failed for '{response}': {e}")
+        raise
 
-        tool = next((t for t in tools if t.name == tool_name), None)
-        if not tool:
-            raise ValueError(f"Tool '{tool_name}' not found in registered tools")
 
-        log("tool", f"⚙️ Calling '{tool_name}' with: {arguments}")
-        result = await session.call_tool(tool_name, arguments=arguments)
+def parse_function_calls(response_text: str) -> List[PlannedCall]:
+    """Parse `FUNCTION_CALLS: [{"id": ..., "func_name": ..., "param": ...}, ...]`"""
+    if not response_text.startswith("FUNCTION_CALLS:"):
+        raise ValueError("Not a valid FUNCTION_CALLS")
+    try:
+        entries = json.loads(response_text.split(":", 1)[1])
+        if not isinstance(entries, list) or not entries:
+            raise ValueError("FUNCTION_CALLS must be a non-empty list")
+        calls = [PlannedCall(**{"id": f"c{i + 1}", **entry}) for i, entry in enumerate(entries)]
+    except Exception as e:
+        log("parser", f"❌ Failed to parse FUNCTION_CALLS: {e}")
+        raise
+    if len({c.id for c in calls}) != len(calls):
+        raise ValueError("FUNCTION_CALLS ids must be unique")
+    return calls
+
+
+def _references(value: Any) -> set:
+    """Call ids referenced as "$<id>" anywhere in a parameter value"""
+    if isinstance(value, str) and value.startswith("$"):
+        return {value[1:]}
+    if isinstance(value, dict):
+        return set().union(*map(_references, value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*map(_references, value)) if value else set()
+    return set()
+
+
+def _resolve(value: Any, outputs: Dict[str, Any]) -> Any:
+    if isinstance(value, str) and value.startswith("$") and value[1:] in outputs:
+        return outputs[value[1:]]
+    if isinstance(value, dict):
+        return {k: _resolve(v, outputs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, outputs) for v in value]
+    return value
+
+
+def result_value(result: ToolCallResult) -> Any:
+    """The value a later call receives for "$<id>": the tool's `result` field when it has one"""
+    out = result.result
+    if isinstance(out, list) and len(out) == 1:
+        out = out[0]
+    if isinstance(out, str):
+        try:
+            parsed = json.loads(out)
+        except ValueError:
+            return out
+        return parsed.get("result", parsed) if isinstance(parsed, dict) else parsed
+    return out
 
-        if hasattr(result, 'content'):
-            if isinstance(result.content, list):
-                out = [getattr(item, 'text', str(item)) for item in result.content]
-            else:
-                out = getattr(result.content, 'text', str(result.content))
-        else:
-            out = str(result)
 
-        log("tool", f"✅ {tool_name} result: {out}")
-        return ToolCallResult(
-            tool_name=tool_name,
-            arguments=arguments,
-            result=out,
-            raw_response=result
-        )
+async def execute_calls(session: ClientSession, catalog: ToolCatalog, response: str) -> List[ToolCallResult]:
+    """Executes a FUNCTION_CALLS batch: calls run as soon as the calls they reference are done,
+    independent ones concurrently over the session. Results come back in plan order."""
+    try:
+        calls = parse_function_calls(response)
+        ids = {c.id for c in calls}
+        pending = {c.id: c for c in calls}
+        depends = {c.id: _references(c.param) & ids for c in calls}
+        outputs: Dict[str, Any] = {}
+        results: Dict[str, ToolCallResult] = {}
+
+        while pending:
+            ready = [c for c in pending.values() if depends[c.id] <= results.keys()]
+            if not ready:
+                raise ValueError(f"FUNCTION_CALLS has circular references between {sorted(pending)}")
+            log("tool", f"Running {len(ready)} call(s) concurrently: {[c.id for c in ready]}")
+            wave = await asyncio.gather(*(
+                _call_tool(session, catalog, c.func_name, _resolve(c.param, outputs), call_id=c.id)
+                for c in ready
+            ))
+            for call, result in zip(ready, wave):
+                results[call.id] = result
+                outputs[call.id] = result_value(result)
+                del pending[call.id]
+
+        return [results[c.id] for c in calls]
 
     except Exception as e:
         log("tool", f"⚠️ Execution failed for '{response}': {e}")
         raise
 
 
+async def execute_plan(session: ClientSession, catalog: ToolCatalog, response: str) -> List[ToolCallResult]:
+    """Executes a FUNCTION_CALL or FUNCTION_CALLS plan, returning one result per call."""
+    if response.startswith("FUNCTION_CALLS:"):
+        return await execute_calls(session, catalog, response)
+    return [await execute_tool(session, catalog, response)]
+
+
+def format_results(results: List[ToolCallResult]) -> str:
+    """Tool output text fed back to the next planning step"""
+    if len(results) == 1:
+        return str(results[0].result)
+    return "\n".join(f"{r.call_id}: {r.tool_name}({r.arguments}) -> {r.result}" for r in results)
+
 if __name__ == "__main__":
     from pdb import set_trace
     resp = """FUNCTION_CALL: {"func_name":"add_list","param":{"input":{"l":[2,3,5,7,11]}}}"""
@@ -7,10 +7,12 @@ import time
 from mcp import ClientSession, StdioServerParameters, stdio_client
 from mcp.client.sse import sse_client
 
-from action import execute_tool
-from decision import generate_plan
+from action import execute_plan, format_results
+from local_planner import plan_locally
 from memory import MemoryItem, MemoryManager
 from perception import extract_perception
+from step_pipeline import format_timings, plan_step, timed
+from tool_catalog import get_catalog
 
 
 def log(stage: str, msg: str):
@@ -60,37 +62,7 @@ async def client_main(read, write):
                 tools_result = await session.list_tools()
                 print("Available tools:", [t.name for t in tools_result.tools])
                 tools = tools_result.tools
-                # tool_descriptions = "\n".join(
-                #     f"- {tool.name}: {getattr(tool, 'description', 'No description')}" 
-                #     for tool in tools
-                # )
-
-                tools_description = []
-                for i, tool in enumerate(tools):
-                    try:
-                        # Get tool properties
-                        params = tool.inputSchema
-                        desc = getattr(tool, 'description', 'No description available')
-                        name = getattr(tool, 'name', f'tool_{i}')
-                        
-                        # Format the input schema in a more readable way
-                        if 'properties' in params:
-                            param_details = [
-                                format_param(param_name, param_info, params)
-                                for param_name, param_info in params['properties'].items()
-                            ]
-                            params_str = ', '.join(param_details)
-                        else:
-                            params_str = 'no parameters'
-
-                        tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
-                        tools_description.append(tool_desc)
-                        # print(f"[agent] Added description for tool: {tool_desc}")
-                    except Exception as e:
-                        print(f"[agent] Error processing tool {i}: {e}")
-                        tools_description.append(f"{i+1}. Error processing tool")
-                
-                tools_description = "\n".join(tools_description)
+                catalog = get_catalog(tools)
 
                 log("agent", f"{len(tools)} tools loaded")
 
@@ -104,38 +76,44 @@ async def client_main(read, write):
 
                 query = user_input  # Store original intent
                 step = 0
+                perception = None
+
+                # Plain arithmetic is evaluated with the tools directly, without the LLM
+                local_answer = await plan_locally(query, session, catalog)
+                if local_answer:
+                    log("agent", f"✅ FINAL RESULT: {local_answer}")
 
-                while step < max_steps:
+                while not local_answer and step < max_steps:
                     log("\nloop", f"Step {step + 1} started...\n")
 
-                    perception = await extract_perception(user_input)
+                    # Parallel perception + recall; perception is skipped once the input is a tool result
+                    step_result = await plan_step(user_input, memory, tool_descriptions=catalog.description,
+                                                  previous_perception=perception)
+                    perception, plan = step_result.perception, step_result.plan
                     log("agent", f"Objective: {perception.objective}, Tool hint: {perception.tool_hint}")
-
-                    # retrieved = memory.retrieve(query=user_input, top_k=3, session_filter=session_id)
-                    retrieved = await memory.recall(query=user_input)
-                    log("agent", f"Retrieved {len(retrieved)} relevant memories")
-
-                    plan = await generate_plan(perception, retrieved, tool_descriptions=tools_description)
+                    log("agent", f"Retrieved {len(step_result.memories)} relevant memories")
                     log("agent", f"Plan generated: {plan}")
 
                     if plan.startswith("FINAL_ANSWER:"):
                         log("agent", f"✅ FINAL RESULT: {plan}")
+                        log("timing", format_timings(step_result.timings))
                         break
 
                     try:
-                        result = await execute_tool(session, tools, plan)
-                        log("tool", f"{result.tool_name} returned: {result.result}")
-
-                        memory.store(MemoryItem(
-                            text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}",
-                            # type="tool_output",
-                            # tool_name=result.tool_name,
-                            # user_query=user_input,
-                            # tags=[result.tool_name],
-                            # session_id=session_id
-                        ))
-
-                        user_input = f"Original task: {query}\nPrevious output: {result.result}\nWhat should I do next?"
+                        results = await timed(step_result.timings, "tool", execute_plan(session, catalog, plan))
+                        for result in results:
+                            log("tool", f"{result.tool_name} returned: {result.result}")
+                            memory.store(MemoryItem(
+                                text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}",
+                                # type="tool_output",
+                                # tool_name=result.tool_name,
+                                # user_query=user_input,
+                                # tags=[result.tool_name],
+                                # session_id=session_id
+                            ))
+                        log("timing", format_timings(step_result.timings))
+
+                        user_input = f"Original task: {query}\nPrevious output: {format_results(results)}\nWhat should I do next?"
 
                     except Exception as e:
                         log("error", f"Tool execution failed: {e}")
@@ -158,27 +136,6 @@ async def get_user_preference(memory: MemoryManager):
     memory.store(MemoryItem(text=f"User's preference: {perception.objects}"))
 
 
-def format_param(name, schema, root_schema):
-    if '$ref' in schema:
-        ref_schema = resolve_ref(schema['$ref'], root_schema)
-        inner_props = ref_schema.get('properties', {})
-        inner_details = []
-        for inner_name, inner_info in inner_props.items():
-            inner_type = inner_info.get('type', 'unknown')
-            inner_details.append(f"{inner_name}:{inner_type}")
-        return f"{name}: {ref_schema.get('title', name)}({', '.join(inner_details)})"
-    else:
-        param_type = schema.get('type', 'unknown')
-        return f"{name}: {param_type}"
-    
-def resolve_ref(ref, schema):
-    """Resolve a $ref in a JSON schema."""
-    parts = ref.strip('#/').split('/')
-    resolved = schema
-    for part in parts:
-        resolved = resolved.get(part, {})
-    return resolved
-
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "local":
         import argparse
@@ -1,154 +1,152 @@
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Union
 import time
+from pathlib import Path
 
 from mcp import ClientSession
-from mcp.client.sse import sse_client
+from mcp.server.fastmcp import FastMCP
 
-from action import execute_tool
-from decision import generate_plan
-from memory import MemoryItem, MemoryManager
-from perception import extract_perception
+from action import execute_plan, format_results
+from local_planner import plan_locally
+from local_tools import LocalToolSession
+from memory import MemoryItem, SessionMemoryStore
+from session_pool import MCPSessionPool
+from step_pipeline import DEFAULT_MODE, format_timings, plan_step, timed
+from tool_catalog import ToolCatalog
+
+MEMORY_DIR = Path(__file__).parent / "faiss_index" / "agent_memory"
+# Queries that arrive without a session id share this one
+DEFAULT_SESSION = "default"
 
 class AgentService:
     def __init__(self):
-        self.memory = MemoryManager()
+        # Bounded memory per extension session, persisted next to the index
+        self.memories = SessionMemoryStore(persist_dir=MEMORY_DIR)
         self.max_steps = 10
         self.host = "127.0.0.1"
         self.port = 7172
-        self.initialized = False
+        # Warm, initialized MCP sessions reused across queries
+        self.session_pool = MCPSessionPool(f"http://{self.host}:{self.port}/sse", max_size=4)
+        # Set when the agent runs inside the MCP server process: tools are called directly
+        self.local_tools: Optional[LocalToolSession] = None
+
+    def attach_local_server(self, server: FastMCP) -> None:
+        """Dispatch tool calls straight to a FastMCP server in this process instead of over SSE"""
+        if self.local_tools is None or self.local_tools.server is not server:
+            self.local_tools = LocalToolSession(server)
+            print("[agent_service] Using in-process tool dispatch")
         
-    async def initialize(self):
-        """Initialize the agent service if not already initialized"""
-        if self.initialized:
-            return
-            
-        # Store basic user context
-        self.memory.store(MemoryItem(text="Agent initialized via Chrome extension"))
-        self.initialized = True
-    
-    async def process_query(self, query: str) -> str:
-        """Process a user query and return the result"""
-        await self.initialize()
+    async def process_query(self, query: str, session_id: Optional[str] = None, mode: str = DEFAULT_MODE,
+                            emit: Optional[Callable[[dict], None]] = None) -> str:
+        """Process a user query and return the result (`emit` receives progress events)"""
+        session_id = session_id or DEFAULT_SESSION
         
         try:
-            host_port = f"http://{self.host}:{self.port}/sse"
-            print(f'[agent_service] connecting with server at {host_port}')
-            
-            async with sse_client(host_port) as (read, write):
-                print("[agent_service] connected with server")
-                return await self._execute_query(read, write, query)
+            if self.local_tools is not None:
+                return await self._execute_query(self.local_tools, await self.local_tools.catalog(), query, session_id, mode, emit)
+
+            async with self.session_pool.session() as pooled:
+                return await self._execute_query(pooled.session, pooled.catalog, query, session_id, mode, emit)
                 
         except Exception as e:
             import traceback
             traceback.print_exc()
             return f"Error processing query: {str(e)}"
+        finally:
+            self.memories.save(session_id)
     
-    async def _execute_query(self, read, write, query: str) -> str:
-        """Execute a query using the MCP session"""
-        async with ClientSession(read, write) as session:
-            print("[agent_service] Session created, initializing...")
-            
-            await session.initialize()
-            print("[agent_service] MCP session initialized")
-            
-            # Get available tools
-            tools_result = await session.list_tools()
-            print("Available tools:", [t.name for t in tools_result.tools])
-            tools = tools_result.tools
-            
-            # Format tool descriptions
-            tools_description = []
-            for i, tool in enumerate(tools):
-                try:
-                    params = tool.inputSchema
-                    desc = getattr(tool, 'description', 'No description available')
-                    name = getattr(tool, 'name', f'tool_{i}')
-                    
-                    if 'properties' in params:
-                        param_details = [
-                            self._format_param(param_name, param_info, params)
-                            for param_name, param_info in params['properties'].items()
-                        ]
-                        params_str = ', '.join(param_details)
-                    else:
-                        params_str = 'no parameters'
-
-                    tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
-                    tools_description.append(tool_desc)
-                except Exception as e:
-                    print(f"[agent_service] Error processing tool {i}: {e}")
-                    tools_description.append(f"{i+1}. Error processing tool")
+    async def stream_query(self, query: str, session_id: Optional[str] = None,
+                           mode: str = DEFAULT_MODE) -> AsyncIterator[dict]:
+        """Run a query, yielding its step events as they happen and a final "final" event"""
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.process_query(query, session_id, mode, emit=events.put_nowait))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            yield {"type": "final", "result": task.result()}
+        finally:
+            # The client went away: stop the agent instead of finishing unseen work
+            if not task.done():
+                task.cancel()
+    
+    async def close(self):
+        """Close the pooled MCP sessions and persist session memories"""
+        await self.session_pool.close()
+        self.memories.save()
+    
+    async def _execute_query(self, session: Union[ClientSession, LocalToolSession], catalog: ToolCatalog,
+                             query: str, session_id: str, mode: str = DEFAULT_MODE,
+                             emit: Optional[Callable[[dict], None]] = None) -> str:
+        """Execute a query using an initialized MCP session"""
+        # Only stream the plan (for early FINAL_ANSWER text) when someone is listening
+        on_answer = (lambda text: emit({"type": "answer", "text": text})) if emit else None
+        emit = emit or (lambda event: None)
+        print(f"[agent_service] {len(catalog.tools)} tools loaded")
+        memory = self.memories.get(session_id)
+        
+        # Process the query
+        user_input = query
+        original_query = query
+        step = 0
+        final_result = ""
+        perception = None
+        last_output = "No result"
+        
+        # Plain arithmetic is evaluated with the tools directly, without the LLM
+        local_answer = await plan_locally(query, session, catalog)
+        if local_answer:
+            print(f"[agent_service] ✅ FINAL RESULT (local planner): {local_answer}")
+            emit({"type": "plan", "plan": local_answer})
+            return local_answer.replace("FINAL_ANSWER:", "").strip()
+        
+        while step < self.max_steps:
+            print(f"[agent_service] Step {step + 1} started...")
+            emit({"type": "step", "step": step + 1})
             
-            tools_description = "\n".join(tools_description)
-            print(f"[agent_service] {len(tools)} tools loaded")
+            # Parallel perception + recall; perception is skipped once the input is a tool result
+            step_result = await plan_step(user_input, memory, tool_descriptions=catalog.description,
+                                          previous_perception=perception, session_id=session_id, mode=mode,
+                                          on_answer=on_answer,
+                                          on_perception=lambda p: emit({"type": "perception", "objective": p.objective,
+                                                                        "tool_hint": p.tool_hint}))
+            perception, plan = step_result.perception, step_result.plan
+            print(f"[agent_service] Objective: {perception.objective}, Tool hint: {perception.tool_hint}")
+            print(f"[agent_service] Retrieved {len(step_result.memories)} relevant memories")
+            print(f"[agent_service] Plan generated: {plan}")
+            emit({"type": "plan", "plan": plan})
             
-            # Process the query
-            user_input = query
-            original_query = query
-            step = 0
-            final_result = ""
+            if plan.startswith("FINAL_ANSWER:"):
+                final_result = plan.replace("FINAL_ANSWER:", "").strip()
+                print(f"[agent_service] ✅ FINAL RESULT: {final_result}")
+                print(f"[agent_service] Step {step + 1} timings: {format_timings(step_result.timings)}")
+                break
             
-            while step < self.max_steps:
-                print(f"[agent_service] Step {step + 1} started...")
-                
-                perception = await extract_perception(user_input)
-                print(f"[agent_service] Objective: {perception.objective}, Tool hint: {perception.tool_hint}")
-                
-                retrieved = await self.memory.recall(query=user_input)
-                print(f"[agent_service] Retrieved {len(retrieved)} relevant memories")
-                
-                plan = await generate_plan(perception, retrieved, tool_descriptions=tools_description)
-                print(f"[agent_service] Plan generated: {plan}")
-                
-                if plan.startswith("FINAL_ANSWER:"):
-                    final_result = plan.replace("FINAL_ANSWER:", "").strip()
-                    print(f"[agent_service] ✅ FINAL RESULT: {final_result}")
-                    break
-                
-                try:
-                    result = await execute_tool(session, tools, plan)
+            try:
+                results = await timed(step_result.timings, "tool", execute_plan(session, catalog, plan))
+                for result in results:
                     print(f"[agent_service] {result.tool_name} returned: {result.result}")
-                    
-                    self.memory.store(MemoryItem(
-                        text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}"
+                    emit({"type": "tool", "tool": result.tool_name, "arguments": result.arguments, "result": result.result})
+                    memory.store(MemoryItem(
+                        text=f"Tool call: {result.tool_name} with {result.arguments}, got: {result.result}",
+                        session_id=session_id
                     ))
-                    
-                    user_input = f"Original task: {original_query}\nPrevious output: {result.result}\nWhat should I do next?"
-                    
-                except Exception as e:
-                    print(f"[agent_service] Tool execution failed: {e}")
-                    return f"Tool execution error: {str(e)}"
+                print(f"[agent_service] Step {step + 1} timings: {format_timings(step_result.timings)}")
                 
-                step += 1
+                last_output = format_results(results)
+                user_input = f"Original task: {original_query}\nPrevious output: {last_output}\nWhat should I do next?"
                 
-                # If we've reached max steps without a final answer
-                if step == self.max_steps:
-                    final_result = f"Reached maximum number of steps ({self.max_steps}) without a final answer. Last result: {result.result if 'result' in locals() else 'No result'}"
+            except Exception as e:
+                print(f"[agent_service] Tool execution failed: {e}")
+                return f"Tool execution error: {str(e)}"
             
-            return final_result or "Processing complete, but no final answer was produced."
-    
-    def _format_param(self, name, schema, root_schema):
-        """Format a parameter description"""
-        if '$ref' in schema:
-            ref_schema = self._resolve_ref(schema['$ref'], root_schema)
-            inner_props = ref_schema.get('properties', {})
-            inner_details = []
-            for inner_name, inner_info in inner_props.items():
-                inner_type = inner_info.get('type', 'unknown')
-                inner_details.append(f"{inner_name}:{inner_type}")
-            return f"{name}: {ref_schema.get('title', name)}({', '.join(inner_details)})"
-        else:
-            param_type = schema.get('type', 'unknown')
-            return f"{name}: {param_type}"
-    
-    def _resolve_ref(self, ref, schema):
-        """Resolve a $ref in a JSON schema."""
-        parts = ref.strip('#/').split('/')
-        resolved = schema
-        for part in parts:
-            resolved = resolved.get(part, {})
-        return resolved
+            step += 1
+            
+            # If we've reached max steps without a final answer
+            if step == self.max_steps:
+                final_result = f"Reached maximum number of steps ({self.max_steps}) without a final answer. Last result: {last_output}"
+        
+        return final_result or "Processing complete, but no final answer was produced."
 
 # Create a singleton instance
 agent_service = AgentService() 
\ No newline at end of file
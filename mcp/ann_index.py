@@ -0,0 +1,214 @@
+import math
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+from pydantic import BaseModel
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# How each backend deletes vectors: "remove" takes them out of the index at
+# once, "tombstone" hides them from search until vacuum() rebuilds the index
+REMOVAL_STRATEGIES = {"flat": "remove", "hnsw": "tombstone", "ivf_flat": "remove", "ivf_pq": "remove"}
+
+
+class IndexConfig(BaseModel):
+    """Which FAISS backend to use and its recall/latency knobs.
+
+    Every store starts as an exact IndexFlatL2 (wrapped in IndexIDMap2 so
+    chunks keep stable ids across rebuilds). Once it holds
+    `promote_threshold` vectors and `index_type` is not "flat", it is
+    retrained into the configured approximate index.
+
+    Chunk ids are stable on every backend, but deleting works differently
+    (REMOVAL_STRATEGIES): flat and HNSW are wrapped in IndexIDMap2, and
+    flat removes vectors through it. HNSW cannot remove, so deleted ids
+    are tombstoned until a vacuum. IVF stores the ids in its inverted
+    lists, with a hashtable direct map for lookups, and removes directly.
+    """
+    index_type: str = "flat"
+    promote_threshold: int = 50000
+    # HNSW
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    # IVF (nlist=0 picks ~4*sqrt(n) at training time)
+    nlist: int = 0
+    nprobe: int = 16
+    # PQ
+    pq_m: int = 16
+    pq_bits: int = 8
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        """Read FAISS_INDEX_TYPE, FAISS_PROMOTE_THRESHOLD, FAISS_NPROBE, ... from the environment"""
+        values = {}
+        for name, field in cls.model_fields.items():
+            raw = os.getenv(f"FAISS_{name.upper()}")
+            if raw is not None:
+                values[name] = raw if field.annotation is str else int(raw)
+        config = cls(**values)
+        if config.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type '{config.index_type}', expected one of {INDEX_TYPES}")
+        return config
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index wrapped by an IndexIDMap/IndexIDMap2, or the index itself"""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def is_flat(index: faiss.Index) -> bool:
+    return isinstance(base_index(index), faiss.IndexFlat)
+
+
+def is_id_mapped(index: faiss.Index) -> bool:
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """The INDEX_TYPES name of a live index"""
+    base = base_index(index)
+    if isinstance(base, faiss.IndexFlat):
+        return "flat"
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf_flat"
+    raise ValueError(f"Unsupported FAISS index {type(base).__name__}")
+
+
+def removal_strategy(index: faiss.Index) -> str:
+    """How deletes are applied to a live index, one of the REMOVAL_STRATEGIES values"""
+    return REMOVAL_STRATEGIES[index_type_of(index)]
+
+
+def ivf_of(index: faiss.Index) -> Optional[faiss.IndexIVF]:
+    """The IVF index inside `index`, or None for other backends"""
+    try:
+        return faiss.extract_index_ivf(base_index(index))
+    except RuntimeError:
+        return None
+
+
+def index_ids(index: faiss.Index) -> np.ndarray:
+    """Stable chunk ids stored in an index, in storage order"""
+    if is_id_mapped(index):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    # IVF: the ids are kept in the inverted lists
+    invlists = faiss.extract_index_ivf(index).invlists
+    lists = [
+        faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).astype(np.int64)
+        for list_no in range(invlists.nlist) if invlists.list_size(list_no)
+    ]
+    return np.concatenate(lists) if lists else np.zeros(0, dtype=np.int64)
+
+
+def unwrap_ivf(mapped: faiss.Index) -> Optional[faiss.IndexIVF]:
+    """Convert an IndexIDMap2-wrapped IVF snapshot into a plain IVF index.
+
+    Such snapshots store positions in the inverted lists and chunk ids in the
+    wrapper's id map; the positions are relabeled with the chunk ids. Returns
+    None if a removal already made the two disagree.
+    """
+    id_map = faiss.vector_to_array(mapped.id_map)
+    invlists = faiss.extract_index_ivf(mapped.index).invlists
+    relabeled = []
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            positions = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+            if positions.max() >= len(id_map):
+                return None
+            relabeled.append((positions, id_map[positions]))
+    for positions, ids in relabeled:
+        positions[:] = ids
+    ivf = faiss.clone_index(mapped.index)
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return ivf
+
+
+def empty_index(dim: int) -> faiss.Index:
+    """A new, empty ID-mapped exact index"""
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+
+def needs_promotion(index: Optional[faiss.Index], config: IndexConfig) -> bool:
+    """True if a flat index has grown past the threshold for an ANN backend"""
+    return (
+        index is not None
+        and config.index_type != "flat"
+        and is_flat(index)
+        and index.ntotal >= config.promote_threshold
+    )
+
+
+def _nlist_for(n: int, config: IndexConfig) -> int:
+    nlist = config.nlist or int(4 * math.sqrt(n))
+    # FAISS wants ~39 training points per centroid
+    return max(1, min(nlist, n // 39 or 1))
+
+
+def _pq_m_for(dim: int, config: IndexConfig) -> int:
+    m = min(config.pq_m, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_index(vectors: np.ndarray, ids: np.ndarray, config: IndexConfig) -> faiss.Index:
+    """Create, train and fill an index of `config.index_type` holding `ids`.
+
+    Flat and HNSW come wrapped in IndexIDMap2; IVF holds the ids itself.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    n, dim = vectors.shape
+
+    if config.index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif config.index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config.hnsw_m)
+        index.hnsw.efConstruction = config.ef_construction
+        index.hnsw.efSearch = config.ef_search
+    elif config.index_type == "ivf_flat":
+        nlist = _nlist_for(n, config)
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.nprobe = min(config.nprobe, nlist)
+    elif config.index_type == "ivf_pq":
+        nlist = _nlist_for(n, config)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, _pq_m_for(dim, config), config.pq_bits)
+        index.nprobe = min(config.nprobe, nlist)
+    else:
+        raise ValueError(f"Unknown FAISS index type '{config.index_type}'")
+
+    if not index.is_trained:
+        index.train(vectors)
+    if config.index_type in ("ivf_flat", "ivf_pq"):
+        # IVF stores the ids itself. Wrapping it in IndexIDMap2 breaks on
+        # removal: IVF keeps its internal ids while the wrapper compacts its
+        # id map, so the two disagree afterwards.
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.add_with_ids(vectors, ids)
+        return index
+    mapped = faiss.IndexIDMap2(index)
+    mapped.add_with_ids(vectors, ids)
+    return mapped
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Per-query search parameters, so one shared index can serve different trade-offs"""
+    base = base_index(index)
+    try:
+        ivf = faiss.extract_index_ivf(base)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None and nprobe:
+        return faiss.SearchParametersIVF(nprobe=min(int(nprobe), ivf.nlist))
+    if hasattr(base, "hnsw") and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
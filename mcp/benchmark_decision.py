@@ -0,0 +1,74 @@
+"""Compare agent step latency of the staged and fused decision modes.
+
+Needs GEMINI_API_KEY and a running server (`python mcp_server.py sse`),
+which provides the tool list and executes tool calls between steps:
+
+    python benchmark_decision.py --runs 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from action import execute_plan, format_results
+from memory import MemoryManager
+from session_pool import MCPSessionPool
+from step_pipeline import DECISION_MODES, format_timings, plan_step
+
+QUERIES = [
+    "What is 2 + 3?",
+    "Multiply 12 by 7 and then add 5",
+    "What is the factorial of 5?",
+    "Find the ASCII values of the characters in INDIA and return the sum of their exponentials",
+]
+
+
+async def run_query(session, catalog, query: str, mode: str, max_steps: int) -> list:
+    """Run one query in `mode`, returning the wall-clock ms of each decision step"""
+    memory = MemoryManager()
+    user_input, perception, step_ms = query, None, []
+    for _ in range(max_steps):
+        start = time.perf_counter()
+        step = await plan_step(user_input, memory, tool_descriptions=catalog.description,
+                               previous_perception=perception, mode=mode)
+        step_ms.append((time.perf_counter() - start) * 1000)
+        print(f"  [{mode}] {format_timings(step.timings)} -> {step.plan[:80]}")
+        if not step.plan.startswith(("FUNCTION_CALL:", "FUNCTION_CALLS:")):
+            break
+        perception = step.perception
+        try:
+            results = await execute_plan(session, catalog, step.plan)
+        except Exception:
+            break
+        user_input = f"Original task: {query}\nPrevious output: {format_results(results)}\nWhat should I do next?"
+    return step_ms
+
+
+async def main(url: str, runs: int, max_steps: int) -> None:
+    pool = MCPSessionPool(url, max_size=1)
+    results = {mode: [] for mode in DECISION_MODES}
+    try:
+        async with pool.session() as pooled:
+            for run in range(runs):
+                for query in QUERIES:
+                    print(f"Run {run + 1}: {query}")
+                    for mode in DECISION_MODES:
+                        results[mode].extend(await run_query(pooled.session, pooled.catalog, query, mode, max_steps))
+    finally:
+        await pool.close()
+
+    print(f"\n{'mode':<8} {'steps':>6} {'mean ms':>9} {'median ms':>10} {'p90 ms':>8}")
+    for mode, samples in results.items():
+        if not samples:
+            continue
+        p90 = sorted(samples)[int(0.9 * (len(samples) - 1))]
+        print(f"{mode:<8} {len(samples):>6} {statistics.mean(samples):>9.0f} {statistics.median(samples):>10.0f} {p90:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark staged vs fused agent decision steps")
+    parser.add_argument("--url", default="http://127.0.0.1:7172/sse", help="MCP server SSE endpoint")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions of the query set")
+    parser.add_argument("--max-steps", type=int, default=5, help="Step limit per query")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.runs, args.max_steps))
@@ -0,0 +1,245 @@
+"""Index a folder of documents (PDF, DOCX, HTML, ...) into the vector store.
+
+Conversion and chunking run in a process pool, one file per task, so a
+folder of thousands of documents uses every core; the task itself lives in
+doc_convert.py so the workers stay light. Converted files stream
+into an embedding thread that batches chunks across files while the pool
+keeps converting. Each file commits its chunks and content hash atomically,
+so an interrupted run resumes where it stopped; a checkpoint of file sizes
+and mtimes lets the next run skip unchanged files without reading them.
+
+Stop the server first (it keeps the index in memory), then:
+
+    python bulk_ingest.py documents/ --workers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import tqdm
+
+from ann_index import IndexConfig
+from chunker import MAX_TOKENS
+from doc_convert import convert_document
+from embedding_cache import EmbeddingCache
+from embeddings import EmbeddingClient
+from log_util import Logger, make_logger
+from vector_store import VectorStore
+
+OLLAMA_URL = "http://localhost:11434"
+EMBED_MODEL = "nomic-embed-text"
+ROOT = Path(__file__).parent.resolve()
+INDEX_CACHE = ROOT / "faiss_index"
+# Chunks embedded per request batch, collected across small files
+EMBED_BATCH_CHUNKS = 256
+# Converted files waiting for the embedder, per worker; bounds memory use
+QUEUE_PER_WORKER = 2
+# Seconds between checkpoint writes
+CHECKPOINT_INTERVAL = 5.0
+
+ingest_log = make_logger("ingest")
+
+
+def iter_documents(doc_dir: Path) -> Iterator[Path]:
+    """Every file under `doc_dir`, recursively, skipping hidden files and folders"""
+    for path in sorted(doc_dir.rglob("*")):
+        relative = path.relative_to(doc_dir)
+        if path.is_file() and not any(part.startswith(".") for part in relative.parts):
+            yield path
+
+
+class Checkpoint:
+    """Size, mtime and hash of every file handled, persisted as JSON.
+
+    A file whose size and mtime match its entry, and whose hash is still
+    the one in the store, is skipped without being read. Files that failed
+    are skipped until they change.
+    """
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._saved_at = time.monotonic()
+        # Recorded from both the pool loop and the embedding thread
+        self._lock = threading.Lock()
+        if path is not None and path.is_file():
+            try:
+                self.entries = json.loads(path.read_text())
+            except Exception as e:
+                ingest_log("WARN", f"Ignoring unreadable checkpoint {path}: {e}")
+
+    def is_current(self, key: str, path: Path, indexed_hash: Optional[str]) -> bool:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        stat = path.stat()
+        if (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            return False
+        return "error" in entry or entry.get("hash") == indexed_hash
+
+    def record(self, result: Dict[str, Any]) -> None:
+        entry = {k: result[k] for k in ("size", "mtime_ns", "hash", "error") if k in result}
+        with self._lock:
+            self.entries[result["key"]] = entry
+        if time.monotonic() - self._saved_at > CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            tmp_file = self.path.with_suffix(".tmp")
+            tmp_file.write_text(json.dumps(self.entries))
+            os.replace(tmp_file, self.path)
+            self._saved_at = time.monotonic()
+
+
+def _embed_and_store(pending: List[Dict[str, Any]], store: VectorStore, embedder: EmbeddingClient) -> int:
+    """Embed the chunks of several converted files in one call, then commit each file"""
+    texts = [item["chunk"] for result in pending for item in result["metadata"]]
+    vectors = embedder.embed_chunks(texts)
+    offset = 0
+    for result in pending:
+        count = len(result["metadata"])
+        store.add(vectors[offset:offset + count], result["metadata"],
+                  key=result["key"], content_hash=result["hash"], replace=True)
+        offset += count
+    return len(texts)
+
+
+def ingest_folder(doc_dir: Path, store: VectorStore, embedder: EmbeddingClient,
+                  workers: Optional[int] = None, checkpoint_path: Optional[Path] = None,
+                  max_tokens: int = MAX_TOKENS, show_progress: bool = False,
+                  log: Logger = ingest_log) -> Dict[str, Any]:
+    """Index every document under `doc_dir`; returns counts of what was done.
+
+    Files are keyed by their path relative to `doc_dir`. Changed files
+    replace their previous chunks.
+    """
+    doc_dir = Path(doc_dir)
+    workers = workers or os.cpu_count() or 1
+    checkpoint = Checkpoint(checkpoint_path)
+    report = {"files": 0, "indexed": 0, "unchanged": 0, "failed": 0, "chunks": 0}
+    # Updated from both the pool loop and the embedding thread
+    report_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def count(**deltas: int) -> None:
+        with report_lock:
+            for name, delta in deltas.items():
+                report[name] += delta
+
+    todo = []
+    for path in iter_documents(doc_dir):
+        key = path.relative_to(doc_dir).as_posix()
+        indexed_hash = store.indexed_hash(key)
+        count(files=1)
+        if checkpoint.is_current(key, path, indexed_hash):
+            count(unchanged=1)
+        else:
+            todo.append((path, key, indexed_hash))
+    log("INFO", f"{len(todo)} of {report['files']} files to check in {doc_dir} with {workers} workers")
+
+    converted: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=workers * QUEUE_PER_WORKER)
+    progress = tqdm.tqdm(total=len(todo), unit="file", disable=not show_progress)
+    errors: List[BaseException] = []
+
+    def embed_worker():
+        # Runs alongside conversion: takes whatever files are ready, up to a batch
+        done = False
+        while not done:
+            pending = [converted.get()]
+            while pending[-1] is not None and sum(len(r["metadata"]) for r in pending) < EMBED_BATCH_CHUNKS:
+                try:
+                    pending.append(converted.get_nowait())
+                except queue.Empty:
+                    break
+            if pending[-1] is None:
+                done = True
+                pending.pop()
+            if not pending or errors:
+                continue
+            try:
+                count(chunks=_embed_and_store(pending, store, embedder), indexed=len(pending))
+                for result in pending:
+                    checkpoint.record(result)
+            except BaseException as e:
+                # Usually the embedder being down: stop instead of failing every file
+                errors.append(e)
+            progress.update(len(pending))
+
+    embed_thread = threading.Thread(target=embed_worker, name="bulk-embed", daemon=True)
+    embed_thread.start()
+    # Spawned workers do not inherit the parent's threads and locks
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            tasks = iter(todo)
+            running = set()
+            while True:
+                # Keep a bounded number of files in flight
+                for path, key, indexed_hash in tasks:
+                    running.add(pool.submit(convert_document, str(path), key, indexed_hash, max_tokens))
+                    if len(running) >= workers * QUEUE_PER_WORKER:
+                        break
+                if not running or errors:
+                    break
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    if "error" in result:
+                        log("ERROR", f"Failed to process {result['key']}: {result['error']}")
+                        count(failed=1)
+                    elif result.get("unchanged"):
+                        count(unchanged=1)
+                    else:
+                        # Blocks while the embedder is behind, which pauses submission
+                        converted.put(result)
+                        continue
+                    checkpoint.record(result)
+                    progress.update(1)
+            for future in running:
+                future.cancel()
+    finally:
+        converted.put(None)
+        embed_thread.join()
+        progress.close()
+        checkpoint.save()
+
+    if errors:
+        raise errors[0]
+    if report["indexed"]:
+        store.compact()
+    report["seconds"] = round(time.perf_counter() - start, 2)
+    log("SUCCESS", f"Indexed {report['indexed']} files ({report['chunks']} chunks), "
+                   f"{report['unchanged']} unchanged, {report['failed']} failed in {report['seconds']}s")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index a folder of documents into the FAISS index")
+    parser.add_argument("folder", nargs="?", default=str(ROOT / "documents"), help="Folder to index, recursively")
+    parser.add_argument("--workers", type=int, default=None, help="Conversion processes (default: all cores)")
+    parser.add_argument("--index-dir", default=str(INDEX_CACHE), help="Index directory shared with the server")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and re-check every file")
+    args = parser.parse_args()
+
+    index_dir = Path(args.index_dir)
+    vector_store = VectorStore(index_dir, index_config=IndexConfig.from_env()).load()
+    embedder = EmbeddingClient(base_url=OLLAMA_URL, model=EMBED_MODEL,
+                               cache=EmbeddingCache(index_dir / "embedding_cache.db"))
+    checkpoint_file = index_dir / "bulk_ingest_checkpoint.json"
+    if args.restart and checkpoint_file.exists():
+        checkpoint_file.unlink()
+    try:
+        ingest_folder(Path(args.folder), vector_store, embedder, workers=args.workers,
+                      checkpoint_path=checkpoint_file, show_progress=True)
+    finally:
+        vector_store.close()
@@ -0,0 +1,234 @@
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+# Chunk size limit, about the size of the old 256-word windows
+MAX_TOKENS = 512
+# A heading only closes the current chunk once it holds this much text, so
+# runs of short sections share a chunk instead of costing one embedding each
+MIN_TOKENS = 256
+# Ollama runs nomic-embed-text with a 2048-token context and silently
+# truncates longer input, so no chunk may exceed it
+EMBED_TOKEN_LIMIT = 2048
+# Words of page text in an anchor snippet: enough to be unique on most pages
+ANCHOR_WORDS = 8
+
+LINE = re.compile(r"[^\n]*\n|[^\n]+$")
+HEADING = re.compile(r"^ {0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s")
+TABLE_ROW = re.compile(r"^\s*\|")
+SENTENCE_END = re.compile(r"(?<=[.!?:;])\s+|\n+")
+WORD_BREAK = re.compile(r"\s+")
+WORD = re.compile(r"\S+")
+# Markdown syntax that is not part of the rendered page text
+LINE_MARKER = re.compile(r"^\s*(?:#{1,6}\s+|>\s*|[-*+]\s+|\d+[.)]\s+)*")
+LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+EMPHASIS = re.compile(r"`+|\*+(?=\S)|(?<=\S)\*+")
+
+Span = Tuple[int, int]
+
+
+class Chunk(BaseModel):
+    text: str
+    # Character offsets of `text` in the markdown: markdown[start:end] == text
+    start: int
+    end: int
+    # Nearest heading above the chunk, if any
+    heading: Optional[str] = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Upper-bound-ish token count: ~4 characters per token, at least one per word"""
+    return max((len(text) + 3) // 4, len(WORD.findall(text)))
+
+
+def plain_line(line: str) -> str:
+    """Rendered text of one markdown line: no block markers, link targets or emphasis"""
+    if FENCE.match(line) or re.fullmatch(r"[\s|:-]*", line):
+        return ""
+    if TABLE_ROW.match(line) or " | " in line:
+        # Cells are separate elements on the page; use the first non-empty one
+        line = next((cell for cell in line.split("|") if cell.strip()), "")
+    line = LINK.sub(r"\1", LINE_MARKER.sub("", line))
+    return " ".join(EMPHASIS.sub("", line).split())
+
+
+def anchor_snippets(text: str, words: int = ANCHOR_WORDS) -> Tuple[Optional[str], Optional[str]]:
+    """Page text marking where a chunk starts and ends, for locating it in the page.
+
+    The start snippet is the first `words` words of the chunk's first text
+    line, the end snippet the last words of its last line (None if the start
+    snippet already covers the chunk). Each stays within one line, i.e. one
+    element on the page, as the Text Fragments API requires.
+    """
+    lines = [plain for plain in map(plain_line, text.splitlines()) if plain]
+    if not lines:
+        return None, None
+    first, last = lines[0].split(), lines[-1].split()
+    start = " ".join(first[:words])
+    if len(lines) == 1 and len(first) <= words:
+        return start, None
+    return start, " ".join(last[-words:])
+
+
+def _trim(text: str, start: int, end: int) -> Span:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def iter_blocks(text: str) -> Iterator[Tuple[str, int, int]]:
+    """Yield (kind, start, end) for each markdown block, in order.
+
+    Kinds are "heading", "text" (a paragraph), "list", "table" and "code"
+    (a fenced block). Blocks are separated by blank lines or a change of
+    kind; fenced code is kept whole even across blank lines. Lines are
+    scanned one at a time, so nothing but the current block is buffered.
+    """
+    kind, start, end, fence = None, 0, 0, None
+    for match in LINE.finditer(text):
+        line = match.group()
+        if fence is not None:
+            end = match.end()
+            if line.strip().startswith(fence):
+                yield (kind, *_trim(text, start, end))
+                kind = fence = None
+            continue
+        if not line.strip():
+            if kind:
+                yield (kind, *_trim(text, start, end))
+                kind = None
+            continue
+
+        fence_match = FENCE.match(line)
+        if fence_match or HEADING.match(line):
+            if kind:
+                yield (kind, *_trim(text, start, end))
+            if fence_match:
+                kind, fence, start, end = "code", fence_match.group(1), match.start(), match.end()
+            else:
+                kind = None
+                yield ("heading", *_trim(text, match.start(), match.end()))
+            continue
+
+        line_kind = "table" if TABLE_ROW.match(line) else "list" if LIST_ITEM.match(line) else "text"
+        # Unmarked lines under a list item are its continuation
+        if kind == line_kind or (kind == "list" and line_kind == "text"):
+            end = match.end()
+        else:
+            if kind:
+                yield (kind, *_trim(text, start, end))
+            kind, start, end = line_kind, match.start(), match.end()
+    if kind:
+        yield (kind, *_trim(text, start, end))
+
+
+def _pieces(text: str, start: int, end: int, pattern: re.Pattern) -> List[Span]:
+    """Split text[start:end] at the matches of `pattern`, dropping the separators"""
+    spans, pos = [], start
+    for match in pattern.finditer(text, start, end):
+        if match.start() > pos:
+            spans.append((pos, match.start()))
+        pos = match.end()
+    if pos < end:
+        spans.append((pos, end))
+    return spans
+
+
+def _split_block(text: str, start: int, end: int, max_tokens: int) -> Iterator[Span]:
+    """Split a block over the limit at sentence ends, then words, then characters"""
+    def pack(spans: List[Span], finer: Optional[re.Pattern]) -> Iterator[Span]:
+        current: Optional[Span] = None
+        words = 0
+        for span in spans:
+            span_tokens = estimate_tokens(text[span[0]:span[1]])
+            if span_tokens > max_tokens:
+                if current:
+                    yield current
+                    current = None
+                if finer is not None:
+                    yield from pack(_pieces(text, *span, finer), None if finer is WORD_BREAK else WORD_BREAK)
+                else:
+                    # A single "word" over the limit (e.g. an encoded blob)
+                    step = max_tokens * 4
+                    yield from ((i, min(i + step, span[1])) for i in range(span[0], span[1], step))
+                continue
+            if current:
+                # Same estimate as estimate_tokens, kept incrementally: re-counting
+                # the whole chunk for every piece would be quadratic
+                added = len(WORD.findall(text, current[1], span[1]))
+                if max((span[1] - current[0] + 3) // 4, words + added) > max_tokens:
+                    yield current
+                    current = None
+            if current:
+                current, words = (current[0], span[1]), words + added
+            else:
+                current, words = span, len(WORD.findall(text, *span))
+        if current:
+            yield current
+
+    yield from pack(_pieces(text, start, end, SENTENCE_END), WORD_BREAK)
+
+
+def chunk_markdown(text: str, max_tokens: int = MAX_TOKENS, min_tokens: int = MIN_TOKENS) -> Iterator[Chunk]:
+    """Lazily split markdown into chunks of whole blocks, without overlap.
+
+    Consecutive blocks are packed until the next would exceed `max_tokens`;
+    a heading starts a new chunk so sections are not mixed. Only a block
+    that is too large on its own is split, at sentence boundaries where
+    possible. Each chunk is an exact slice of `text` with its offsets.
+    """
+    if max_tokens > EMBED_TOKEN_LIMIT:
+        raise ValueError(f"max_tokens {max_tokens} exceeds the embedding model limit of {EMBED_TOKEN_LIMIT}")
+    heading: Optional[str] = None
+    chunk_heading: Optional[str] = None
+    start: Optional[int] = None
+    end = tokens = words = 0
+
+    def emit(span_start: int, span_end: int, span_heading: Optional[str]) -> Chunk:
+        return Chunk(text=text[span_start:span_end], start=span_start, end=span_end, heading=span_heading)
+
+    for kind, block_start, block_end in iter_blocks(text):
+        block_words = len(WORD.findall(text, block_start, block_end))
+        block_tokens = max((block_end - block_start + 3) // 4, block_words)
+        # estimate_tokens of the chunk with this block added, blank lines included
+        packed_tokens = max((block_end - start + 3) // 4, words + block_words) if start is not None else 0
+        if kind == "heading":
+            if start is not None and (tokens >= min_tokens or packed_tokens > max_tokens >= block_tokens):
+                yield emit(start, end, chunk_heading)
+                start = None
+            heading = HEADING.match(text[block_start:block_end]).group(2) or None
+        elif start is not None and packed_tokens > max_tokens >= block_tokens:
+            yield emit(start, end, chunk_heading)
+            start = None
+
+        if block_tokens > max_tokens:
+            if start is not None and tokens >= min_tokens:
+                yield emit(start, end, chunk_heading)
+                start = None
+            # A short pending chunk (e.g. just the heading) leads the first piece
+            split_start = block_start if start is None else start
+            start = None
+            for piece_start, piece_end in _split_block(text, split_start, block_end, max_tokens):
+                yield emit(piece_start, piece_end, heading)
+            continue
+
+        if start is None:
+            start, words, chunk_heading = block_start, 0, heading
+        end = block_end
+        words += block_words
+        tokens = max((end - start + 3) // 4, words)
+
+    if start is not None:
+        yield emit(start, end, chunk_heading)
+
+
+def chunk_location(chunk: Chunk) -> Dict[str, Any]:
+    """Metadata for finding a chunk again: offsets in the extracted text and page-text anchors"""
+    anchor, anchor_end = anchor_snippets(chunk.text)
+    return {"start": chunk.start, "end": chunk.end, "section": chunk.heading,
+            "anchor": anchor, "anchor_end": anchor_end}
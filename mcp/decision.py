@@ -1,12 +1,11 @@
 
-import os
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from llm import call_llm_with_timeout
+from pydantic import BaseModel
+from llm import call_llm_with_timeout, get_llm
 from memory import MemoryItem
 from perception import PerceptionResult
-from google import genai
 
 
 try:
@@ -19,22 +18,14 @@ except ImportError:
 
 load_dotenv()
 
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-
-
-async def generate_plan(
-    perception: PerceptionResult,
-    memory_items: List[MemoryItem],
-    tool_descriptions: Optional[str] = None
-) -> str:
-    """Generates a plan (tool call or final answer) using LLM based on structured perception and memory."""
 
+def _plan_prompt(input_summary: str, memory_items: List[MemoryItem], tool_descriptions: Optional[str]) -> str:
+    """Planning prompt shared by the staged and fused decision modes"""
     memory_texts = "\n".join(f"- {m.text}" for m in memory_items) or "None"
 
     tool_context = f"\nYou have access to the following tools:\n{tool_descriptions}" if tool_descriptions else ""
 
-    prompt = f"""
+    return f"""
 You are a reasoning-driven AI agent with access to tools. Your job is to solve the user's request step-by-step by reasoning through the problem, selecting a tool if needed, and continuing until the FINAL_ANSWER is produced.{tool_context}
 
 Always follow this loop:
@@ -45,6 +36,9 @@ Always follow this loop:
 4. Provide reasoning for intermediate steps whereever necessary.
 5. If a tool is needed, respond using the format:
    FUNCTION_CALL: {{"func_name":"function_name","param":{{"input":{{"param1":"value1", "param2":"value2"}}}}}}
+   If several tool calls are needed at once, batch them in one step instead, as a single line:
+   FUNCTION_CALLS: [{{"id":"c1","func_name":"factorial","param":{{"input":{{"a":3}}}}}}, {{"id":"c2","func_name":"factorial","param":{{"input":{{"a":4}}}}}}, {{"id":"c3","func_name":"add","param":{{"input":{{"a":"$c1","b":"$c2"}}}}}}]
+   "$c1" stands for the result of call c1. Calls that do not reference each other run in parallel.
 6. When the final answer is known, respond using:
    FINAL_ANSWER: [your final result]
 7. If uncertain or a tool fails, attempt a fallback approach and note it.
@@ -57,10 +51,7 @@ Guidelines:
 {memory_texts}
 
 Input Summary:
-- User input: "{perception.user_input}"
-- Objective: {perception.objective}
-- Objects: {', '.join(perception.objects)}
-- Tool hint: {perception.tool_hint or 'None'}
+{input_summary}
 
 ✅ Examples:
 Query: Solve (2 + 3) * 4
@@ -93,21 +84,106 @@ IMPORTANT:
 - ✅ You have only 3 attempts. Final attempt must be FINAL_ANSWER]
 """
 
+
+ACTION_PREFIXES = ("FUNCTION_CALL:", "FUNCTION_CALLS:", "FINAL_ANSWER:")
+
+
+def _first_action(raw: str) -> Optional[str]:
+    for line in raw.splitlines():
+        if line.strip().startswith(ACTION_PREFIXES):
+            return line.strip()
+    return None
+
+
+async def _stream_plan(prompt: str, on_answer: Callable[[str], None], timeout: float = 10) -> str:
+    """Stream the plan, passing FINAL_ANSWER text to `on_answer` as soon as it is generated"""
+    raw, sent = "", 0
+    async for text in get_llm().stream(prompt, timeout=timeout):
+        raw += text
+        action = _first_action(raw)
+        if action and action.startswith("FINAL_ANSWER:"):
+            answer = action[len("FINAL_ANSWER:"):].lstrip()
+            if len(answer) > sent:
+                on_answer(answer[sent:])
+                sent = len(answer)
+    return raw
+
+
+async def generate_plan(
+    perception: PerceptionResult,
+    memory_items: List[MemoryItem],
+    tool_descriptions: Optional[str] = None,
+    on_answer: Optional[Callable[[str], None]] = None
+) -> str:
+    """Generates a plan (tool call or final answer) using LLM based on structured perception and memory.
+
+    With `on_answer`, the response is streamed and a FINAL_ANSWER is passed on
+    piece by piece before the LLM has finished.
+    """
+
+    input_summary = f"""- User input: "{perception.user_input}"
+- Objective: {perception.objective}
+- Objects: {', '.join(perception.objects)}
+- Tool hint: {perception.tool_hint or 'None'}"""
+    prompt = _plan_prompt(input_summary, memory_items, tool_descriptions)
+
     try:
         # response = client.models.generate_content(
         #     model="gemini-2.0-flash",
         #     contents=prompt
         # )
-        response = await call_llm_with_timeout(client, prompt)
-        raw = response.text.strip()
+        if on_answer is None:
+            raw = (await call_llm_with_timeout(prompt)).text.strip()
+        else:
+            raw = (await _stream_plan(prompt, on_answer)).strip()
         log("plan", f"LLM output: {raw}")
 
-        for line in raw.splitlines():
-            if line.strip().startswith("FUNCTION_CALL:") or line.strip().startswith("FINAL_ANSWER:"):
-                return line.strip()
-
-        return raw.strip()
+        return _first_action(raw) or raw
 
     except Exception as e:
         log("plan", f"⚠️ Decision generation failed: {e}")
-        return "FINAL_ANSWER: [unknown]"
\ No newline at end of file
+        return "FINAL_ANSWER: [unknown]"
+
+
+class FusedDecision(BaseModel):
+    """Structured output of the fused mode: perception fields plus the next action"""
+    # No defaults: the Gemini API rejects `default` in response schemas
+    objective: Optional[str]
+    objects: List[str]
+    tool_hint: Optional[str]
+    action: str
+
+
+async def generate_fused_decision(
+    user_input: str,
+    memory_items: List[MemoryItem],
+    tool_descriptions: Optional[str] = None
+) -> Tuple[PerceptionResult, str]:
+    """Extracts perception and plans the next action in a single structured-output LLM call."""
+
+    prompt = _plan_prompt(f'- User input: "{user_input}"', memory_items, tool_descriptions) + """
+Respond with a JSON object with these keys:
+- "objective": a short string summarizing the user's goal
+- "objects": a list of strings with the keywords, values or facts in the input
+- "tool_hint": the name of the tool that helps most, or null
+- "action": the single FUNCTION_CALL: {...}, FUNCTION_CALLS: [...] or FINAL_ANSWER: [...] line for this step, following the rules above
+"""
+
+    try:
+        response = await call_llm_with_timeout(prompt, config={
+            "response_mime_type": "application/json",
+            "response_schema": FusedDecision,
+        })
+        log("plan", f"LLM output: {response.text.strip()}")
+        decision = FusedDecision.model_validate_json(response.text)
+        perception = PerceptionResult(
+            user_input=user_input,
+            objective=decision.objective,
+            objects=decision.objects,
+            tool_hint=decision.tool_hint,
+        )
+        return perception, decision.action.strip()
+
+    except Exception as e:
+        log("plan", f"⚠️ Fused decision failed: {e}")
+        return PerceptionResult(user_input=user_input, objective=None, objects=[], tool_hint=None), "FINAL_ANSWER: [unknown]"
@@ -0,0 +1,54 @@
+"""Worker side of bulk ingestion: hash, convert and chunk one document.
+
+Kept apart from bulk_ingest so that process-pool workers only import this
+module, the chunker and (on first use) MarkItDown; FAISS, the vector store
+and the embedding client stay in the parent process.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from chunker import MAX_TOKENS, chunk_location, chunk_markdown
+
+
+def file_hash(path: Path) -> str:
+    """MD5 of a file, read in blocks so large PDFs are not loaded whole"""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_converter = None
+
+
+def convert_document(path: str, key: str, known_hash: Optional[str], max_tokens: int = MAX_TOKENS) -> Dict[str, Any]:
+    """Worker task: hash, convert and chunk one file.
+
+    Returns the file's hash and stat, plus its chunk metadata unless the hash
+    equals `known_hash` (already indexed). Errors are returned, not raised,
+    so one bad file cannot stop the pool.
+    """
+    global _converter
+    stat = os.stat(path)
+    result = {"key": key, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        result["hash"] = file_hash(Path(path))
+        if result["hash"] == known_hash:
+            result["unchanged"] = True
+            return result
+        if _converter is None:
+            # Imported per worker process; MarkItDown is slow to load
+            from markitdown import MarkItDown
+            _converter = MarkItDown()
+        markdown = _converter.convert(path).text_content
+        stem = Path(key).with_suffix("").as_posix()
+        result["metadata"] = [
+            {"doc": key, "chunk": chunk.text, "chunk_id": f"{stem}_{i}", **chunk_location(chunk)}
+            for i, chunk in enumerate(chunk_markdown(markdown, max_tokens=max_tokens))
+        ]
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
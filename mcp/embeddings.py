@@ -0,0 +1,181 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from embedding_cache import EmbeddingCache, cache_key
+from log_util import make_logger
+
+# Seconds before retrying the batch endpoint after it was found missing
+BATCH_REPROBE_SECONDS = 600.0
+
+
+embed_log = make_logger("embed")
+
+
+class EmbeddingStats:
+    """Running counters used to report embedding throughput"""
+
+    def __init__(self):
+        self.texts = 0
+        self.requests = 0
+        self.seconds = 0.0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def record(self, texts: int, requests_made: int, seconds: float) -> None:
+        with self._lock:
+            self.texts += texts
+            self.requests += requests_made
+            self.seconds += seconds
+
+    def record_hits(self, hits: int) -> None:
+        with self._lock:
+            self.cache_hits += hits
+
+    @property
+    def throughput(self) -> float:
+        """Embedded texts per second of wall-clock embedding time"""
+        return self.texts / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "texts": self.texts,
+            "requests": self.requests,
+            "seconds": round(self.seconds, 3),
+            "texts_per_second": round(self.throughput, 2),
+            "cache_hits": self.cache_hits,
+        }
+
+
+class EmbeddingClient:
+    """Ollama embedding client with a pooled connection and batched requests.
+
+    Batches go to the batch-capable `/api/embed` endpoint. Older Ollama builds
+    only have `/api/embeddings` (one prompt per call); for those the client
+    falls back to a bounded number of concurrent single-text requests, and
+    checks again every `BATCH_REPROBE_SECONDS` in case the server was upgraded.
+
+    With a `cache`, `embed_chunks` only sends texts whose normalized content
+    has not been embedded by this model before.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "nomic-embed-text",
+                 batch_size: int = 64, max_concurrency: int = 8, timeout: float = 60,
+                 cache: Optional[EmbeddingCache] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.stats = EmbeddingStats()
+
+        # One keep-alive session shared by every thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        # Until when to skip the batch endpoint after finding it missing
+        self._batch_unsupported_until = 0.0
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single text"""
+        return self.embed_batch([text])[0]
+
+    def embed_chunks(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed document chunks, reusing cached embeddings of identical content"""
+        if self.cache is None or not texts:
+            return self.embed_batch(texts)
+
+        keys = [cache_key(self.model, t) for t in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once, even if it repeats in the page
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.stats.record_hits(len(texts) - len(missing))
+
+        if missing:
+            fresh = dict(zip(missing.keys(), self.embed_batch(list(missing.values()))))
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+            embed_log("INFO", f"{len(texts) - len(missing)}/{len(texts)} chunks served from embedding cache")
+        return [cached[key] for key in keys]
+
+    def embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts in order, using as few round trips as the server allows"""
+        if not texts:
+            return []
+
+        start = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+        if time.monotonic() >= self._batch_unsupported_until:
+            try:
+                embeddings = self._embed_batches(batches)
+                self._record(len(texts), len(batches), start)
+                return embeddings
+            except _BatchUnsupported:
+                embed_log("WARN", "Batch embed endpoint unavailable, falling back to concurrent requests")
+                self._batch_unsupported_until = time.monotonic() + BATCH_REPROBE_SECONDS
+
+        embeddings = list(self._executor.map(self._embed_single, texts))
+        self._record(len(texts), len(texts), start)
+        return embeddings
+
+    def _embed_batches(self, batches: List[List[str]]) -> List[np.ndarray]:
+        if len(batches) == 1:
+            return self._post_batch(batches[0])
+        results = []
+        for batch_embeddings in self._executor.map(self._post_batch, batches):
+            results.extend(batch_embeddings)
+        return results
+
+    def _post_batch(self, batch: List[str]) -> List[np.ndarray]:
+        response = self.session.post(
+            f"{self.base_url}/api/embed",
+            json={"model": self.model, "input": batch},
+            timeout=self.timeout,
+        )
+        if response.status_code in (404, 405):
+            # Ollama answers API errors such as an unknown model with a JSON
+            # body; a server without the endpoint has no route and no JSON
+            try:
+                error = response.json().get("error")
+            except ValueError:
+                error = None
+            if not error:
+                raise _BatchUnsupported()
+            raise requests.HTTPError(f"{response.status_code} error from {response.url}: {error}", response=response)
+        response.raise_for_status()
+        vectors = response.json()["embeddings"]
+        return [np.array(v, dtype=np.float32) for v in vectors]
+
+    def _embed_single(self, text: str) -> np.ndarray:
+        response = self.session.post(
+            f"{self.base_url}/api/embeddings",
+            json={"model": self.model, "prompt": text},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return np.array(response.json()["embedding"], dtype=np.float32)
+
+    def _record(self, texts: int, requests_made: int, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        self.stats.record(texts, requests_made, elapsed)
+        if texts > 1:
+            rate = texts / elapsed if elapsed else 0.0
+            embed_log("INFO", f"{texts} texts in {requests_made} requests, {elapsed:.2f}s ({rate:.1f} texts/s)")
+
+
+class _BatchUnsupported(Exception):
+    pass
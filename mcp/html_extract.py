@@ -0,0 +1,193 @@
+import html
+import io
+import re
+from html.parser import HTMLParser
+
+from markitdown import MarkItDown, StreamInfo
+
+# Elements whose content is never page text
+SKIP_TAGS = {"head", "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"}
+# Page chrome that repeats across a site and only adds noise to the index
+# (No <form>: ASP.NET WebForms pages wrap the whole body in one)
+BOILERPLATE_TAGS = {"nav", "footer", "aside", "button", "select", "dialog"}
+# Site headers are chrome, but a <header> inside these holds e.g. the post title
+CONTENT_TAGS = {"main", "article"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "menu", "dialog"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "main", "ol", "p", "pre", "section", "table", "tbody", "thead", "tfoot", "tr", "ul",
+}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+
+class _BoilerplateFilter(HTMLParser):
+    """HTMLParser that tracks whether we are inside a skipped element.
+
+    Skipping is tracked per tag name so unclosed <p>/<li> tags inside a
+    skipped region cannot leave the parser stuck in skip mode.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._skip_tag = None
+        self._skip_depth = 0
+        self._content_depth = 0
+
+    @property
+    def skipping(self) -> bool:
+        return self._skip_tag is not None
+
+    def _enter(self, tag, attrs) -> bool:
+        """Returns True if this start tag should be emitted"""
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return False
+        if tag in VOID_TAGS:
+            return True
+        attr_map = dict(attrs)
+        if (
+            tag in SKIP_TAGS
+            or tag in BOILERPLATE_TAGS
+            or (tag == "header" and self._content_depth == 0)
+            or (attr_map.get("role") or "").lower() in BOILERPLATE_ROLES
+            or "hidden" in attr_map
+            or (attr_map.get("aria-hidden") or "").lower() == "true"
+        ):
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return False
+        if tag in CONTENT_TAGS:
+            self._content_depth += 1
+        return True
+
+    def _leave(self, tag) -> bool:
+        """Returns True if this end tag should be emitted"""
+        if self._skip_tag is None:
+            if tag in CONTENT_TAGS and self._content_depth:
+                self._content_depth -= 1
+            return True
+        if tag == self._skip_tag:
+            self._skip_depth -= 1
+            if self._skip_depth == 0:
+                self._skip_tag = None
+        return False
+
+
+class _TextExtractor(_BoilerplateFilter):
+    """Turns HTML into lightweight markdown: headings, list items and paragraphs"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._pre = 0
+
+    def handle_starttag(self, tag, attrs):
+        if not self._enter(tag, attrs):
+            return
+        if tag in HEADING_TAGS:
+            self.parts.append("\n\n" + "#" * HEADING_TAGS[tag] + " ")
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag in ("td", "th"):
+            if self.parts and not self.parts[-1].endswith("\n"):
+                self.parts.append(" | ")
+        elif tag in BLOCK_TAGS or tag == "hr":
+            self.parts.append("\n\n")
+        if tag == "pre":
+            self._pre += 1
+
+    def handle_endtag(self, tag):
+        if not self._leave(tag):
+            return
+        if tag in HEADING_TAGS or tag in BLOCK_TAGS:
+            self.parts.append("\n\n")
+        if tag == "pre" and self._pre:
+            self._pre -= 1
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        if self._pre:
+            self.parts.append(data)
+        else:
+            self.parts.append(re.sub(r"\s+", " ", data))
+
+    def text(self) -> str:
+        raw = "".join(self.parts)
+        lines = [line.strip() for line in raw.split("\n")]
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+class _HtmlCleaner(_BoilerplateFilter):
+    """Re-serializes HTML with scripts, styles and page chrome removed"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if self._enter(tag, attrs):
+            self.parts.append(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.skipping:
+            self.parts.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self._leave(tag):
+            self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(html.escape(data, quote=False))
+
+    def handle_decl(self, decl):
+        self.parts.append(f"<!{decl}>")
+
+
+def extract_text(html_content: str) -> str:
+    """Fast HTML-to-text: strips scripts, styles and boilerplate, keeps block structure"""
+    parser = _TextExtractor()
+    parser.feed(html_content)
+    parser.close()
+    return parser.text()
+
+
+def clean_html(html_content: str) -> str:
+    """Return the HTML with scripts, styles and boilerplate elements removed"""
+    parser = _HtmlCleaner()
+    parser.feed(html_content)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def html_to_markdown(html_content: str, url: str = None, converter: MarkItDown = None) -> str:
+    """Convert submitted HTML to markdown with MarkItDown, fully in memory"""
+    converter = converter or MarkItDown()
+    stream = io.BytesIO(clean_html(html_content).encode("utf-8"))
+    result = converter.convert_stream(
+        stream,
+        stream_info=StreamInfo(extension=".html", mimetype="text/html", charset="utf-8", url=url),
+    )
+    return result.text_content
+
+
+def extract_page_text(html_content: str, url: str = None, mode: str = "fast") -> str:
+    """Extract indexable text from page HTML.
+
+    mode="fast" uses the built-in extractor; mode="markitdown" runs the cleaned
+    HTML through MarkItDown and falls back to the fast extractor on failure.
+    """
+    if mode == "markitdown":
+        try:
+            return html_to_markdown(html_content, url=url)
+        except Exception:
+            pass
+    return extract_text(html_content)
@@ -0,0 +1,144 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from log_util import make_logger
+
+
+job_log = make_logger("jobs")
+
+
+class IngestJob(BaseModel):
+    job_id: str
+    url: str
+    title: str = ""
+    status: str = "queued"  # queued | running | done | error
+    stage: str = "queued"
+    progress: float = 0.0
+    chunks: int = 0
+    message: str = ""
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+# worker(url, title, html, progress) -> number of chunks indexed
+IngestWorker = Callable[[str, str, str, Callable[[str, float], None]], int]
+
+
+class IngestJobQueue:
+    """Runs page ingestion on a worker pool so request handlers return at once.
+
+    Jobs are kept in memory (most recent `max_history`) so clients can poll
+    their status. A URL is indexed by one job at a time: submitting it again
+    while its job is still queued updates that job's HTML; while it is
+    running, one follow-up job is queued with the latest HTML and started
+    when the running one finishes.
+    """
+
+    def __init__(self, worker: IngestWorker, max_workers: int = 2, max_history: int = 200):
+        self.worker = worker
+        self.max_history = max_history
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._active_by_url: Dict[str, str] = {}
+        self._follow_up_by_url: Dict[str, str] = {}
+        # Latest (title, html) of jobs that have not started yet
+        self._inputs: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+
+    def submit(self, url: str, title: str, html: str) -> IngestJob:
+        with self._lock:
+            active_id = self._active_by_url.get(url)
+            if active_id is not None:
+                # Not started yet: it will index this HTML instead
+                pending_id = active_id if self.jobs[active_id].status == "queued" else self._follow_up_by_url.get(url)
+                if pending_id is not None:
+                    self._inputs[pending_id] = (title, html)
+                    self.jobs[pending_id].title = title
+                    return self.jobs[pending_id].model_copy()
+
+            job = IngestJob(job_id=uuid.uuid4().hex, url=url, title=title, created_at=time.time())
+            self.jobs[job.job_id] = job
+            self._inputs[job.job_id] = (title, html)
+            if active_id is not None:
+                # Started by the running job once it finishes
+                self._follow_up_by_url[url] = job.job_id
+            else:
+                self._active_by_url[url] = job.job_id
+            self._trim()
+
+        if active_id is None:
+            self._start(job.job_id, url)
+        return job.model_copy()
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return job.model_copy() if job else None
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _start(self, job_id: str, url: str) -> None:
+        try:
+            self._executor.submit(self._run, job_id, url)
+        except RuntimeError as e:
+            # The executor is shut down
+            with self._lock:
+                self._inputs.pop(job_id, None)
+                if self._active_by_url.get(url) == job_id:
+                    del self._active_by_url[url]
+            self._update(job_id, status="error", stage="error", message=f"Error processing page: {str(e)}")
+
+    def _run(self, job_id: str, url: str) -> None:
+        with self._lock:
+            # Marked running under the same lock so submit() cannot update the input after this
+            title, html = self._inputs.pop(job_id)
+            job = self.jobs[job_id]
+            job.status, job.stage, job.started_at = "running", "starting", time.time()
+
+        def progress(stage: str, fraction: float) -> None:
+            self._update(job_id, stage=stage, progress=round(min(max(fraction, 0.0), 1.0), 3))
+
+        try:
+            chunks = self.worker(url, title, html, progress)
+            message = f"Page added successfully! Processed {chunks} chunks." if chunks else "Page already indexed, nothing to update."
+            self._update(job_id, status="done", stage="done", progress=1.0, chunks=chunks, message=message)
+        except Exception as e:
+            job_log("ERROR", f"Ingest job {job_id} for {url} failed: {e}")
+            self._update(job_id, status="error", stage="error", message=f"Error processing page: {str(e)}")
+        finally:
+            with self._lock:
+                follow_up_id = self._follow_up_by_url.pop(url, None)
+                if follow_up_id is not None:
+                    self._active_by_url[url] = follow_up_id
+                elif self._active_by_url.get(url) == job_id:
+                    del self._active_by_url[url]
+            if follow_up_id is not None:
+                self._start(follow_up_id, url)
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            for name, value in fields.items():
+                setattr(job, name, value)
+            if fields.get("status") in ("done", "error"):
+                job.finished_at = time.time()
+
+    def _trim(self) -> None:
+        # Drop the oldest finished jobs once history is full
+        while len(self.jobs) > self.max_history:
+            for job_id, job in self.jobs.items():
+                if job.status in ("done", "error"):
+                    del self.jobs[job_id]
+                    break
+            else:
+                return
@@ -1,8 +1,15 @@
 # Load environment variables from .env file
 import asyncio
+import json
 import os
+import random
+import re
+import time
+from typing import AsyncIterator, Optional
+
 from dotenv import load_dotenv
 from google import genai
+from google.genai import errors
 
 try:
     from agent import log
@@ -15,31 +22,169 @@ except ImportError:
 
 load_dotenv()
 
-# Access your API key and initialize Gemini client correctly
-# api_key = os.getenv("GEMINI_API_KEY")
-# client = genai.Client(api_key=api_key)
+MODEL = "gemini-2.0-flash"
+# "gemini", or "mock" for offline runs and benchmarks
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Simulated per-call latency of the mock backend, in seconds
+LLM_MOCK_LATENCY = float(os.getenv("LLM_MOCK_LATENCY", "0.2"))
+
+# HTTP status codes worth another attempt: rate limiting and transient server errors
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+
+class MockResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class MockBackend:
+    """Answers like the agent's prompts expect, after a fixed delay, without network access"""
+
+    def __init__(self, latency: float = LLM_MOCK_LATENCY):
+        self.latency = latency
+
+    def reply(self, prompt: str, config=None) -> str:
+        if config and (config.get("response_schema") if isinstance(config, dict) else getattr(config, "response_schema", None)):
+            return json.dumps({"objective": "answer the query", "objects": [], "tool_hint": None,
+                               "action": "FINAL_ANSWER: [mock]"})
+        if "extracts structured facts" in prompt:
+            match = re.search(r'Input: "(.*?)"', prompt, re.DOTALL)
+            objects = re.findall(r"\w+", match.group(1))[:5] if match else []
+            return str({"objective": "answer the query", "objects": objects, "tool_hint": None})
+        return "FINAL_ANSWER: [mock]"
+
+    async def generate(self, prompt: str, config=None) -> MockResponse:
+        await asyncio.sleep(self.latency)
+        return MockResponse(self.reply(prompt, config))
+
+    async def stream(self, prompt: str, config=None) -> AsyncIterator[MockResponse]:
+        text = self.reply(prompt, config)
+        chunks = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield MockResponse(chunk)
+
+
+class GeminiBackend:
+    def __init__(self, api_key: Optional[str] = None, model: str = MODEL):
+        self.client = genai.Client(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self.model = model
+
+    async def generate(self, prompt: str, config=None):
+        return await self.client.aio.models.generate_content(model=self.model, contents=prompt, config=config)
+
+    async def stream(self, prompt: str, config=None):
+        async for chunk in await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=prompt, config=config
+        ):
+            yield chunk
+
+
+class LLMClient:
+    """Shared async LLM client used by perception, decision and the agent loops.
 
-async def call_llm_with_timeout(client, prompt, timeout=10):
-    """Generate content using llm with a timeout"""
+    Calls go through the backend's native async API, so a timeout cancels the
+    request itself instead of leaving a worker thread running. At most
+    `max_concurrency` calls are in flight; rate-limit and transient server
+    errors are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, backend=None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = 2, backoff: float = 0.5):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    def _get_backend(self):
+        # Created on first use so importing this module needs no API key
+        if self.backend is None:
+            self.backend = MockBackend() if LLM_BACKEND == "mock" else GeminiBackend()
+            log("llm", f"Using {type(self.backend).__name__}")
+        return self.backend
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # A semaphore is bound to one event loop; scripts may run several
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def generate(self, prompt: str, timeout: float = 10, config=None):
+        """Generate a full response (with `.text`), retrying transient errors"""
+        backend = self._get_backend()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._get_semaphore():
+                    start = time.perf_counter()
+                    response = await asyncio.wait_for(backend.generate(prompt, config), timeout=timeout)
+                    log("llm", f"LLM generation completed in {time.perf_counter() - start:.2f}s")
+                    return response
+            except asyncio.TimeoutError:
+                log("llm", "LLM generation timed out!")
+                raise
+            except errors.APIError as e:
+                if e.code not in RETRYABLE_CODES or attempt == self.max_retries:
+                    log("llm", f"Error in LLM generation: {e}")
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                log("llm", f"LLM error {e.code}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def stream(self, prompt: str, timeout: float = 30, config=None) -> AsyncIterator[str]:
+        """Yield response text as it is generated; `timeout` bounds the whole stream"""
+        backend = self._get_backend()
+        async with self._get_semaphore():
+            deadline = time.monotonic() + timeout
+            chunks = backend.stream(prompt, config).__aiter__()
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        log("llm", "LLM stream timed out!")
+                        raise asyncio.TimeoutError()
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining)
+                    except StopAsyncIteration:
+                        return
+                    if chunk.text:
+                        yield chunk.text
+            finally:
+                # Closes the underlying HTTP stream if the consumer stopped early
+                await chunks.aclose()
+
+
+_llm: Optional[LLMClient] = None
+
+
+def get_llm() -> LLMClient:
+    global _llm
+    if _llm is None:
+        _llm = LLMClient()
+    return _llm
+
+
+async def call_llm_with_timeout(prompt, timeout=10, config=None):
+    """Generate content using llm with a timeout (config: optional GenerateContentConfig, e.g. a response schema)"""
     log("llm", "Starting LLM generation...")
-    try:
-        # Convert the synchronous generate_content call to run in a thread
-        loop = asyncio.get_event_loop()
-        response = await asyncio.wait_for(
-            loop.run_in_executor(
-                None, 
-                lambda: client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=prompt
-                )
-            ),
-            timeout=timeout
-        )
-        log("llm", "LLM generation completed")
-        return response
-    except TimeoutError:
-        log("llm", "LLM generation timed out!")
-        raise
-    except Exception as e:
-        log("llm", f"Error in LLM generation: {e}")
-        raise
\ No newline at end of file
+    return await get_llm().generate(prompt, timeout=timeout, config=config)
+
+
+if __name__ == "__main__":
+    # Concurrency benchmark, e.g. offline: LLM_BACKEND=mock python llm.py 50
+    import sys
+
+    async def bench(n: int) -> None:
+        llm = get_llm()
+        start = time.perf_counter()
+        await asyncio.gather(*(llm.generate(f'Input: "query {i}"') for i in range(n)))
+        elapsed = time.perf_counter() - start
+        print(f"{n} calls in {elapsed:.2f}s ({n / elapsed:.1f} calls/s, max {llm.max_concurrency} in flight)")
+        streamed = [chunk async for chunk in llm.stream("stream test")]
+        print(f"Streamed {len(streamed)} chunks: {''.join(streamed)}")
+
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
@@ -0,0 +1,172 @@
+import ast
+import asyncio
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from tool_catalog import ToolCatalog
+
+try:
+    from agent import log
+except ImportError:
+    import datetime
+    def log(stage: str, msg: str):
+        now = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{now}] [{stage}] {msg}")
+
+
+# Answer plain arithmetic queries with the calculator tools, without the LLM
+ENABLED = True
+
+BINARY_TOOLS = {
+    ast.Add: "add",
+    ast.Sub: "subtract",
+    ast.Mult: "multiply",
+    ast.Div: "divide",
+    ast.Pow: "power",
+    ast.Mod: "remainder",
+}
+UNARY_TOOLS = {"sqrt", "cbrt", "factorial", "log", "sin", "cos", "tan"}
+
+# Leading phrases that may wrap an expression: "what is (2+3)*4?"
+QUERY_PREFIX = re.compile(
+    r"^\s*(?:please\s+)?(?:what\s+is|what's|calculate|compute|evaluate|solve|find)?\s*(?:the\s+value\s+of\s+)?",
+    re.IGNORECASE,
+)
+ALLOWED = re.compile(r"^[\d\s.+\-*/%^()!,×÷a-z]+$")
+# Dates, phone numbers, ISBNs and other ids: 3+ digit groups joined by - or /
+IDENTIFIER_SHAPE = re.compile(r"\d+(?:[-/]\d+){2,}")
+# "10-3" or "3/4" without spaces may be a range, score or fraction, not a request
+BARE_DASH_OR_SLASH = re.compile(r"^\d+[-/]\d+$")
+MAX_NODES = 50
+MAX_POWER = 1000
+MAX_FACTORIAL = 1000
+
+Number = Union[int, float]
+ToolCaller = Callable[[str, Dict[str, Any]], Awaitable[Number]]
+
+
+class Unplannable(Exception):
+    """The query is not an expression this planner can evaluate with the tools"""
+
+
+def extract_expression(query: str) -> Optional[str]:
+    """The arithmetic expression a query consists of, or None.
+
+    Identifier-shaped input ("2024-10-18", "555-123-4567") is never treated
+    as arithmetic, and a bare "a-b" or "a/b" only with an explicit prefix
+    such as "what is" or "calculate".
+    """
+    query = query.strip()
+    prefix = QUERY_PREFIX.match(query)
+    explicit = bool(prefix.group().strip())
+    text = query[prefix.end():].strip().rstrip("?.= ").strip()
+    if not text or not ALLOWED.match(text.lower()) or IDENTIFIER_SHAPE.search(text):
+        return None
+    if not explicit and BARE_DASH_OR_SLASH.match(text):
+        return None
+    text = text.replace("×", "*").replace("÷", "/").replace("^", "**")
+    text = re.sub(r"(\d+)\s*!", r"factorial(\1)", text)
+    # Needs at least one operator or function, not just a number
+    if not re.search(r"[+\-*/%]|[a-z]\(", text):
+        return None
+    return text
+
+
+def parse_expression(expression: str) -> ast.expr:
+    """Parse and check that only numbers, supported operators and tool functions are used"""
+    try:
+        tree = ast.parse(expression, mode="eval").body
+    except SyntaxError as e:
+        raise Unplannable(f"not an expression: {e}")
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_NODES:
+        raise Unplannable("expression too large")
+    function_names = {id(node.func) for node in nodes if isinstance(node, ast.Call)}
+    for node in nodes:
+        if isinstance(node, ast.Name):
+            if id(node) not in function_names:
+                raise Unplannable(f"unknown name '{node.id}'")
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in BINARY_TOOLS:
+                raise Unplannable(f"unsupported operator {type(node.op).__name__}")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in UNARY_TOOLS or len(node.args) != 1 or node.keywords:
+                raise Unplannable("unsupported function call")
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.USub, ast.UAdd)):
+                raise Unplannable("unsupported unary operator")
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                raise Unplannable("non-numeric constant")
+        elif not isinstance(node, (ast.Load, ast.operator, ast.unaryop)):
+            raise Unplannable(f"unsupported syntax {type(node).__name__}")
+    return tree
+
+
+def _as_int(value: Number) -> int:
+    # The calculator tools take integer inputs
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise Unplannable(f"non-integer operand {value}")
+        return int(value)
+    return value
+
+
+async def evaluate(node: ast.expr, call: ToolCaller) -> Number:
+    """Evaluate the tree bottom-up; independent operands are computed concurrently"""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp):
+        value = await evaluate(node.operand, call)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.Call):
+        value = _as_int(await evaluate(node.args[0], call))
+        if node.func.id == "factorial" and not 0 <= value <= MAX_FACTORIAL:
+            raise Unplannable("factorial argument out of range")
+        return await call(node.func.id, {"a": value})
+
+    left, right = await asyncio.gather(evaluate(node.left, call), evaluate(node.right, call))
+    a, b = _as_int(left), _as_int(right)
+    tool = BINARY_TOOLS[type(node.op)]
+    if tool == "power" and not 0 <= b <= MAX_POWER:
+        raise Unplannable("exponent out of range")
+    return await call(tool, {"a": a, "b": b})
+
+
+def _tool_caller(session, catalog: ToolCatalog) -> ToolCaller:
+    async def call(tool_name: str, arguments: Dict[str, Any]) -> Number:
+        if catalog.get(tool_name) is None:
+            raise Unplannable(f"tool '{tool_name}' is not registered")
+        result = await session.call_tool(tool_name, arguments={"input": arguments})
+        text = getattr(result.content[0], "text", "") if result.content else ""
+        if getattr(result, "isError", False):
+            raise Unplannable(f"{tool_name} failed: {text}")
+        return json.loads(text)["result"]
+    return call
+
+
+def format_number(value: Number) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+async def plan_locally(query: str, session, catalog: ToolCatalog) -> Optional[str]:
+    """FINAL_ANSWER for a pure arithmetic query computed with the tools, or None to use the LLM.
+
+    `session` is anything with an MCP-style `call_tool` (ClientSession or
+    LocalToolSession).
+    """
+    if not ENABLED:
+        return None
+    expression = extract_expression(query)
+    if expression is None:
+        return None
+    try:
+        value = await evaluate(parse_expression(expression), _tool_caller(session, catalog))
+    except Exception as e:
+        log("planner", f"Falling back to LLM for '{expression}': {e}")
+        return None
+    log("planner", f"Evaluated '{expression}' locally = {value}")
+    return f"FINAL_ANSWER: [{format_number(value)}]"
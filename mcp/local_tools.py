@@ -0,0 +1,40 @@
+from typing import Any, Dict, Optional
+
+from mcp import types
+from mcp.server.fastmcp import FastMCP
+
+from tool_catalog import ToolCatalog, get_catalog
+
+
+class LocalToolSession:
+    """Calls the tools of a FastMCP server in the same process.
+
+    Exposes the part of ClientSession the agent uses (`call_tool`,
+    `list_tools`, `send_ping`) and returns the same result types, so
+    `execute_tool` and `ToolCallResult` work unchanged. Tool errors are
+    wrapped the way the MCP server does it over SSE: a `CallToolResult`
+    with `isError=True` and the error text as content.
+    """
+
+    def __init__(self, server: FastMCP):
+        self.server = server
+        self._catalog: Optional[ToolCatalog] = None
+
+    async def list_tools(self) -> types.ListToolsResult:
+        return types.ListToolsResult(tools=await self.server.list_tools())
+
+    async def catalog(self) -> ToolCatalog:
+        """Tool catalog of the local server, built on first use"""
+        if self._catalog is None:
+            self._catalog = get_catalog(await self.server.list_tools())
+        return self._catalog
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> types.CallToolResult:
+        try:
+            content = await self.server.call_tool(name, arguments or {})
+            return types.CallToolResult(content=list(content), isError=False)
+        except Exception as e:
+            return types.CallToolResult(content=[types.TextContent(type="text", text=str(e))], isError=True)
+
+    async def send_ping(self) -> types.EmptyResult:
+        return types.EmptyResult()
@@ -0,0 +1,20 @@
+import sys
+from typing import Callable
+
+# log(level, message)
+Logger = Callable[[str, str], None]
+
+
+def make_logger(prefix: str = "") -> Logger:
+    """Logger writing `LEVEL: [prefix] message` lines to stderr.
+
+    Server-side modules log to stderr so nothing interferes with the JSON
+    written to stdout; the prefix names the module a line comes from.
+    """
+    tag = f"[{prefix}] " if prefix else ""
+
+    def log(level: str, message: str) -> None:
+        sys.stderr.write(f"{level}: {tag}{message}\n")
+        sys.stderr.flush()
+
+    return log
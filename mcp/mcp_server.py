@@ -7,7 +7,6 @@ from mcp.server.fastmcp.prompts import base
 from mcp.types import TextContent
 from mcp.server import Server
 from starlette.routing import Mount, Route
-import tqdm
 import uvicorn
 from mcp import types
 from PIL import Image as PILImage
@@ -17,17 +16,28 @@ import time
 import subprocess
 from rich.console import Console
 from rich.panel import Panel
-import requests
 from fastapi import FastAPI, Request, Body
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 from starlette.applications import Starlette
 from mcp.server.sse import SseServerTransport
 from starlette.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Optional
 import numpy as np
 from pathlib import Path
-import faiss
 
+from vector_store import VectorStore
+from ann_index import IndexConfig
+from embeddings import EmbeddingClient
+from embedding_cache import EmbeddingCache
+from query_cache import QueryCache
+from ingest_jobs import IngestJobQueue
+from html_extract import extract_page_text, html_to_markdown
+from chunker import Chunk, chunk_location, chunk_markdown
+from log_util import make_logger
+from bulk_ingest import ingest_folder
+from starlette.concurrency import run_in_threadpool
 from data_model import (
     AddInput, AddListInput, AddListOutput, AddOutput, CreateThumbnailInput, OpenKeynoteOutput, SubtractInput, SubtractOutput,
     MultiplyInput, MultiplyOutput, DivideInput, DivideOutput,
@@ -47,13 +57,66 @@ console = Console()
 # instantiate an MCP server client
 mcp = FastMCP("Calculator", settings= {"host": "127.0.0.1", "port": 7172})
 
-app = FastAPI()
-
-EMBED_URL = "http://localhost:11434/api/embeddings"
+OLLAMA_URL = "http://localhost:11434"
 EMBED_MODEL = "nomic-embed-text"
-CHUNK_SIZE = 256
-CHUNK_OVERLAP = 40
+# Upper bound on estimated tokens per chunk (see chunker.py)
+CHUNK_TOKENS = 512
+# "fast" (built-in extractor) or "markitdown" (MarkItDown on the cleaned HTML)
+HTML_EXTRACTOR = "fast"
+# Search modes: "hybrid" (vector + BM25, fused), "vector" or "lexical" (BM25 only, no embedder)
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+# A query embedding slower than this, or failing, degrades hybrid search to
+# lexical (vector mode waits for the embedder like ingestion does)
+QUERY_EMBED_TIMEOUT = 2.0
+# After this many hybrid embedding failures in a row, hybrid search stops
+# trying the embedder for EMBEDDER_RETRY_AFTER seconds
+EMBEDDER_FAILURE_LIMIT = 3
+EMBEDDER_RETRY_AFTER = 30.0
+# Let /api/query call this server's tools directly instead of over its own SSE endpoint
+LOCAL_TOOL_DISPATCH = True
 ROOT = Path(__file__).parent.resolve()
+INDEX_CACHE = ROOT / "faiss_index"
+
+# Spawned worker processes (bulk_ingest's conversion pool) re-run this script
+# as __mp_main__; they only need the worker task, so skip building services
+SERVER_PROCESS = __name__ != "__mp_main__"
+
+if SERVER_PROCESS:
+    # Resident vector store shared by search and all ingestion paths
+    # (index backend is chosen with FAISS_INDEX_TYPE=flat|hnsw|ivf_flat|ivf_pq)
+    vector_store = VectorStore(INDEX_CACHE, index_config=IndexConfig.from_env())
+
+    # Pooled, batching embedding client shared by search and ingestion, with a
+    # content-addressed cache so unchanged chunks are never re-embedded
+    embedder = EmbeddingClient(
+        base_url=OLLAMA_URL, model=EMBED_MODEL, cache=EmbeddingCache(INDEX_CACHE / "embedding_cache.db")
+    )
+
+    # Hybrid search embeds queries with a short timeout so it can fall back to keywords quickly
+    hybrid_query_embedder = EmbeddingClient(base_url=OLLAMA_URL, model=EMBED_MODEL, max_concurrency=4, timeout=QUERY_EMBED_TIMEOUT)
+    # Consecutive hybrid embedding failures, and the monotonic time until which
+    # hybrid search skips the embedder once they reach EMBEDDER_FAILURE_LIMIT
+    embedder_failures = 0
+    embedder_down_until = 0.0
+
+    # Repeat searches skip the embedder (query embeddings) or everything (results)
+    query_cache = QueryCache(INDEX_CACHE / "query_cache.npz")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the index once at startup so queries only pay for the search
+    vector_store.load()
+    vector_store.start_compactor()
+    query_cache.load()
+    yield
+    ingest_queue.shutdown()
+    vector_store.close()
+    query_cache.save()
+    # The agent service is imported lazily by /api/query; close its MCP session pool if it was used
+    if "agent_service" in sys.modules:
+        await sys.modules["agent_service"].agent_service.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow requests from Chrome extension
 app.add_middleware(
@@ -67,6 +130,22 @@ app.add_middleware(
 # Define query request model
 class QueryRequest(BaseModel):
     query: str
+    # Scopes the agent's memory; sent by the extension, shared "default" if absent
+    session_id: Optional[str] = None
+    # "staged" (perception, recall, plan) or "fused" (one LLM call per step)
+    mode: Optional[str] = None
+
+# Define search request model
+class SearchRequest(BaseModel):
+    query: str
+    k: int = 5
+    nprobe: Optional[int] = None     # IVF: clusters to scan (higher = better recall, slower)
+    ef_search: Optional[int] = None  # HNSW: candidate list size (higher = better recall, slower)
+    mode: str = "hybrid"             # "hybrid", "vector" or "lexical" (keywords only, no embedder)
+
+# Define page deletion request model
+class DeletePageRequest(BaseModel):
+    url: str
 
 # Define page request model
 class PageRequest(BaseModel):
@@ -83,9 +162,12 @@ async def handle_query(request: QueryRequest):
     # Use the AgentService to process the query
     try:
         from agent_service import agent_service
+        if LOCAL_TOOL_DISPATCH:
+            agent_service.attach_local_server(mcp)
         
         # Process the query using our agent service
-        result = await agent_service.process_query(query)
+        result = await agent_service.process_query(query, session_id=request.session_id,
+                                                   mode=request.mode or "staged")
         return {"result": result}
     
     except Exception as e:
@@ -94,28 +176,57 @@ async def handle_query(request: QueryRequest):
         print(f"Error processing query: {e}")
         return {"result": f"Error processing query: {str(e)}"}
 
+# Same as /api/query, but streams the agent's progress as server-sent events:
+# step, perception, plan, tool, answer (FINAL_ANSWER text as it is generated), final
+@app.post("/api/query/stream")
+async def handle_query_stream(request: QueryRequest):
+    print(f"Received streaming query: {request.query}")
+    from agent_service import agent_service
+    if LOCAL_TOOL_DISPATCH:
+        agent_service.attach_local_server(mcp)
+
+    async def events():
+        async for event in agent_service.stream_query(request.query, session_id=request.session_id,
+                                                      mode=request.mode or "staged"):
+            yield f"data: {json.dumps(event, default=str)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # New endpoint to handle page content from Chrome extension
 @app.post("/api/add-page")
 async def add_page(request: PageRequest):
     print(f"Received page: {request.url}")
     
-    try:
-        # Process the HTML content
-        chunks_processed = process_html(request.url, request.title, request.html)
-        
-        return {
-            "message": f"Page added successfully! Processed {chunks_processed} chunks.",
-            "status": "success"
-        }
-    
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Error processing page: {e}")
-        return {
-            "message": f"Error processing page: {str(e)}",
-            "status": "error"
-        }
+    # Indexing runs on the ingest worker pool; the client polls the job status
+    job = ingest_queue.submit(request.url, request.title, request.html)
+    return {
+        "message": "Page queued for indexing.",
+        "status": job.status,
+        "job_id": job.job_id
+    }
+
+@app.delete("/api/page")
+async def delete_page(request: DeletePageRequest):
+    """Remove every indexed chunk of a page (or document file name)"""
+    removed = await run_in_threadpool(vector_store.delete, request.url)
+    return {
+        "message": f"Removed {removed} chunks for {request.url}.",
+        "status": "success" if removed else "not_found",
+        "removed": removed
+    }
+
+@app.post("/api/vacuum")
+async def vacuum_index():
+    """Rebuild the index without deleted vectors and reclaim disk space"""
+    return await run_in_threadpool(vector_store.vacuum)
+
+@app.get("/api/add-page/{job_id}")
+async def add_page_status(job_id: str):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return {"job_id": job_id, "status": "error", "message": "Unknown job id"}
+    return job.model_dump()
 
 # DEFINE TOOLS
 
@@ -432,165 +543,98 @@ def read_root():
 async def get_capabilites():
     return await mcp.list_tools()
 
+@app.get("/api/embedding-stats")
+def get_embedding_stats():
+    """Report embedding throughput and search cache hit rates since the server started"""
+    return {**embedder.stats.as_dict(), "query_cache": query_cache.stats()}
+
 def get_embedding(text: str) -> np.ndarray:
-    response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
-    response.raise_for_status()
-    return np.array(response.json()["embedding"], dtype=np.float32)
-
-def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    words = text.split()
-    for i in range(0, len(words), size - overlap):
-        yield " ".join(words[i:i+size])
-
-def mcp_log(level: str, message: str) -> None:
-    """Log a message to stderr to avoid interfering with JSON communication"""
-    sys.stderr.write(f"{level}: {message}\n")
-    sys.stderr.flush()
-
-def process_documents():
-    """Process documents and create FAISS index"""
+    return embedder.embed(text)
+
+def get_embeddings(texts: list[str]) -> list[np.ndarray]:
+    """Embed many chunks with batched/concurrent requests instead of one call each.
+
+    Chunks already embedded (by content, across all pages) come from the cache.
+    """
+    return embedder.embed_chunks(texts)
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS) -> list[Chunk]:
+    """Split markdown into structure-aligned chunks (headings, paragraphs, lists, tables)"""
+    return list(chunk_markdown(text, max_tokens=max_tokens))
+
+mcp_log = make_logger()
+
+def process_documents(workers=None):
+    """Index the documents folder (recursively) into the shared vector store.
+
+    Files are converted in a process pool and embedded as they come in; see
+    bulk_ingest.py, which also runs standalone for large folders.
+    """
     mcp_log("INFO", "Indexing documents with MarkItDown...")
-    ROOT = Path(__file__).parent.resolve()
-    DOC_PATH = ROOT / "documents"
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
-
-    def file_hash(path):
-        return hashlib.md5(Path(path).read_bytes()).hexdigest()
-
-    CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
-    all_embeddings = []
-    converter = MarkItDown()
-
-    for file in DOC_PATH.glob("*.*"):
-        fhash = file_hash(file)
-        if file.name in CACHE_META and CACHE_META[file.name] == fhash:
-            mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
-            continue
-
-        mcp_log("PROC", f"Processing: {file.name}")
-        try:
-            result = converter.convert(str(file))
-            markdown = result.text_content
-            chunks = list(chunk_text(markdown))
-            embeddings_for_file = []
-            new_metadata = []
-            for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
-                embedding = get_embedding(chunk)
-                embeddings_for_file.append(embedding)
-                new_metadata.append({"doc": file.name, "chunk": chunk, "chunk_id": f"{file.stem}_{i}"})
-            if embeddings_for_file:
-                if index is None:
-                    dim = len(embeddings_for_file[0])
-                    index = faiss.IndexFlatL2(dim)
-                index.add(np.stack(embeddings_for_file))
-                metadata.extend(new_metadata)
-            CACHE_META[file.name] = fhash
-        except Exception as e:
-            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
-
-    CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-    METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-    if index and index.ntotal > 0:
-        faiss.write_index(index, str(INDEX_FILE))
-        mcp_log("SUCCESS", "Saved FAISS index and metadata")
-    else:
-        mcp_log("WARN", "No new documents or updates to process.")
+    return ingest_folder(ROOT / "documents", vector_store, embedder, workers=workers,
+                         checkpoint_path=INDEX_CACHE / "bulk_ingest_checkpoint.json",
+                         max_tokens=CHUNK_TOKENS, log=mcp_log)
+
+def process_html(url, title, html_content, progress=None):
+    """Process HTML content from a webpage and add to FAISS index.
 
-def process_html(url, title, html_content):
-    """Process HTML content from a webpage and add to FAISS index"""
+    `progress(stage, fraction)` is called as the page moves through the pipeline.
+    """
     mcp_log("INFO", f"Processing HTML from: {url}")
-    
-    # Setup paths and files
-    ROOT = Path(__file__).parent.resolve()
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
+    progress = progress or (lambda stage, fraction: None)
     
     # Create a URL-safe filename
     safe_url = url.replace("://", "_").replace("/", "_").replace(".", "_")
-    temp_file_path = INDEX_CACHE / f"temp_{safe_url}.html"
-    
-    # Write HTML to temporary file
-    # with open(temp_file_path, "w", encoding="utf-8") as f:
-    #     f.write(html_content)
     
     # Calculate hash of content
     content_hash = hashlib.md5(html_content.encode("utf-8")).hexdigest()
     
-    # Load existing metadata and cache
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    
     # Check if we've already processed this URL with the same content
-    if url in CACHE_META and CACHE_META[url] == content_hash:
+    if vector_store.is_unchanged(url, content_hash):
         mcp_log("SKIP", f"Skipping unchanged URL: {url}")
-        # Clean up temp file
-        # temp_file_path.unlink(missing_ok=True)
         return 0
     
     try:
-        # Process the HTML
-        converter = MarkItDown()
-        # result = converter.convert(str(temp_file_path))
-        result = converter.convert_url(url)
-        markdown = result.text_content
+        # Convert the HTML the extension already captured, in memory.
+        # Only re-fetch the URL if no HTML was submitted.
+        progress("converting", 0.1)
+        if html_content.strip():
+            markdown = extract_page_text(html_content, url=url, mode=HTML_EXTRACTOR)
+        else:
+            markdown = MarkItDown().convert_url(url).text_content
+        if not markdown.strip() and html_content.strip() and HTML_EXTRACTOR != "markitdown":
+            mcp_log("WARN", f"Fast extractor found no text in {url}, retrying with MarkItDown")
+            markdown = html_to_markdown(html_content, url=url)
         
         # Create chunks of text
-        chunks = list(chunk_text(markdown))
+        chunks = chunk_text(markdown)
+        if not chunks:
+            # Committing zero chunks would delete the page's old chunks and
+            # record the new hash, so later submits would be skipped
+            raise ValueError(f"No indexable text extracted from {url}")
         
-        # Load or create FAISS index
-        index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() and Path(INDEX_FILE).is_file() else None
-        
-        # Process each chunk and create embeddings
-        embeddings = []
-        new_metadata = []
-        
-        for i, chunk in enumerate(tqdm.tqdm(chunks, desc=f"Embedding {url}")):
-            embedding = get_embedding(chunk)
-            embeddings.append(embedding)
-            new_metadata.append({
+        # Embed all chunks in as few round trips as possible
+        progress("embedding", 0.3)
+        embeddings = get_embeddings([chunk.text for chunk in chunks])
+        new_metadata = [
+            {
                 "url": url,
                 "title": title,
-                "chunk": chunk,
-                "chunk_id": f"{safe_url}_{i}"
-            })
+                "chunk": chunk.text,
+                "chunk_id": f"{safe_url}_{i}",
+                **chunk_location(chunk),
+            }
+            for i, chunk in enumerate(chunks)
+        ]
         
-        # If we have embeddings, add them to the index
+        # Replace any chunks from an earlier version of the page. Old chunks,
+        # new chunks, vectors and the URL hash commit atomically; index.bin is
+        # compacted in the background.
+        progress("indexing", 0.9)
+        vector_store.add(embeddings, new_metadata, key=url, content_hash=content_hash, replace=True)
         if embeddings:
-            embeddings_array = np.stack(embeddings)
-            
-            if index is None:
-                # Create a new index if none exists
-                dim = len(embeddings[0])
-                index = faiss.IndexFlatL2(dim)
-            
-            # Add embeddings to index
-            index.add(embeddings_array)
-            
-            # Add metadata
-            metadata.extend(new_metadata)
-            
-            # Update cache
-            CACHE_META[url] = content_hash
-            
-            # Save everything
-            METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-            CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-            faiss.write_index(index, str(INDEX_FILE))
-            
             mcp_log("SUCCESS", f"Indexed {len(chunks)} chunks from {url}")
         
-        # Clean up temp file
-        # temp_file_path.unlink(missing_ok=True)
-        
         return len(chunks)
         
     except Exception as e:
@@ -598,47 +642,67 @@ def process_html(url, title, html_content):
         import traceback
         traceback.print_exc()
         
-        # Clean up temp file
-        temp_file_path.unlink(missing_ok=True)
-        
         raise e
 
-def search_index(query, k=5):
-    """Search the FAISS index for similar content to the query"""
-    ROOT = Path(__file__).parent.resolve()
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    
-    if not INDEX_FILE.exists() or not METADATA_FILE.exists():
+# Background ingestion for /api/add-page
+if SERVER_PROCESS:
+    ingest_queue = IngestJobQueue(process_html)
+
+def get_query_embedding(query: str, client: Optional[EmbeddingClient] = None) -> np.ndarray:
+    embedding = query_cache.get_embedding(query)
+    if embedding is None:
+        embedding = (client or embedder).embed(query)
+        query_cache.put_embedding(query, embedding)
+    return embedding
+
+def lexical_fallback(query: str, k: int) -> dict:
+    return {"results": vector_store.lexical_search(query, k=k), "fallback": "lexical"}
+
+def search_index(query, k=5, nprobe=None, ef_search=None, mode="hybrid"):
+    """Search the in-memory stores for content matching the query.
+
+    "hybrid" fuses vector and BM25 keyword rankings; if the query cannot be
+    embedded in time it answers from BM25 alone and marks the response with
+    "fallback": "lexical". "lexical" never calls the embedder. Each result's
+    "score_type" says how to read its score: "squared_l2_distance" (vector,
+    lower is better), "rrf" or "bm25" (higher is better).
+    """
+    global embedder_failures, embedder_down_until
+    if mode not in SEARCH_MODES:
+        return {"results": [], "error": f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}"}
+    if vector_store.load().size == 0:
         return {"results": [], "error": "No index available. Try adding some pages first."}
     
     try:
-        # Load index and metadata
-        index = faiss.read_index(str(INDEX_FILE))
-        metadata = json.loads(METADATA_FILE.read_text())
-        
-        # Get query embedding
-        query_embedding = get_embedding(query)
-        
-        # Reshape for search
-        query_embedding = np.array([query_embedding], dtype=np.float32)
-        
-        # Search
-        distances, indices = index.search(query_embedding, k=k)
-        
-        # Format results
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(metadata):  # Valid index
-                item = metadata[idx]
-                result = {
-                    "score": float(distances[0][i]),
-                    "metadata": item
-                }
-                results.append(result)
-        
-        return {"results": results}
+        # Results are keyed on the index version, so adds/deletes invalidate them
+        cache_key = query_cache.result_key(query, vector_store.version, k=k, nprobe=nprobe, ef_search=ef_search, mode=mode)
+        cached = query_cache.get_results(cache_key)
+        if cached is not None:
+            return cached
+
+        if mode == "lexical":
+            response = {"results": vector_store.lexical_search(query, k=k)}
+        elif mode == "vector":
+            query_embedding = get_query_embedding(query)
+            response = {"results": vector_store.search(query_embedding, k=k, nprobe=nprobe, ef_search=ef_search)}
+        elif time.monotonic() < embedder_down_until:
+            # Embedder kept failing: don't wait for another timeout, and don't cache
+            return lexical_fallback(query, k)
+        else:
+            try:
+                query_embedding = get_query_embedding(query, client=hybrid_query_embedder)
+            except Exception as e:
+                embedder_failures += 1
+                if embedder_failures >= EMBEDDER_FAILURE_LIMIT:
+                    embedder_down_until = time.monotonic() + EMBEDDER_RETRY_AFTER
+                print(f"Embedder unavailable ({e}), answering from the keyword index")
+                return lexical_fallback(query, k)
+            embedder_failures = 0
+            results = vector_store.hybrid_search(query, query_embedding, k=k, nprobe=nprobe, ef_search=ef_search)
+            response = {"results": results}
+
+        query_cache.put_results(cache_key, response)
+        return response
     
     except Exception as e:
         import traceback
@@ -647,12 +711,16 @@ def search_index(query, k=5):
 
 # Add endpoint for searching the index
 @app.post("/api/search")
-async def search_content(request: QueryRequest):
+async def search_content(request: SearchRequest):
     query = request.query
     print(f"Searching for: {query}")
     
     try:
-        results = search_index(query)
+        # Embedding the query is blocking I/O; keep it off the event loop
+        results = await run_in_threadpool(
+            search_index, query, k=request.k, nprobe=request.nprobe, ef_search=request.ef_search,
+            mode=request.mode,
+        )
         return results
     except Exception as e:
         import traceback
@@ -674,7 +742,7 @@ if __name__ == "__main__":
     else:
         print("STARTING with stdio for direct execution")
         mcp.run(transport="stdio")
-else: 
+elif SERVER_PROCESS:
     print("starting sse...")
     start_sse()
         
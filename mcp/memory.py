@@ -1,15 +1,19 @@
-
-import ast
-from asyncio import log
 import asyncio
+import hashlib
+import json
 import os
-from typing import List
-from dotenv import load_dotenv
-from pydantic import BaseModel
-from google import genai
-from pdb import set_trace
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
 
-from llm import call_llm_with_timeout
+from embedding_cache import EmbeddingCache
+from embeddings import EmbeddingClient
 
 try:
     from agent import log
@@ -20,73 +24,234 @@ except ImportError:
         print(f"[{now}] [{stage}] {msg}")
 
 
-load_dotenv()
+OLLAMA_URL = "http://localhost:11434"
+EMBED_MODEL = "nomic-embed-text"
 
-# Access your API key and initialize Gemini client correctly
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
 
 class MemoryItem(BaseModel):
     text: str
+    # None means the fact is shared by every session (e.g. user preferences)
+    session_id: Optional[str] = None
+    created_at: float = Field(default_factory=time.time)
+
+
+class _Entry:
+    __slots__ = ("item", "vector")
+
+    def __init__(self, item: MemoryItem):
+        self.item = item
+        self.vector: Optional[np.ndarray] = None  # unit-normalized, filled in lazily
+
+
+def _tokens(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+_default_embedder: Optional[EmbeddingClient] = None
+_default_embedder_lock = threading.Lock()
+
+
+def default_embedder() -> EmbeddingClient:
+    """Embedding client shared by every MemoryManager created without one.
+
+    A client holds a connection pool and worker threads, so one per manager
+    would leak them for each agent run.
+    """
+    global _default_embedder
+    with _default_embedder_lock:
+        if _default_embedder is None:
+            _default_embedder = EmbeddingClient(base_url=OLLAMA_URL, model=EMBED_MODEL, max_concurrency=2, timeout=10)
+        return _default_embedder
+
 
 class MemoryManager:
-    def __init__(self) -> None:
-        self.facts: List[MemoryItem] = []
-    
+    """Bounded agent memory recalled by embedding similarity.
+
+    `store` only appends; new items are embedded in one batch on the next
+    `recall`, together with the query, through the local Ollama embedder.
+    Recall is a cosine top-k over the items visible to the session: its own
+    items plus the shared ones. If the embedder is unreachable, recall falls
+    back to keyword overlap instead of failing.
+
+    Once `max_items` is exceeded the oldest session items are evicted
+    first; shared items only go when nothing else is left. With a `ttl`,
+    items older than that many seconds are dropped as well.
+    """
+
+    def __init__(self, embedder: Optional[EmbeddingClient] = None, max_items: int = 500,
+                 top_k: int = 3, min_score: float = 0.5, ttl: Optional[float] = None) -> None:
+        self.embedder = embedder or default_embedder()
+        self.max_items = max_items
+        self.top_k = top_k
+        self.min_score = min_score
+        self.ttl = ttl
+        self._entries: List[_Entry] = []
+
+    @property
+    def facts(self) -> List[MemoryItem]:
+        return [entry.item for entry in self._entries]
+
     def store(self, fact: MemoryItem):
-        self.facts.append(fact)
-    
-    async def recall(self, query) -> List[MemoryItem]:
-        if (not self.facts):
+        self._entries.append(_Entry(fact))
+        if len(self._entries) > self.max_items:
+            self._evict(len(self._entries) - self.max_items)
+
+    def _expire(self) -> None:
+        if self.ttl is None:
+            return
+        cutoff = time.time() - self.ttl
+        if self._entries and self._entries[0].item.created_at < cutoff:
+            self._entries = [e for e in self._entries if e.item.created_at >= cutoff]
+
+    def _evict(self, count: int) -> None:
+        # Entries are in insertion order, so the first matches are the oldest
+        scoped = [e for e in self._entries if e.item.session_id is not None][:count]
+        if len(scoped) < count:
+            scoped += [e for e in self._entries if e.item.session_id is None][:count - len(scoped)]
+        dropped = set(map(id, scoped))
+        self._entries = [e for e in self._entries if id(e) not in dropped]
+        log("memory", f"Evicted {len(scoped)} old memories")
+
+    async def recall(self, query, session_id: Optional[str] = None, top_k: Optional[int] = None) -> List[MemoryItem]:
+        top_k = top_k or self.top_k
+        self._expire()
+        candidates = [e for e in self._entries if e.item.session_id in (None, session_id)]
+        if not candidates:
             return []
 
-        prompt = f"""
-You are given a list of memory items in the form of MemoryItem(text='...'). Each item contains a factual sentence.
+        start = time.perf_counter()
+        try:
+            query_vector = await self._embed_pending(candidates, query)
+        except Exception as e:
+            log("memory", f"⚠️ Embedding recall unavailable, using keyword match: {e}")
+            return self._keyword_recall(candidates, query, top_k)
 
-Given the following list of memory items:
-{self.facts}
+        matrix = np.stack([e.vector for e in candidates])
+        scores = matrix @ query_vector
+        order = np.argsort(-scores)[:top_k]
+        recalled = [candidates[i].item for i in order if scores[i] >= self.min_score]
+        log("memory", f"Recalled {len(recalled)}/{len(candidates)} memories in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return recalled
 
-And the query: {query}
+    async def _embed_pending(self, candidates: List[_Entry], query: str) -> np.ndarray:
+        """Embed the query plus every candidate without a vector in one batch"""
+        pending = [e for e in candidates if e.vector is None]
+        texts = [query] + [e.item.text for e in pending]
+        # The client is blocking (requests); keep the event loop free
+        vectors = await asyncio.to_thread(self.embedder.embed_chunks, texts)
+        vectors = [v / (np.linalg.norm(v) or 1.0) for v in vectors]
+        for entry, vector in zip(pending, vectors[1:]):
+            entry.vector = vector
+        return vectors[0]
 
-Select and return only the relevant memory items whose content directly relates to the query.
-Important instructions:
+    def _keyword_recall(self, candidates: List[_Entry], query: str, top_k: int) -> List[MemoryItem]:
+        query_tokens = _tokens(query)
+        if not query_tokens:
+            return []
+        scored = []
+        for entry in candidates:
+            overlap = len(query_tokens & _tokens(entry.item.text))
+            if overlap:
+                scored.append((overlap, entry.item.created_at, entry.item))
+        scored.sort(key=lambda s: (s[0], s[1]), reverse=True)
+        return [item for _, _, item in scored[:top_k]]
 
-    Do not generate or include any code.
 
-    Do not explain your choices.
 
-    Do not modify, correct, or rephrase any of the memory texts.
+class SessionMemoryStore:
+    """One bounded MemoryManager per client session.
 
-    Only include the exact text values from relevant memory items.
+    Sessions idle for longer than `session_ttl` seconds, or beyond the
+    `max_sessions` most recently used, are dropped from memory. With a
+    `persist_dir`, each session's items are written to a file named after
+    the SHA-256 of its id by `save()` (and when a session is dropped) and
+    reloaded on its next query; their embeddings come back from an
+    embedding cache in the same directory instead of being recomputed.
+    Nothing is created on disk until the first session is used.
+    """
 
-    Your output must only be the list of strings, like this:
+    def __init__(self, persist_dir: Optional[Path] = None, max_sessions: int = 100,
+                 session_ttl: float = 24 * 3600, max_items: int = 50, item_ttl: Optional[float] = 7 * 24 * 3600):
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.max_items = max_items
+        self.item_ttl = item_ttl
+        self._embedder: Optional[EmbeddingClient] = None
+        self._sessions: "OrderedDict[str, MemoryManager]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
 
-Output format:
+    @property
+    def embedder(self) -> EmbeddingClient:
+        """Embedding client shared by every session (one connection pool, one cache), built on first use"""
+        if self._embedder is None:
+            cache = None
+            if self.persist_dir:
+                self.persist_dir.mkdir(parents=True, exist_ok=True)
+                cache = EmbeddingCache(self.persist_dir / "memory_embeddings.db",
+                                       max_entries=self.max_sessions * self.max_items * 4)
+            self._embedder = EmbeddingClient(base_url=OLLAMA_URL, model=EMBED_MODEL, max_concurrency=2,
+                                             timeout=10, cache=cache)
+        return self._embedder
 
-[
-    'Capital of india is delhi',
-    'Hindi is the largest spoken language',
-    'Modi is the PM of india'
-]
-"""
-        try:
-            response = await call_llm_with_timeout(client, prompt)
-            raw = response.text.strip()
-            # print(f"LLM output: {raw}")
-            # set_trace()
-            log("memory", f"LLM output: {str(raw)}")
+    def get(self, session_id: str) -> MemoryManager:
+        """Memory of a session, created (or reloaded from disk) on first use"""
+        self._drop_idle()
+        memory = self._sessions.get(session_id)
+        if memory is None:
+            memory = MemoryManager(embedder=self.embedder, max_items=self.max_items, ttl=self.item_ttl)
+            for item in self._load(session_id):
+                memory.store(item)
+            self._sessions[session_id] = memory
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.time()
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)))
+        return memory
+
+    def save(self, session_id: Optional[str] = None) -> None:
+        """Persist one session, or every session in memory"""
+        if self.persist_dir is None:
+            return
+        for sid in [session_id] if session_id else list(self._sessions):
+            memory = self._sessions.get(sid)
+            if memory is None:
+                continue
+            path = self._path(sid)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = path.with_suffix(".tmp")
+            tmp_file.write_text(json.dumps([item.model_dump() for item in memory.facts]))
+            os.replace(tmp_file, path)
 
-            text_items = ast.literal_eval(str(raw))
+    def _drop_idle(self) -> None:
+        cutoff = time.time() - self.session_ttl
+        for sid in [sid for sid, used in self._last_used.items() if used < cutoff]:
+            self._drop(sid)
 
-            memory_items: List[MemoryItem] = [MemoryItem(text=t) for t in text_items]
+    def _drop(self, session_id: str) -> None:
+        self.save(session_id)
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        log("memory", f"Dropped memory session {session_id} from RAM")
 
-            return memory_items
+    def _path(self, session_id: str) -> Path:
+        # Session ids come from the client: hash them to a safe file name
+        # that no other id maps to
+        digest = hashlib.sha256(session_id.encode()).hexdigest()
+        return self.persist_dir / f"{digest}.json"
+
+    def _load(self, session_id: str) -> List[MemoryItem]:
+        if self.persist_dir is None:
+            return []
+        path = self._path(session_id)
+        if not path.is_file():
+            return []
+        try:
+            return [MemoryItem(**item) for item in json.loads(path.read_text())]
         except Exception as e:
-            log("memory", f"⚠️ Memory recall failed: {e}")
+            log("memory", f"⚠️ Ignoring unreadable memory file {path}: {e}")
             return []
 
-        # return call_llm(prompt)
-
 
 if __name__ == "__main__":
     mItem1 = MemoryItem(text="Capital of india is delhi")
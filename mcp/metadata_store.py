@@ -0,0 +1,300 @@
+import json
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Keys a chunk's metadata may carry; anything else goes into `extra`
+METADATA_COLUMNS = ("chunk_id", "url", "title", "doc", "chunk")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id       INTEGER PRIMARY KEY,   -- FAISS id of the chunk's vector
+    chunk_id TEXT,
+    url      TEXT,
+    title    TEXT,
+    doc      TEXT,
+    chunk    TEXT,
+    extra    TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_url ON chunks(url);
+CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc);
+
+CREATE TABLE IF NOT EXISTS doc_cache (
+    key  TEXT PRIMARY KEY,          -- URL or document file name
+    hash TEXT NOT NULL
+);
+
+-- Full-precision vector of every chunk, used to rebuild and retrain the
+-- index. Rows from the store_meta 'snapshot_next_id' on are not in the
+-- index.bin snapshot yet, so this also serves as its write-ahead log.
+CREATE TABLE IF NOT EXISTS vector_wal (
+    id     INTEGER PRIMARY KEY,     -- FAISS id, same as chunks.id
+    vector BLOB NOT NULL
+);
+
+-- Deleted chunk ids the index.bin snapshot may still contain
+CREATE TABLE IF NOT EXISTS deleted_ids (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id  INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+-- BM25 inverted index over the chunk rows, kept in sync by the triggers below
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    chunk, title, url, content='chunks', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, chunk, title, url) VALUES (new.id, new.chunk, new.title, new.url);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, chunk, title, url) VALUES ('delete', old.id, old.chunk, old.title, old.url);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, chunk, title, url) VALUES ('delete', old.id, old.chunk, old.title, old.url);
+    INSERT INTO chunks_fts (rowid, chunk, title, url) VALUES (new.id, new.chunk, new.title, new.url);
+END;
+"""
+
+# BM25 column weights for chunk text, page title and URL
+FTS_WEIGHTS = (1.0, 2.0, 1.0)
+
+
+class MetadataStore:
+    """SQLite-backed chunk metadata keyed by FAISS id.
+
+    Rows are appended as pages are indexed and looked up by primary key, so
+    adding a page costs O(page) and a search only reads the k rows it returns.
+    Chunk ids are allocated from a counter and never reused, so they stay
+    stable across deletes and index rebuilds. An FTS5 table indexes the same
+    rows for BM25 keyword search and is updated in the same transactions.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self._build_fts()
+
+    def _build_fts(self) -> None:
+        # Databases created before the FTS table existed: index their rows once
+        with self._lock, self.conn:
+            if self.conn.execute("SELECT 1 FROM store_meta WHERE key = 'fts_built'").fetchone():
+                return
+            self.conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+            self.conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('fts_built', '1')")
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def next_id(self) -> int:
+        """The id the next committed chunk will get"""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM store_meta WHERE key = 'next_id'").fetchone()
+            if row:
+                return int(row[0])
+            # Databases from before the counter existed: continue after the largest id
+            max_id = self.conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM chunks UNION ALL SELECT id FROM vector_wal)"
+            ).fetchone()[0]
+            return 0 if max_id is None else max_id + 1
+
+    def append(self, start_id: int, metadata: List[Dict[str, Any]]) -> None:
+        """Insert rows for FAISS ids start_id .. start_id + len(metadata) - 1"""
+        rows = [self._to_row(start_id + i, item) for i, item in enumerate(metadata)]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, chunk_id, url, title, doc, chunk, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._set_next_id(start_id + len(rows))
+
+    def commit(self, metadata: List[Dict[str, Any]], vectors: np.ndarray,
+               key: Optional[str] = None, content_hash: Optional[str] = None,
+               replace_ids: Iterable[int] = ()) -> List[int]:
+        """Atomically replace `replace_ids` with new chunk rows, their vectors and the source's hash.
+
+        Either all of it is durable or none of it is, so the index, metadata
+        and hash cache can never disagree after a crash. Returns the new ids.
+        """
+        with self._lock, self.conn:
+            start_id = self.next_id()
+            ids = list(range(start_id, start_id + len(metadata)))
+            self._delete_rows(replace_ids)
+            rows = [self._to_row(i, item) for i, item in zip(ids, metadata)]
+            wal = [(i, np.asarray(v, dtype=np.float32).tobytes()) for i, v in zip(ids, vectors)]
+            self.conn.executemany(
+                "INSERT INTO chunks (id, chunk_id, url, title, doc, chunk, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.executemany("INSERT INTO vector_wal (id, vector) VALUES (?, ?)", wal)
+            if key is not None and content_hash is not None:
+                self.conn.execute("INSERT OR REPLACE INTO doc_cache (key, hash) VALUES (?, ?)", (key, content_hash))
+            self._set_next_id(start_id + len(ids))
+            return ids
+
+    def ids_for_source(self, key: str) -> List[int]:
+        """Chunk ids that came from a URL or document file name"""
+        with self._lock:
+            rows = self.conn.execute("SELECT id FROM chunks WHERE url = ? OR doc = ?", (key, key)).fetchall()
+            return [r[0] for r in rows]
+
+    def delete_source(self, key: str) -> List[int]:
+        """Atomically delete every chunk of a source and forget its hash"""
+        with self._lock, self.conn:
+            ids = self.ids_for_source(key)
+            self._delete_rows(ids)
+            self.conn.execute("DELETE FROM doc_cache WHERE key = ?", (key,))
+            return ids
+
+    def wal_vectors(self) -> Tuple[List[int], Optional[np.ndarray]]:
+        """Vectors committed after the index snapshot was taken, in id order"""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM store_meta WHERE key = 'snapshot_next_id'").fetchone()
+            rows = self.conn.execute(
+                "SELECT id, vector FROM vector_wal WHERE id >= ? ORDER BY id", (int(row[0]) if row else 0,)
+            ).fetchall()
+        if not rows:
+            return [], None
+        return [r[0] for r in rows], np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+
+    def mark_snapshot(self, next_id: int) -> None:
+        """Record that vectors of ids below `next_id` are in the index snapshot"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('snapshot_next_id', ?)", (str(next_id),)
+            )
+
+    def vectors(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Full-precision vectors of the given chunk ids; ids without a stored vector are left out.
+
+        Databases from before every vector was kept only have those newer
+        than their last snapshot.
+        """
+        ids = [int(i) for i in ids]
+        found: Dict[int, np.ndarray] = {}
+        with self._lock:
+            # Bounded batches keep under SQLite's host-parameter limit
+            for start in range(0, len(ids), 900):
+                batch = ids[start:start + 900]
+                placeholders = ",".join("?" * len(batch))
+                for chunk_id, blob in self.conn.execute(
+                    f"SELECT id, vector FROM vector_wal WHERE id IN ({placeholders})", batch
+                ):
+                    found[chunk_id] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def deleted_ids(self) -> Tuple[List[int], int]:
+        """Deleted ids still to be applied to the snapshot, and the last log sequence number"""
+        with self._lock:
+            rows = self.conn.execute("SELECT seq, id FROM deleted_ids ORDER BY seq").fetchall()
+        return [r[1] for r in rows], (rows[-1][0] if rows else 0)
+
+    def prune_deleted(self, upto_seq: int, keep: Iterable[int] = ()) -> None:
+        """Forget deletes up to `upto_seq` that a snapshot has absorbed, except ids in `keep`"""
+        keep = {int(i) for i in keep}
+        with self._lock, self.conn:
+            rows = self.conn.execute("SELECT seq, id FROM deleted_ids WHERE seq <= ?", (upto_seq,)).fetchall()
+            self.conn.executemany(
+                "DELETE FROM deleted_ids WHERE seq = ?", [(seq,) for seq, chunk_id in rows if chunk_id not in keep]
+            )
+
+    def vacuum(self) -> None:
+        """Reclaim the space of deleted rows in the database file"""
+        with self._lock:
+            self.conn.execute("VACUUM")
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Fetch metadata for the given FAISS ids; missing ids are left out"""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            cursor = self.conn.execute(
+                f"SELECT id, chunk_id, url, title, doc, chunk, extra FROM chunks WHERE id IN ({placeholders})",
+                ids,
+            )
+            return {row[0]: self._from_row(row) for row in cursor}
+
+    def lexical_search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Top-k chunk ids by BM25 for any of the query's terms, best first, as (id, score)"""
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+        # Quoted terms: FTS5 operators and punctuation in the query are taken literally
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in dict.fromkeys(terms))
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT rowid, bm25(chunks_fts, {', '.join(map(str, FTS_WEIGHTS))}) AS rank "
+                "FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, k),
+            ).fetchall()
+        # FTS5's bm25() is negated so that smaller is better; flip it back
+        return [(row[0], -row[1]) for row in rows]
+
+    def get_hash(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT hash FROM doc_cache WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def set_hash(self, key: str, content_hash: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO doc_cache (key, hash) VALUES (?, ?)", (key, content_hash))
+
+    def forget_hashes(self) -> None:
+        """Forget every source's content hash, so all of them are indexed again"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM doc_cache")
+
+    def migrate_json(self, metadata_file: Path, cache_file: Path) -> None:
+        """One-time import of the old metadata.json / doc_index_cache.json files"""
+        if metadata_file.exists() and self.count() == 0:
+            self.append(0, json.loads(metadata_file.read_text()))
+            metadata_file.rename(metadata_file.with_suffix(".json.migrated"))
+        if cache_file.exists():
+            for key, content_hash in json.loads(cache_file.read_text()).items():
+                self.set_hash(key, content_hash)
+            cache_file.rename(cache_file.with_suffix(".json.migrated"))
+
+    def _delete_rows(self, ids: Iterable[int]) -> None:
+        ids = [(int(i),) for i in ids]
+        if not ids:
+            return
+        self.conn.executemany("DELETE FROM chunks WHERE id = ?", ids)
+        self.conn.executemany("DELETE FROM vector_wal WHERE id = ?", ids)
+        self.conn.executemany("INSERT INTO deleted_ids (id) VALUES (?)", ids)
+
+    def _set_next_id(self, next_id: int) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('next_id', ?)", (str(max(next_id, self.next_id())),)
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    @staticmethod
+    def _to_row(faiss_id: int, item: Dict[str, Any]) -> tuple:
+        extra = {k: v for k, v in item.items() if k not in METADATA_COLUMNS}
+        return (faiss_id, *(item.get(col) for col in METADATA_COLUMNS), json.dumps(extra) if extra else None)
+
+    @staticmethod
+    def _from_row(row: tuple) -> Dict[str, Any]:
+        item = {col: value for col, value in zip(METADATA_COLUMNS, row[1:6]) if value is not None}
+        if row[6]:
+            item.update(json.loads(row[6]))
+        return item
@@ -1,11 +1,9 @@
 
 import asyncio
-import os
 import re
 from typing import List, Optional
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from google import genai
 
 from llm import call_llm_with_timeout
 
@@ -19,10 +17,6 @@ except ImportError:
 
 load_dotenv()
 
-# Access your API key and initialize Gemini client correctly
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
-
 
 class PerceptionResult(BaseModel):
     user_input: str
@@ -53,7 +47,7 @@ Your response must be a valid single-line Python dictionary with the following k
 Output example:
 {{"objective": "calculate the sum", "objects": ["4", "5"], "tool_hint": "Calculator"}}"""
     try:
-        response = await call_llm_with_timeout(client, prompt)
+        response = await call_llm_with_timeout(prompt)
         raw = response.text.strip()
         log("perception", f"LLM output: {raw}")
 
@@ -0,0 +1,136 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+from log_util import make_logger
+
+
+cache_log = make_logger("cache")
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a size limit and per-entry TTL"""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._items[key] = (value, expires_at or time.time() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def items(self) -> list:
+        """Unexpired (key, value, expires_at) entries, least recently used first"""
+        now = time.time()
+        with self._lock:
+            return [(k, v, exp) for k, (v, exp) in self._items.items() if exp >= now]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class QueryCache:
+    """Query-embedding cache plus top-k result cache for /api/search.
+
+    Query embeddings are persisted to `path` so they survive restarts.
+    Result entries are keyed on the vector store's version counter, so any
+    add or delete makes older results unreachable without explicit purging.
+    """
+
+    def __init__(self, path: Path, embedding_size: int = 2000, embedding_ttl: float = 7 * 24 * 3600,
+                 result_size: int = 500, result_ttl: float = 600, save_every: int = 50):
+        self.path = Path(path)
+        self.embeddings = LRUCache(embedding_size, embedding_ttl)
+        self.results = LRUCache(result_size, result_ttl)
+        self.save_every = save_every
+        self._unsaved = 0
+        self._save_lock = threading.Lock()
+
+    def get_embedding(self, query: str) -> Optional[np.ndarray]:
+        return self.embeddings.get(normalize_query(query))
+
+    def put_embedding(self, query: str, embedding: np.ndarray) -> None:
+        self.embeddings.put(normalize_query(query), np.asarray(embedding, dtype=np.float32))
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def result_key(self, query: str, version: int, **params) -> tuple:
+        return (normalize_query(query), version, *sorted(params.items()))
+
+    def get_results(self, key: tuple) -> Optional[dict]:
+        return self.results.get(key)
+
+    def put_results(self, key: tuple, results: dict) -> None:
+        self.results.put(key, results)
+
+    def load(self) -> "QueryCache":
+        """Restore persisted query embeddings, skipping expired ones"""
+        if not self.path.is_file():
+            return self
+        try:
+            data = np.load(self.path, allow_pickle=False)
+            now = time.time()
+            for query, vector, expires_at in zip(data["queries"], data["vectors"], data["expires"]):
+                if expires_at >= now:
+                    self.embeddings.put(str(query), vector.astype(np.float32), expires_at=float(expires_at))
+            cache_log("INFO", f"Loaded {len(self.embeddings)} cached query embeddings")
+        except Exception as e:
+            cache_log("WARN", f"Ignoring unreadable query cache {self.path}: {e}")
+        return self
+
+    def save(self) -> None:
+        """Atomically write the query embeddings to disk"""
+        with self._save_lock:
+            entries = self.embeddings.items()
+            self._unsaved = 0
+            if not entries:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_file,
+                queries=np.array([k for k, _, _ in entries]),
+                vectors=np.stack([v for _, v, _ in entries]),
+                expires=np.array([exp for _, _, exp in entries], dtype=np.float64),
+            )
+            os.replace(tmp_file, self.path)
+
+    def stats(self) -> dict:
+        return {
+            "embeddings": {"size": len(self.embeddings), "hits": self.embeddings.hits, "misses": self.embeddings.misses},
+            "results": {"size": len(self.results), "hits": self.results.hits, "misses": self.results.misses},
+        }
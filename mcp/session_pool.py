@@ -0,0 +1,160 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, List, Optional
+
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+from tool_catalog import ToolCatalog, get_catalog
+
+try:
+    from agent import log
+except ImportError:
+    import datetime
+    def log(stage: str, msg: str):
+        now = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{now}] [{stage}] {msg}")
+
+
+class PooledSession:
+    """One initialized MCP ClientSession over SSE, kept open between queries.
+
+    The SSE transport and session are entered and exited inside a single
+    background task (anyio requires that), which stays parked until close().
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session: Optional[ClientSession] = None
+        self.tools: List[Any] = []
+        self.catalog: Optional[ToolCatalog] = None
+        self.last_used = time.monotonic()
+        self.suspect = False
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._task is None or self._task.done()
+
+    async def open(self, timeout: float = 10.0) -> "PooledSession":
+        self._task = asyncio.create_task(self._run())
+        ready = asyncio.create_task(self._ready.wait())
+        done, _ = await asyncio.wait({self._task, ready}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if ready in done:
+            return self
+        ready.cancel()
+        if self._task in done:
+            raise self._task.exception() or ConnectionError(f"MCP session to {self.url} closed during setup")
+        await self.close()
+        raise TimeoutError(f"Timed out connecting MCP session to {self.url}")
+
+    async def _run(self) -> None:
+        async with sse_client(self.url) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                self.tools = (await session.list_tools()).tools
+                self.catalog = get_catalog(self.tools)
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+
+    async def ping(self, timeout: float) -> bool:
+        if self.closed or self.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=timeout)
+            return True
+        except Exception as e:
+            log("pool", f"⚠️ Session health check failed: {e}")
+            return False
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout=5)
+        except Exception:
+            self._task.cancel()
+
+
+class MCPSessionPool:
+    """Warm pool of initialized MCP sessions shared across agent queries.
+
+    Each concurrent query checks out its own session, so none of them pays
+    for the SSE connect, `initialize()` and `list_tools()` round trips.
+    Sessions idle longer than `check_after` seconds, or used by a query that
+    failed, are pinged before reuse and reconnected if they do not answer.
+    """
+
+    def __init__(self, url: str, max_size: int = 4, check_after: float = 30.0,
+                 ping_timeout: float = 5.0, connect_timeout: float = 10.0):
+        self.url = url
+        self.max_size = max_size
+        self.check_after = check_after
+        self.ping_timeout = ping_timeout
+        self.connect_timeout = connect_timeout
+        self._idle: Optional[asyncio.Queue] = None
+        self._size = 0
+
+    @asynccontextmanager
+    async def session(self):
+        """Check out a PooledSession for the duration of the block"""
+        conn = await self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            # Might be a broken connection: verify before the next checkout
+            conn.suspect = True
+            raise
+        finally:
+            conn.last_used = time.monotonic()
+            self._idle.put_nowait(conn)
+
+    async def _acquire(self) -> PooledSession:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._size < self.max_size:
+                    return await self._connect()
+                conn = await self._idle.get()
+
+            if await self._healthy(conn):
+                conn.suspect = False
+                return conn
+            log("pool", "Reconnecting stale MCP session")
+            await self._discard(conn)
+
+    async def _connect(self) -> PooledSession:
+        self._size += 1
+        try:
+            conn = await PooledSession(self.url).open(self.connect_timeout)
+            log("pool", f"Opened MCP session {self._size}/{self.max_size} to {self.url}")
+            return conn
+        except BaseException:
+            self._size -= 1
+            raise
+
+    async def _healthy(self, conn: PooledSession) -> bool:
+        if conn.closed:
+            return False
+        if not conn.suspect and time.monotonic() - conn.last_used < self.check_after:
+            return True
+        return await conn.ping(self.ping_timeout)
+
+    async def _discard(self, conn: PooledSession) -> None:
+        self._size -= 1
+        await conn.close()
+
+    async def close(self) -> None:
+        """Close every idle session"""
+        if self._idle is None:
+            return
+        while not self._idle.empty():
+            await self._discard(self._idle.get_nowait())
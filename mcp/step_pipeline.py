@@ -0,0 +1,91 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from decision import generate_fused_decision, generate_plan
+from memory import MemoryItem, MemoryManager
+from perception import PerceptionResult, extract_perception
+
+T = TypeVar("T")
+
+# After a tool call the objective is unchanged: re-use the step 1 perception
+# instead of another LLM round trip for "Previous output: ... What next?"
+REUSE_PERCEPTION_AFTER_TOOL = True
+
+# "staged": perception + recall, then plan (two LLM calls on step 1)
+# "fused": recall, then one structured call that perceives and plans
+DECISION_MODES = ("staged", "fused")
+DEFAULT_MODE = "staged"
+
+
+class StepResult(BaseModel):
+    perception: PerceptionResult
+    memories: List[MemoryItem]
+    plan: str
+    # Wall-clock milliseconds per stage; a skipped stage is absent
+    timings: Dict[str, float]
+
+
+async def timed(timings: Dict[str, float], stage: str, awaitable: Awaitable[T]) -> T:
+    """Await `awaitable` and record its wall-clock time under `stage`"""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return " | ".join(f"{stage} {ms:.0f}ms" for stage, ms in timings.items())
+
+
+async def plan_step(
+    user_input: str,
+    memory: MemoryManager,
+    tool_descriptions: Optional[str] = None,
+    previous_perception: Optional[PerceptionResult] = None,
+    session_id: Optional[str] = None,
+    mode: str = DEFAULT_MODE,
+    on_answer: Optional[Callable[[str], None]] = None,
+    on_perception: Optional[Callable[[PerceptionResult], None]] = None,
+) -> StepResult:
+    """Perceive, recall and plan one agent step.
+
+    Perception and recall only depend on the input, so they run concurrently.
+    Pass the previous step's perception when the input is a tool result to
+    skip perception altogether. In "fused" mode perception and planning are
+    a single LLM call instead. `on_answer` receives a FINAL_ANSWER while it is
+    still being generated (staged mode only; the fused output is JSON), and
+    `on_perception` the perception as soon as it is known.
+    """
+    if mode not in DECISION_MODES:
+        raise ValueError(f"Unknown decision mode '{mode}', expected one of {DECISION_MODES}")
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    recall = timed(timings, "recall", memory.recall(query=user_input, session_id=session_id))
+
+    if mode == "fused":
+        memories = await recall
+        perception, plan = await timed(timings, "decide", generate_fused_decision(
+            user_input, memories, tool_descriptions=tool_descriptions))
+        if on_perception:
+            on_perception(perception)
+        return StepResult(perception=perception, memories=memories, plan=plan, timings=timings)
+
+    if previous_perception is not None and REUSE_PERCEPTION_AFTER_TOOL:
+        perception = previous_perception.model_copy(update={"user_input": user_input})
+        memories = await recall
+    else:
+        perception, memories = await asyncio.gather(
+            timed(timings, "perception", extract_perception(user_input)),
+            recall,
+        )
+    timings["perceive+recall"] = (time.perf_counter() - start) * 1000
+    if on_perception:
+        on_perception(perception)
+
+    plan = await timed(timings, "plan", generate_plan(perception, memories, tool_descriptions=tool_descriptions,
+                                                        on_answer=on_answer))
+    return StepResult(perception=perception, memories=memories, plan=plan, timings=timings)
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The server modules are flat files in mcp/, imported by bare name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+EMBED_DIM = 32
+
+
+def fake_embedding(text: str) -> list:
+    """Deterministic vector for a text, as the fake Ollama server returns it"""
+    seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).random(EMBED_DIM, dtype=np.float32).tolist()
+
+
+class FakeOllama:
+    """Ollama embedding endpoints on a local port, recording every request.
+
+    Set `batch_endpoint = False` to act like an old build without /api/embed,
+    or `error` to answer /api/embed with a JSON error (e.g. an unknown model).
+    """
+
+    def __init__(self):
+        self.batch_endpoint = True
+        self.error = None
+        self.requests = []  # (path, number of texts)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+                if self.path == "/api/embed" and fake.batch_endpoint and not fake.error:
+                    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    fake.requests.append((self.path, len(texts)))
+                    self.reply(200, {"embeddings": [fake_embedding(t) for t in texts]})
+                elif self.path == "/api/embed" and fake.error:
+                    self.reply(404, {"error": fake.error})
+                elif self.path == "/api/embeddings":
+                    fake.requests.append((self.path, 1))
+                    self.reply(200, {"embedding": fake_embedding(body["prompt"])})
+                else:
+                    self.send_response(404)
+                    self.send_header("content-length", "0")
+                    self.end_headers()
+
+            def reply(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_ollama():
+    server = FakeOllama()
+    yield server
+    server.close()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import math
+
+import pytest
+from mcp.server.fastmcp import FastMCP
+
+from action import execute_calls, execute_plan, format_results, parse_function_calls
+from data_model import AddInput, AddOutput, FactorialInput, FactorialOutput
+from local_tools import LocalToolSession
+
+
+class RecordingSession(LocalToolSession):
+    """In-process session that records how many calls were running as each one started"""
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.running = set()
+        self.in_flight = []
+        self.arguments = []
+
+    async def call_tool(self, name, arguments=None):
+        key = json.dumps(arguments, sort_keys=True)
+        self.running.add(key)
+        self.in_flight.append(len(self.running))
+        self.arguments.append((name, arguments))
+        await asyncio.sleep(0.02)
+        self.running.discard(key)
+        return await super().call_tool(name, arguments)
+
+
+def calculator() -> FastMCP:
+    server = FastMCP("calculator")
+
+    @server.tool()
+    def add(input: AddInput) -> AddOutput:
+        return AddOutput(result=input.a + input.b)
+
+    @server.tool()
+    def factorial(input: FactorialInput) -> FactorialOutput:
+        return FactorialOutput(result=math.factorial(input.a))
+
+    return server
+
+
+def run_plan(plan: str, session=None):
+    async def run():
+        tools = session or RecordingSession(calculator())
+        return await execute_plan(tools, await tools.catalog(), plan), tools
+    return asyncio.run(run())
+
+
+def test_independent_calls_run_together_and_references_wait():
+    plan = ('FUNCTION_CALLS: ['
+            '{"id": "sum", "func_name": "add", "param": {"input": {"a": "$f3", "b": "$f4"}}}, '
+            '{"id": "f3", "func_name": "factorial", "param": {"input": {"a": 3}}}, '
+            '{"id": "f4", "func_name": "factorial", "param": {"input": {"a": 4}}}]')
+    results, session = run_plan(plan)
+    # Both factorials were in flight at once; the add ran after them with their results
+    assert session.in_flight == [1, 2, 1]
+    assert session.arguments[2] == ("add", {"input": {"a": 6, "b": 24}})
+    assert [r.call_id for r in results] == ["sum", "f3", "f4"]
+    assert json.loads(results[0].result[0]) == {"result": 30}
+    assert format_results(results).startswith("sum: add({'input': {'a': 6, 'b': 24}}) -> ")
+
+
+def test_calls_get_default_ids_in_plan_order():
+    calls = parse_function_calls('FUNCTION_CALLS: [{"func_name": "factorial", "param": {"input": {"a": 3}}}, '
+                                 '{"func_name": "add", "param": {"input": {"a": "$c1", "b": 1}}}]')
+    assert [c.id for c in calls] == ["c1", "c2"]
+    results, _ = run_plan('FUNCTION_CALLS: [{"func_name": "factorial", "param": {"input": {"a": 3}}}, '
+                          '{"func_name": "add", "param": {"input": {"a": "$c1", "b": 1}}}]')
+    assert json.loads(results[1].result[0]) == {"result": 7}
+
+
+@pytest.mark.parametrize("plan, error", [
+    ('FUNCTION_CALLS: [{"id": "a", "func_name": "add", "param": {"input": {"a": "$b", "b": 1}}}, '
+     '{"id": "b", "func_name": "add", "param": {"input": {"a": "$a", "b": 1}}}]', "circular references"),
+    ('FUNCTION_CALLS: [{"id": "a", "func_name": "factorial", "param": {"input": {"a": 1}}}, '
+     '{"id": "a", "func_name": "factorial", "param": {"input": {"a": 2}}}]', "ids must be unique"),
+    ('FUNCTION_CALLS: []', "non-empty list"),
+    ('FUNCTION_CALLS: [{"id": "a", "func_name": "add", "param": {"input": {"a": 1}}}]', "missing required parameter"),
+])
+def test_rejects_invalid_batches_before_calling_tools(plan, error):
+    session = RecordingSession(calculator())
+    with pytest.raises(ValueError, match=error):
+        run_plan(plan, session)
+    assert session.arguments == []
+
+
+def test_single_function_call_still_works():
+    results, _ = run_plan('FUNCTION_CALL: {"func_name": "factorial", "param": {"input": {"a": 5}}}')
+    assert len(results) == 1 and json.loads(results[0].result[0]) == {"result": 120}
+    assert format_results(results) == str(results[0].result)
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from mcp.server.fastmcp import FastMCP
+
+import llm
+import memory
+from agent_service import AgentService
+from data_model import AddInput, AddOutput
+from memory import SessionMemoryStore
+
+
+class PlanBackend:
+    """Streams the scripted plans one step at a time; perception is answered directly"""
+
+    def __init__(self, plans, delay: float = 0.0):
+        self.plans = list(plans)
+        self.delay = delay
+        self.finished = 0
+
+    async def generate(self, prompt, config=None):
+        return llm.MockResponse(str({"objective": "add numbers", "objects": [], "tool_hint": "add"}))
+
+    async def stream(self, prompt, config=None):
+        text = self.plans.pop(0)
+        for i in range(0, len(text), 4):
+            await asyncio.sleep(self.delay)
+            yield llm.MockResponse(text[i:i + 4])
+        self.finished += 1
+
+
+def calculator() -> FastMCP:
+    server = FastMCP("calculator")
+
+    @server.tool()
+    def add(input: AddInput) -> AddOutput:
+        """Add two numbers"""
+        return AddOutput(result=input.a + input.b)
+
+    return server
+
+
+@pytest.fixture
+def service(monkeypatch, fake_ollama):
+    monkeypatch.setattr(memory, "OLLAMA_URL", fake_ollama.url)
+    service = AgentService()
+    service.memories = SessionMemoryStore()
+    service.attach_local_server(calculator())
+    return service
+
+
+def collect(service, query):
+    async def run():
+        return [event async for event in service.stream_query(query, session_id="s1")]
+    return asyncio.run(run())
+
+
+def test_streams_steps_tool_results_and_the_answer(service, monkeypatch):
+    backend = PlanBackend([
+        'FUNCTION_CALL: {"func_name":"add","param":{"input":{"a":2,"b":3}}}',
+        "FINAL_ANSWER: [The sum is 5]",
+    ])
+    monkeypatch.setattr(llm, "_llm", llm.LLMClient(backend=backend))
+    events = collect(service, "Add two and three")
+
+    types = [e["type"] for e in events]
+    assert types[:4] == ["step", "perception", "plan", "tool"]
+    assert events[3]["tool"] == "add" and '"result": 5' in events[3]["result"][0]
+    answer = [e["text"] for e in events if e["type"] == "answer"]
+    # The answer arrives in pieces, before the final plan and result events
+    assert len(answer) > 1 and "".join(answer) == "[The sum is 5]"
+    assert types.index("answer") < len(types) - 2
+    assert events[-2] == {"type": "plan", "plan": "FINAL_ANSWER: [The sum is 5]"}
+    assert events[-1] == {"type": "final", "result": "[The sum is 5]"}
+    # The tool call was remembered for the session
+    assert "Tool call: add" in service.memories.get("s1").facts[0].text
+
+
+def test_arithmetic_is_answered_by_the_local_planner(service, monkeypatch):
+    monkeypatch.setattr(llm, "_llm", llm.LLMClient(backend=PlanBackend([])))
+    assert collect(service, "What is 2+3?") == [
+        {"type": "plan", "plan": "FINAL_ANSWER: [5]"},
+        {"type": "final", "result": "[5]"},
+    ]
+
+
+def test_closing_the_stream_cancels_the_query(service, monkeypatch):
+    backend = PlanBackend(["FINAL_ANSWER: [slow answer]"], delay=0.1)
+    monkeypatch.setattr(llm, "_llm", llm.LLMClient(backend=backend))
+
+    async def run():
+        stream = service.stream_query("Tell me something", session_id="s1")
+        assert (await stream.__anext__())["type"] == "step"
+        await stream.aclose()
+        # Long enough for the whole plan to stream if the query kept running
+        await asyncio.sleep(1.0)
+
+    asyncio.run(run())
+    assert backend.finished == 0
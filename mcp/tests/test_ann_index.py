@@ -0,0 +1,50 @@
+import faiss
+import numpy as np
+import pytest
+
+from ann_index import (
+    INDEX_TYPES, IndexConfig, build_index, empty_index, index_ids, index_type_of, needs_promotion,
+    removal_strategy,
+)
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_removal_strategy_matches_what_the_backend_can_do(index_type):
+    vectors = np.random.default_rng(0).random((1000, 16), dtype=np.float32)
+    ids = np.arange(500, 1500, dtype=np.int64)
+    index = build_index(vectors, ids, IndexConfig(index_type=index_type, nlist=8, pq_m=4, pq_bits=4))
+    assert index_type_of(index) == index_type
+    assert sorted(index_ids(index).tolist()) == ids.tolist()
+
+    if removal_strategy(index) == "tombstone":
+        with pytest.raises(RuntimeError):
+            index.remove_ids(ids[:10])
+        return
+    assert index.remove_ids(ids[:10]) == 10
+    assert index.remove_ids(ids[10:20]) == 10
+    assert sorted(index_ids(index).tolist()) == ids[20:].tolist()
+    # Ids still resolve to their own vectors after removals
+    _, found = index.search(vectors[700:701], 1, params=faiss.SearchParametersIVF(nprobe=8)
+                            if index_type.startswith("ivf") else None)
+    assert found[0][0] == 1200
+
+
+def test_config_from_env(monkeypatch):
+    monkeypatch.setenv("FAISS_INDEX_TYPE", "hnsw")
+    monkeypatch.setenv("FAISS_PROMOTE_THRESHOLD", "1000")
+    config = IndexConfig.from_env()
+    assert (config.index_type, config.promote_threshold, config.ef_search) == ("hnsw", 1000, 64)
+    monkeypatch.setenv("FAISS_INDEX_TYPE", "annoy")
+    with pytest.raises(ValueError, match="Unknown FAISS index type"):
+        IndexConfig.from_env()
+
+
+def test_only_a_grown_flat_index_needs_promotion():
+    index = empty_index(4)
+    index.add_with_ids(np.zeros((10, 4), dtype=np.float32), np.arange(10, dtype=np.int64))
+    assert needs_promotion(index, IndexConfig(index_type="hnsw", promote_threshold=10))
+    assert not needs_promotion(index, IndexConfig(index_type="hnsw", promote_threshold=11))
+    assert not needs_promotion(index, IndexConfig(index_type="flat", promote_threshold=10))
+    promoted = build_index(np.zeros((10, 4), dtype=np.float32), np.arange(10, dtype=np.int64),
+                           IndexConfig(index_type="hnsw"))
+    assert not needs_promotion(promoted, IndexConfig(index_type="hnsw", promote_threshold=10))
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+import doc_convert
+from bulk_ingest import ingest_folder
+from embeddings import EmbeddingClient
+from vector_store import VectorStore
+
+SECTION = "## Section {i}\n\n" + "Words about topic {i} repeated for length. " * 20 + "\n\n"
+
+
+def write_docs(doc_dir) -> None:
+    (doc_dir / "guides").mkdir(parents=True)
+    (doc_dir / ".cache").mkdir()
+    (doc_dir / "intro.md").write_text("# Intro\n\n" + "".join(SECTION.format(i=i) for i in range(3)))
+    (doc_dir / "notes.txt").write_text("Plain notes about the project.\n")
+    (doc_dir / "guides" / "setup.md").write_text("# Setup\n\nInstall the package and run it.\n")
+    (doc_dir / ".hidden.md").write_text("# Hidden\n")
+    (doc_dir / ".cache" / "skipped.md").write_text("# Skipped\n")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore(tmp_path / "index").load()
+    yield store
+    store.close()
+
+
+def chunks_of(store: VectorStore, key: str) -> list:
+    return list(store.metadata.get_many(store.metadata.ids_for_source(key)).values())
+
+
+def test_indexes_a_folder_then_skips_or_replaces_files(tmp_path, store, fake_ollama):
+    doc_dir = tmp_path / "docs"
+    write_docs(doc_dir)
+    embedder = EmbeddingClient(base_url=fake_ollama.url)
+    checkpoint = tmp_path / "checkpoint.json"
+
+    report = ingest_folder(doc_dir, store, embedder, workers=2, checkpoint_path=checkpoint)
+    assert (report["files"], report["indexed"], report["unchanged"], report["failed"]) == (3, 3, 0, 0)
+    assert report["chunks"] == store.metadata.count() == store.size
+    intro = chunks_of(store, "intro.md")
+    assert len(intro) > 1
+    assert {c["chunk_id"] for c in intro} == {f"intro_{i}" for i in range(len(intro))}
+    text = (doc_dir / "intro.md").read_text()
+    for chunk in intro:
+        assert chunk["doc"] == "intro.md"
+        assert text[chunk["start"]:chunk["end"]].strip()
+    assert [c["chunk_id"] for c in chunks_of(store, "guides/setup.md")] == ["guides/setup_0"]
+    assert checkpoint.is_file()
+
+    # Unchanged files are skipped from the checkpoint, without a worker
+    fake_ollama.requests.clear()
+    report = ingest_folder(doc_dir, store, embedder, workers=2, checkpoint_path=checkpoint)
+    assert (report["indexed"], report["unchanged"], report["chunks"]) == (0, 3, 0)
+    assert fake_ollama.requests == []
+
+    # A changed file replaces its previous chunks
+    old_ids = set(store.metadata.ids_for_source("guides/setup.md"))
+    (doc_dir / "guides" / "setup.md").write_text("# Setup\n\nUse the installer instead.\n")
+    report = ingest_folder(doc_dir, store, embedder, workers=2, checkpoint_path=checkpoint)
+    assert (report["indexed"], report["unchanged"]) == (1, 2)
+    new_ids = set(store.metadata.ids_for_source("guides/setup.md"))
+    assert new_ids and not new_ids & old_ids
+    assert "installer" in chunks_of(store, "guides/setup.md")[0]["chunk"]
+
+
+def test_touched_but_identical_file_is_only_hashed(tmp_path, store, fake_ollama):
+    doc_dir = tmp_path / "docs"
+    write_docs(doc_dir)
+    embedder = EmbeddingClient(base_url=fake_ollama.url)
+    ingest_folder(doc_dir, store, embedder, workers=1)
+
+    # Without a checkpoint every file goes to a worker, which matches its hash
+    os.utime(doc_dir / "notes.txt")
+    report = ingest_folder(doc_dir, store, embedder, workers=1)
+    assert (report["indexed"], report["unchanged"]) == (0, 3)
+
+
+class FailingConverter:
+    def convert(self, path):
+        raise ValueError("cannot read this format")
+
+
+def test_convert_document_returns_errors_and_skips_known_hashes(tmp_path, monkeypatch):
+    path = tmp_path / "report.pdf"
+    path.write_bytes(b"%PDF-1.4 not really")
+    monkeypatch.setattr(doc_convert, "_converter", FailingConverter())
+
+    result = doc_convert.convert_document(str(path), "report.pdf", None)
+    assert result["error"] == "ValueError: cannot read this format"
+    assert result["size"] == path.stat().st_size and "metadata" not in result
+
+    # A known hash is reported unchanged before the converter is needed
+    result = doc_convert.convert_document(str(path), "report.pdf", doc_convert.file_hash(path))
+    assert result["unchanged"] and "error" not in result
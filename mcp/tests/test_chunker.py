@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from chunker import (
+    EMBED_TOKEN_LIMIT, anchor_snippets, chunk_location, chunk_markdown, estimate_tokens, iter_blocks,
+    plain_line,
+)
+from html_extract import extract_text
+
+
+def sample_markdown(seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa"]
+
+    def sentence(n):
+        return " ".join(rng.choice(words) for _ in range(n)).capitalize() + "."
+
+    parts = []
+    for section in range(12):
+        parts.append(f"{'#' * rng.randint(1, 3)} Section {section}")
+        for _ in range(rng.randint(1, 4)):
+            kind = rng.random()
+            if kind < 0.5:
+                parts.append(" ".join(sentence(rng.randint(3, 30)) for _ in range(rng.randint(1, 40))))
+            elif kind < 0.7:
+                parts.append("\n".join(f"- {sentence(rng.randint(2, 12))}" for _ in range(rng.randint(2, 8))))
+            elif kind < 0.85:
+                parts.append("| a | b |\n|---|---|\n" + "\n".join(f"| {i} | {sentence(3)} |" for i in range(5)))
+            elif kind < 0.95:
+                parts.append("```python\nx = 1\n\n\ny = 2\n```")
+            else:
+                parts.append("x" * rng.randint(100, 5000))  # a blob with no breaks
+    return "\n\n".join(parts) + "\n"
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_tokens, min_tokens", [(512, 256), (64, 16), (200, 0), (40, 38)])
+def test_chunks_are_exact_ordered_slices_within_the_token_limit(seed, max_tokens, min_tokens):
+    markdown = sample_markdown(seed)
+    chunks = list(chunk_markdown(markdown, max_tokens=max_tokens, min_tokens=min_tokens))
+    assert chunks
+    previous_end = 0
+    for chunk in chunks:
+        assert markdown[chunk.start:chunk.end] == chunk.text
+        assert chunk.start >= previous_end
+        assert chunk.text == chunk.text.strip()
+        assert estimate_tokens(chunk.text) <= max_tokens
+        previous_end = chunk.end
+    # Only whitespace is left between chunks: no text is dropped
+    covered = "".join(c.text for c in chunks)
+    assert "".join(covered.split()) == "".join(markdown.split())
+
+
+def test_short_sections_share_a_chunk_and_long_ones_start_new_chunks():
+    markdown = "# A\n\nshort\n\n## B\n\nalso short\n\n# C\n\n" + "word " * 300 + "\n\n# D\n\nend"
+    chunks = list(chunk_markdown(markdown, max_tokens=512, min_tokens=256))
+    assert [c.heading for c in chunks] == ["A", "D"]
+    assert chunks[0].text.startswith("# A") and "# C" in chunks[0].text
+    assert chunks[1].text == "# D\n\nend"
+
+
+def test_fenced_code_is_one_block_across_blank_lines():
+    markdown = "intro\n\n```\na = 1\n\n# not a heading\n```\n\n- item\n  continued\n\n| x |\n| y |"
+    kinds = [(kind, markdown[start:end]) for kind, start, end in iter_blocks(markdown)]
+    assert kinds == [
+        ("text", "intro"),
+        ("code", "```\na = 1\n\n# not a heading\n```"),
+        ("list", "- item\n  continued"),
+        ("table", "| x |\n| y |"),
+    ]
+
+
+def test_oversized_block_is_split_at_sentences_first():
+    markdown = " ".join(f"Sentence number {i} is here." for i in range(100))
+    chunks = list(chunk_markdown(markdown, max_tokens=50, min_tokens=0))
+    assert len(chunks) > 1
+    assert all(c.text.endswith(".") for c in chunks)
+
+
+def test_rejects_limits_the_embedder_would_truncate():
+    with pytest.raises(ValueError, match="exceeds the embedding model limit"):
+        list(chunk_markdown("text", max_tokens=EMBED_TOKEN_LIMIT + 1))
+
+
+@pytest.mark.parametrize("line, plain", [
+    ("## The [Title](https://x.io/a) of *this* page", "The Title of this page"),
+    ("> - **bold** and `code`", "bold and code"),
+    ("| cell one | two |", "cell one"),
+    ("|---|:--:|", ""),
+    ("```python", ""),
+])
+def test_plain_line_strips_markdown_syntax(line, plain):
+    assert plain_line(line) == plain
+
+
+def test_anchors_are_the_first_and_last_words_of_the_chunk():
+    text = "# Heading\n\nOne two three four five six seven eight nine ten.\n\n- last item of the list here"
+    assert anchor_snippets(text, words=4) == ("Heading", "of the list here")
+    assert anchor_snippets("only a few words") == ("only a few words", None)
+    assert anchor_snippets("```\n```") == (None, None)
+
+
+def test_chunk_location_anchors_match_rendered_page_text():
+    html = ("<main><h1>Guide</h1><p>Install the <a href='/pkg'>package</a> with <em>pip</em> first.</p>"
+            "<ul><li>Then run the server</li><li>And open the popup window</li></ul></main>")
+    markdown = extract_text(html)
+    chunk = next(chunk_markdown(markdown))
+    location = chunk_location(chunk)
+    assert (location["start"], location["end"], location["section"]) == (chunk.start, chunk.end, "Guide")
+    assert location["anchor"] == "Guide"
+    # The text of one element each, as rendered: no markdown list marker
+    assert location["anchor_end"] == "And open the popup window"
@@ -0,0 +1,44 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache, cache_key
+from embeddings import EmbeddingClient
+
+
+def test_key_ignores_whitespace_but_not_model_or_text():
+    assert cache_key("m", "Hello   world\n") == cache_key("m", " Hello world")
+    assert cache_key("m", "Hello world") != cache_key("other", "Hello world")
+    assert cache_key("m", "Hello world") != cache_key("m", "hello world")
+
+
+def test_unchanged_chunks_are_not_embedded_again(tmp_path, fake_ollama):
+    cache = EmbeddingCache(tmp_path / "embedding_cache.db")
+    client = EmbeddingClient(base_url=fake_ollama.url, cache=cache)
+    first = client.embed_chunks(["intro", "body", "intro"])
+    # A repeated chunk is sent once
+    assert fake_ollama.requests == [("/api/embed", 2)]
+    np.testing.assert_array_equal(first[0], first[2])
+
+    fake_ollama.requests.clear()
+    second = client.embed_chunks(["intro", "edited body", "body  "])
+    assert fake_ollama.requests == [("/api/embed", 1)]
+    np.testing.assert_array_equal(second[0], first[0])
+    np.testing.assert_array_equal(second[2], first[1])
+    assert client.stats.cache_hits == 1 + 2
+    cache.close()
+
+    # The cache persists across restarts
+    fake_ollama.requests.clear()
+    reopened = EmbeddingClient(base_url=fake_ollama.url, cache=EmbeddingCache(tmp_path / "embedding_cache.db"))
+    reopened.embed_chunks(["intro", "body", "edited body"])
+    assert fake_ollama.requests == []
+
+
+def test_prunes_least_recently_used_entries(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embedding_cache.db", max_entries=600)
+    vector = np.ones(4, dtype=np.float32)
+    cache.put_many({f"old{i}": vector for i in range(500)})
+    cache.get_many(["old0"])
+    cache.put_many({f"new{i}": vector for i in range(500)})
+    assert cache.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 600
+    assert set(cache.get_many(["old0", "old1", "new499"])) == {"old0", "new499"}
+    cache.close()
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import requests
+
+from conftest import fake_embedding
+from embeddings import EmbeddingClient
+
+
+def texts(n: int) -> list:
+    return [f"chunk number {i}" for i in range(n)]
+
+
+def test_batches_requests_and_keeps_order(fake_ollama):
+    client = EmbeddingClient(base_url=fake_ollama.url, batch_size=64, max_concurrency=4)
+    embeddings = client.embed_batch(texts(150))
+    assert sorted(fake_ollama.requests) == [("/api/embed", 22), ("/api/embed", 64), ("/api/embed", 64)]
+    for text, embedding in zip(texts(150), embeddings):
+        np.testing.assert_array_equal(embedding, np.array(fake_embedding(text), dtype=np.float32))
+    assert client.stats.texts == 150 and client.stats.requests == 3
+
+
+def test_falls_back_to_single_requests_without_batch_endpoint(fake_ollama):
+    fake_ollama.batch_endpoint = False
+    client = EmbeddingClient(base_url=fake_ollama.url, max_concurrency=4)
+    embeddings = client.embed_batch(texts(10))
+    assert [path for path, _ in fake_ollama.requests] == ["/api/embeddings"] * 10
+    np.testing.assert_array_equal(embeddings[3], np.array(fake_embedding("chunk number 3"), dtype=np.float32))
+
+    # The missing endpoint is remembered instead of probed on every call
+    fake_ollama.requests.clear()
+    client.embed("again")
+    assert fake_ollama.requests == [("/api/embeddings", 1)]
+
+
+def test_api_errors_are_raised_not_mistaken_for_a_missing_endpoint(fake_ollama):
+    fake_ollama.error = 'model "nomic-embed-text" not found, try pulling it first'
+    client = EmbeddingClient(base_url=fake_ollama.url)
+    with pytest.raises(requests.HTTPError, match="not found"):
+        client.embed_batch(texts(3))
+    assert fake_ollama.requests == []
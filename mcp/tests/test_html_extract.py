@@ -0,0 +1,48 @@
+from html_extract import clean_html, extract_page_text, extract_text
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>T</title><style>p { color: red }</style></head>
+<body>
+  <header><a href="/">Site name</a></header>
+  <nav><ul><li>Home</li><li>About</li></ul></nav>
+  <main>
+    <article>
+      <header><h1>Post title</h1></header>
+      <p>First   paragraph
+         of the post.</p>
+      <ul><li>one</li><li>two</li></ul>
+      <div hidden>secret</div>
+      <script>var tracking = 1;</script>
+      <pre>keep   this
+  spacing</pre>
+    </article>
+    <aside>Related links</aside>
+  </main>
+  <footer>Copyright</footer>
+</body></html>"""
+
+
+def test_extract_text_keeps_content_and_drops_chrome():
+    text = extract_text(PAGE)
+    assert text.startswith("# Post title\n\nFirst paragraph of the post.")
+    assert "- one\n- two" in text
+    # Whitespace inside <pre> lines is kept
+    assert "keep   this\nspacing" in text
+    for chrome in ("Site name", "Home", "Related links", "Copyright", "secret", "tracking", "color"):
+        assert chrome not in text
+
+
+def test_unclosed_tags_in_skipped_regions_do_not_swallow_the_page():
+    text = extract_text("<nav><ul><li>menu<li>more</nav><p>Body text<p>Second")
+    assert text == "Body text\n\nSecond"
+
+
+def test_clean_html_removes_chrome_and_keeps_markup():
+    cleaned = clean_html(PAGE)
+    assert "<h1>Post title</h1>" in cleaned and "<li>one</li>" in cleaned
+    assert "<nav>" not in cleaned and "<script>" not in cleaned and "Copyright" not in cleaned
+
+
+def test_markitdown_mode_converts_the_cleaned_html():
+    markdown = extract_page_text(PAGE, url="https://example.com/post", mode="markitdown")
+    assert "# Post title" in markdown and "Related links" not in markdown
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from ingest_jobs import IngestJobQueue
+
+
+class BlockingWorker:
+    """Ingest worker that records its calls and holds each one until released"""
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Semaphore(0)
+        self.release = threading.Semaphore(0)
+
+    def __call__(self, url, title, html, progress):
+        self.calls.append((url, html))
+        progress("indexing", 0.5)
+        self.started.release()
+        assert self.release.acquire(timeout=10)
+        if html == "broken":
+            raise ValueError("no content")
+        return 3
+
+
+def wait_finished(queue: IngestJobQueue, job_id: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while (job := queue.get(job_id)).status not in ("done", "error"):
+        assert time.monotonic() < deadline, f"job {job_id} did not finish"
+        time.sleep(0.01)
+    return job
+
+
+def test_resubmits_while_running_coalesce_into_one_follow_up():
+    worker = BlockingWorker()
+    queue = IngestJobQueue(worker, max_workers=2)
+    first = queue.submit("https://a", "A", "v1")
+    assert worker.started.acquire(timeout=10)
+    assert queue.get(first.job_id).stage == "indexing"
+
+    second = queue.submit("https://a", "A2", "v2")
+    third = queue.submit("https://a", "A3", "v3")
+    assert third.job_id == second.job_id != first.job_id
+    assert queue.get(second.job_id).status == "queued"
+
+    worker.release.release()
+    assert worker.started.acquire(timeout=10)
+    worker.release.release()
+    assert wait_finished(queue, first.job_id).status == "done"
+    follow_up = wait_finished(queue, second.job_id)
+    assert (follow_up.status, follow_up.title, follow_up.chunks) == ("done", "A3", 3)
+    # The follow-up indexed only the latest HTML
+    assert worker.calls == [("https://a", "v1"), ("https://a", "v3")]
+    queue.shutdown(wait=True)
+
+
+def test_resubmit_updates_a_job_that_has_not_started():
+    worker = BlockingWorker()
+    queue = IngestJobQueue(worker, max_workers=1)
+    busy = queue.submit("https://busy", "", "x")
+    assert worker.started.acquire(timeout=10)
+    queued = queue.submit("https://a", "A", "v1")
+    assert queue.submit("https://a", "A", "v2").job_id == queued.job_id
+
+    for _ in range(2):
+        worker.release.release()
+    wait_finished(queue, busy.job_id)
+    assert wait_finished(queue, queued.job_id).status == "done"
+    assert worker.calls == [("https://busy", "x"), ("https://a", "v2")]
+    queue.shutdown(wait=True)
+
+
+def test_failed_job_reports_error_and_frees_the_url():
+    worker = BlockingWorker()
+    queue = IngestJobQueue(worker)
+    failed = queue.submit("https://a", "A", "broken")
+    worker.release.release()
+    job = wait_finished(queue, failed.job_id)
+    assert job.status == "error" and "no content" in job.message
+
+    retry = queue.submit("https://a", "A", "fixed")
+    assert retry.job_id != failed.job_id
+    worker.release.release()
+    assert wait_finished(queue, retry.job_id).status == "done"
+    queue.shutdown(wait=True)
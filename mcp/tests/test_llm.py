@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from google.genai import errors
+
+from llm import LLMClient, MockBackend, MockResponse
+
+
+def api_error(code: int) -> errors.APIError:
+    return errors.APIError(code, {"error": {"message": "scripted", "status": "ERROR"}})
+
+
+class FlakyBackend:
+    """Fails with the scripted errors first, then answers; tracks calls in flight"""
+
+    def __init__(self, failures=(), latency: float = 0.0):
+        self.failures = list(failures)
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.cancelled = 0
+
+    async def generate(self, prompt, config=None):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.failures:
+                raise self.failures.pop(0)
+            return MockResponse(f"answer to {prompt}")
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+
+def test_retries_rate_limits_and_server_errors():
+    backend = FlakyBackend([api_error(429), api_error(503)])
+    client = LLMClient(backend=backend, max_retries=2, backoff=0.001)
+    assert asyncio.run(client.generate("q")).text == "answer to q"
+    assert backend.calls == 3
+
+
+@pytest.mark.parametrize("failures, calls", [
+    ([api_error(400)], 1),                                  # not retryable
+    ([api_error(500), api_error(500), api_error(500)], 3),  # retries exhausted
+])
+def test_gives_up_on_client_errors_and_after_max_retries(failures, calls):
+    backend = FlakyBackend(failures)
+    client = LLMClient(backend=backend, max_retries=2, backoff=0.001)
+    with pytest.raises(errors.APIError):
+        asyncio.run(client.generate("q"))
+    assert backend.calls == calls
+
+
+def test_bounds_calls_in_flight():
+    backend = FlakyBackend(latency=0.02)
+    client = LLMClient(backend=backend, max_concurrency=3)
+
+    async def run():
+        return await asyncio.gather(*(client.generate(f"q{i}") for i in range(10)))
+
+    assert [r.text for r in asyncio.run(run())] == [f"answer to q{i}" for i in range(10)]
+    assert backend.peak == 3
+
+
+def test_timeout_cancels_the_request():
+    backend = FlakyBackend(latency=5)
+    client = LLMClient(backend=backend)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(client.generate("q", timeout=0.05))
+    assert backend.cancelled == 1 and backend.in_flight == 0
+
+
+def test_streams_text_and_bounds_the_whole_stream():
+    client = LLMClient(backend=MockBackend(latency=0.01))
+
+    async def collect(timeout):
+        return [text async for text in client.stream("plan", timeout=timeout)]
+
+    assert "".join(asyncio.run(collect(5))) == "FINAL_ANSWER: [mock]"
+    client = LLMClient(backend=MockBackend(latency=1.0))
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(collect(0.1))
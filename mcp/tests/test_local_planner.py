@@ -0,0 +1,116 @@
+import asyncio
+import math
+
+import pytest
+from mcp.server.fastmcp import FastMCP
+
+import local_planner
+from data_model import (
+    AddInput, AddOutput, FactorialInput, FactorialOutput, MultiplyInput, MultiplyOutput,
+    PowerInput, PowerOutput, SubtractInput, SubtractOutput,
+)
+from local_planner import Unplannable, extract_expression, parse_expression, plan_locally
+from local_tools import LocalToolSession
+
+
+@pytest.mark.parametrize("query, expression", [
+    ("What is (2+3)*4 - 5!?", "(2+3)*4 - factorial(5)"),
+    ("calculate 2^10", "2**10"),
+    ("6 × 7 ÷ 3 =", "6 * 7 / 3"),
+    ("what is 10-3", "10-3"),
+    ("sqrt(16) + 1", "sqrt(16) + 1"),
+])
+def test_extracts_arithmetic_from_queries(query, expression):
+    assert extract_expression(query) == expression
+
+
+@pytest.mark.parametrize("query", [
+    "2024-10-18",            # date
+    "555-123-4567",          # phone number
+    "978/3/16/148410",       # id with slashes
+    "10-3",                  # score or range without an explicit "what is"
+    "3/4",                   # fraction
+    "42",                    # just a number
+    "What is the capital of France?",
+    "",
+])
+def test_leaves_non_arithmetic_queries_to_the_llm(query):
+    assert extract_expression(query) is None
+
+
+def test_parses_whitelisted_syntax():
+    parse_expression("-(2 + 3) * 4 % 3 - factorial(5) + sqrt(16) ** 2 / 1.5")
+
+
+@pytest.mark.parametrize("expression, error", [
+    ("__import__('os')", "unsupported function call"),
+    ("print(1)", "unsupported function call"),
+    ("sqrt(4, 5)", "unsupported function call"),
+    ("sqrt(a=4)", "unsupported function call"),
+    ("math.sqrt(4)", "unsupported function call"),
+    ("x + 1", "unknown name 'x'"),
+    ("sqrt + 1", "unknown name 'sqrt'"),
+    ("2 << 3", "unsupported operator LShift"),
+    ("7 // 2", "unsupported operator FloorDiv"),
+    ("~2", "unsupported unary operator"),
+    ("'a' * 3", "non-numeric constant"),
+    ("True + 1", "non-numeric constant"),
+    ("2 < 3", "unsupported syntax Compare"),
+    ("[1, 2]", "unsupported syntax List"),
+    ("(lambda: 1)()", "unsupported function call"),
+    ("1 if 2 else 3", "unsupported syntax IfExp"),
+    ("2 +", "not an expression"),
+    ("+".join(["1"] * 30), "expression too large"),
+])
+def test_rejects_everything_outside_the_whitelist(expression, error):
+    with pytest.raises(Unplannable, match=error):
+        parse_expression(expression)
+
+
+def calculator() -> FastMCP:
+    server = FastMCP("calculator")
+
+    @server.tool()
+    def add(input: AddInput) -> AddOutput:
+        return AddOutput(result=input.a + input.b)
+
+    @server.tool()
+    def subtract(input: SubtractInput) -> SubtractOutput:
+        return SubtractOutput(result=input.a - input.b)
+
+    @server.tool()
+    def multiply(input: MultiplyInput) -> MultiplyOutput:
+        return MultiplyOutput(result=input.a * input.b)
+
+    @server.tool()
+    def power(input: PowerInput) -> PowerOutput:
+        return PowerOutput(result=int(input.a ** input.b))
+
+    @server.tool()
+    def factorial(input: FactorialInput) -> FactorialOutput:
+        return FactorialOutput(result=math.factorial(input.a))
+
+    return server
+
+
+def plan(query: str):
+    async def run():
+        session = LocalToolSession(calculator())
+        return await plan_locally(query, session, await session.catalog())
+    return asyncio.run(run())
+
+
+def test_answers_arithmetic_with_the_tools():
+    assert plan("What is (2+3)*4 - 5!?") == "FINAL_ANSWER: [-100]"
+    assert plan("calculate 2^10 - -3") == "FINAL_ANSWER: [1027]"
+
+
+def test_falls_back_to_the_llm_when_it_cannot_finish():
+    assert plan("what is 7 / 2") is None       # no divide tool registered
+    assert plan("what is 2 ^ 5000") is None    # exponent out of range
+    assert plan("What is 2024-10-18?") is None
+
+
+def test_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(local_planner, "ENABLED", False)
+    assert plan("What is 2+3?") is None
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+from mcp import types
+from mcp.server.fastmcp import FastMCP
+
+from action import execute_tool
+from data_model import AddInput, AddOutput, DivideInput, DivideOutput
+from local_tools import LocalToolSession
+
+
+def calculator() -> FastMCP:
+    server = FastMCP("calculator")
+
+    @server.tool()
+    def add(input: AddInput) -> AddOutput:
+        """Add two numbers"""
+        return AddOutput(result=input.a + input.b)
+
+    @server.tool()
+    def divide(input: DivideInput) -> DivideOutput:
+        """Divide two numbers"""
+        return DivideOutput(result=input.a / input.b)
+
+    return server
+
+
+def test_calls_tools_in_process_with_client_session_results():
+    async def run():
+        session = LocalToolSession(calculator())
+        assert [t.name for t in (await session.list_tools()).tools] == ["add", "divide"]
+        result = await session.call_tool("add", {"input": {"a": 2, "b": "3"}})
+        assert isinstance(result, types.CallToolResult) and not result.isError
+        assert json.loads(result.content[0].text) == {"result": 5}
+        assert isinstance(await session.send_ping(), types.EmptyResult)
+
+    asyncio.run(run())
+
+
+def test_tool_errors_come_back_as_error_results():
+    async def run():
+        session = LocalToolSession(calculator())
+        result = await session.call_tool("divide", {"input": {"a": 1, "b": 0}})
+        assert result.isError
+        assert "division by zero" in result.content[0].text
+
+    asyncio.run(run())
+
+
+def test_agent_executes_plans_through_the_local_session():
+    async def run():
+        session = LocalToolSession(calculator())
+        catalog = await session.catalog()
+        assert await session.catalog() is catalog
+        result = await execute_tool(session, catalog, 'FUNCTION_CALL: {"func_name": "add", "param": {"input": {"a": 4, "b": 5}}}')
+        assert result.tool_name == "add" and json.loads(result.result[0]) == {"result": 9}
+
+    asyncio.run(run())
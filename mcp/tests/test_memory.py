@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import numpy as np
+
+from memory import MemoryItem, MemoryManager, SessionMemoryStore
+
+TOPICS = ["india", "saturn", "island", "language"]
+
+
+class TopicEmbedder:
+    """Embeds a text as counts of a few topic words, and counts what it was asked to embed"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.embedded = []
+
+    def embed_chunks(self, texts):
+        if self.fail:
+            raise ConnectionError("embedder down")
+        self.embedded.extend(texts)
+        vectors = []
+        for text in texts:
+            counts = [text.lower().count(t) for t in TOPICS]
+            # Texts about none of the topics point their own way
+            vectors.append(np.array(counts + [0 if any(counts) else 1], dtype=np.float32))
+        return vectors
+
+
+def recall(memory: MemoryManager, query: str, session_id=None):
+    return [item.text for item in asyncio.run(memory.recall(query, session_id=session_id))]
+
+
+def test_recall_ranks_by_similarity_and_embeds_each_item_once():
+    embedder = TopicEmbedder()
+    memory = MemoryManager(embedder=embedder, top_k=2, min_score=0.5)
+    for text in ["Saturn has rings", "Capital of India is Delhi", "Singapore is an island", "India has many a language"]:
+        memory.store(MemoryItem(text=text))
+
+    assert recall(memory, "facts about india") == ["Capital of India is Delhi", "India has many a language"]
+    assert len(embedder.embedded) == 5
+    # Only the new item and the query are embedded on the next recall
+    memory.store(MemoryItem(text="Saturn is a planet"))
+    assert recall(memory, "tell me about saturn") == ["Saturn has rings", "Saturn is a planet"]
+    assert embedder.embedded[5:] == ["tell me about saturn", "Saturn is a planet"]
+    # Nothing similar enough: nothing recalled
+    assert recall(memory, "weather today") == []
+
+
+def test_recall_only_sees_the_session_and_shared_items():
+    memory = MemoryManager(embedder=TopicEmbedder(), top_k=5, min_score=0.1)
+    memory.store(MemoryItem(text="India fact for alice", session_id="alice"))
+    memory.store(MemoryItem(text="India fact for bob", session_id="bob"))
+    memory.store(MemoryItem(text="Shared India fact"))
+    assert sorted(recall(memory, "india", session_id="alice")) == ["India fact for alice", "Shared India fact"]
+
+
+def test_falls_back_to_keywords_when_the_embedder_is_down():
+    memory = MemoryManager(embedder=TopicEmbedder(fail=True), top_k=2)
+    memory.store(MemoryItem(text="Saturn has rings"))
+    memory.store(MemoryItem(text="Saturn rings are ice"))
+    memory.store(MemoryItem(text="Delhi is in India"))
+    assert recall(memory, "Saturn rings?") == ["Saturn rings are ice", "Saturn has rings"]
+
+
+def test_evicts_oldest_session_items_before_shared_ones():
+    memory = MemoryManager(embedder=TopicEmbedder(), max_items=3)
+    memory.store(MemoryItem(text="shared"))
+    for i in range(4):
+        memory.store(MemoryItem(text=f"s{i}", session_id="s"))
+    assert [item.text for item in memory.facts] == ["shared", "s2", "s3"]
+
+
+def test_sessions_persist_under_hashed_file_names(tmp_path):
+    sessions = SessionMemoryStore(persist_dir=tmp_path)
+    sessions.get("../../etc/passwd").store(MemoryItem(text="fact", session_id="../../etc/passwd"))
+    sessions.get("bob").store(MemoryItem(text="bob fact", session_id="bob"))
+    sessions.save()
+    files = sorted(p.name for p in tmp_path.glob("*.json"))
+    assert len(files) == 2 and all(len(name) == len("0" * 64 + ".json") for name in files)
+
+    restarted = SessionMemoryStore(persist_dir=tmp_path)
+    assert [item.text for item in restarted.get("../../etc/passwd").facts] == ["fact"]
+    assert [item.text for item in restarted.get("bob").facts] == ["bob fact"]
+
+
+def test_sessions_are_bounded_and_dropped_ones_are_saved(tmp_path):
+    sessions = SessionMemoryStore(persist_dir=tmp_path, max_sessions=2, session_ttl=60, max_items=2)
+    for sid in ("a", "b", "c"):
+        memory = sessions.get(sid)
+        for i in range(3):
+            memory.store(MemoryItem(text=f"{sid}{i}", session_id=sid))
+    # "a" was the least recently used
+    assert list(sessions._sessions) == ["b", "c"]
+    assert [item.text for item in sessions.get("a").facts] == ["a1", "a2"]
+
+    sessions._last_used["b"] = time.time() - 61
+    sessions.get("c")
+    assert "b" not in sessions._sessions
+    assert [item.text for item in sessions.get("b").facts] == ["b1", "b2"]
+
+
+def test_unreadable_session_file_starts_empty(tmp_path):
+    sessions = SessionMemoryStore(persist_dir=tmp_path)
+    sessions._path("s").write_text("{not json")
+    assert sessions.get("s").facts == []
+
+
+def test_nothing_is_written_until_a_session_is_used(tmp_path):
+    sessions = SessionMemoryStore(persist_dir=tmp_path / "memory")
+    sessions.save()
+    assert not (tmp_path / "memory").exists()
+    sessions.get("s")
+    assert (tmp_path / "memory" / "memory_embeddings.db").exists()
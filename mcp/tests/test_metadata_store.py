@@ -0,0 +1,107 @@
+import json
+
+import numpy as np
+
+from metadata_store import MetadataStore
+
+
+def vectors(n: int) -> np.ndarray:
+    return np.arange(n * 4, dtype=np.float32).reshape(n, 4)
+
+
+def test_rows_round_trip_with_extra_fields(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    items = [
+        {"url": "https://a", "title": "A", "chunk": "first", "chunk_id": "a_0", "start": 0, "end": 5},
+        {"doc": "notes.pdf", "chunk": "second", "anchor": {"prefix": "x"}},
+    ]
+    ids = store.commit(items, vectors(2), key="https://a", content_hash="h1")
+    assert ids == [0, 1]
+    assert store.get_many([1, 0, 7]) == {0: items[0], 1: items[1]}
+    assert store.get_hash("https://a") == "h1"
+    store.close()
+
+    reopened = MetadataStore(tmp_path / "metadata.db")
+    assert reopened.count() == 2
+    assert reopened.get_many([0])[0]["end"] == 5
+    reopened.close()
+
+
+def test_deleted_ids_are_never_reused(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    store.commit([{"url": "a", "chunk": "1"}, {"url": "a", "chunk": "2"}], vectors(2), key="a", content_hash="h")
+    store.commit([{"url": "b", "chunk": "3"}], vectors(1))
+    assert store.delete_source("a") == [0, 1]
+    assert store.get_hash("a") is None
+    assert store.commit([{"url": "a", "chunk": "4"}], vectors(1)) == [3]
+    assert store.deleted_ids()[0] == [0, 1]
+    store.close()
+
+
+def test_migrates_legacy_json_files(tmp_path):
+    metadata_file = tmp_path / "metadata.json"
+    cache_file = tmp_path / "doc_index_cache.json"
+    metadata_file.write_text(json.dumps([{"url": "u", "chunk": "old"}, {"doc": "d.md", "chunk": "older"}]))
+    cache_file.write_text(json.dumps({"u": "hash-u"}))
+
+    store = MetadataStore(tmp_path / "metadata.db")
+    store.migrate_json(metadata_file, cache_file)
+    assert store.get_many([0, 1]) == {0: {"url": "u", "chunk": "old"}, 1: {"doc": "d.md", "chunk": "older"}}
+    assert store.get_hash("u") == "hash-u"
+    assert store.next_id() == 2
+    assert not metadata_file.exists() and (tmp_path / "metadata.json.migrated").exists()
+    store.close()
+
+
+def matches(store: MetadataStore, query: str) -> list:
+    return [chunk_id for chunk_id, _ in store.lexical_search(query, k=10)]
+
+
+def test_keyword_index_follows_inserts_deletes_and_replacements(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    ids = store.commit([
+        {"url": "https://a", "title": "Cricket", "chunk": "Sachin Tendulkar scored 100 centuries"},
+        {"url": "https://a", "title": "Cricket", "chunk": "The Ashes series"},
+    ], vectors(2), key="https://a")
+    other = store.commit([{"url": "https://b", "title": "Space", "chunk": "Saturn has rings"}], vectors(1))
+    assert matches(store, "tendulkar") == [ids[0]]
+    # Title matches count too, and every row of the page has it
+    assert sorted(matches(store, "cricket")) == ids
+
+    new = store.commit([{"url": "https://a", "title": "Cricket", "chunk": "Virat Kohli"}], vectors(1),
+                       key="https://a", replace_ids=ids)
+    assert matches(store, "tendulkar") == []
+    assert matches(store, "kohli") == new
+    store.delete_source("https://b")
+    assert matches(store, "saturn") == [] and other[0] not in matches(store, "rings")
+    store.close()
+
+
+def test_keyword_search_ranks_and_takes_queries_literally(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    ids = store.commit([
+        {"chunk": "python python python snake"},
+        {"chunk": "python language"},
+        {"chunk": "unrelated text"},
+    ], vectors(3))
+    hits = store.lexical_search("Python?", k=5)
+    assert [i for i, _ in hits] == ids[:2] and hits[0][1] > hits[1][1] > 0
+    # FTS5 syntax in user input is not interpreted
+    assert sorted(matches(store, 'snake" OR text NEAR(')) == [ids[0], ids[2]]
+    assert store.lexical_search("?!", k=5) == []
+    store.close()
+
+
+def test_keyword_index_is_built_for_databases_that_predate_it(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    store.commit([{"chunk": "legacy row about tigers"}], vectors(1))
+    # As if the FTS table had been added after the rows were written
+    with store.conn:
+        store.conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('delete-all')")
+        store.conn.execute("DELETE FROM store_meta WHERE key = 'fts_built'")
+    assert matches(store, "tigers") == []
+    store.close()
+
+    reopened = MetadataStore(tmp_path / "metadata.db")
+    assert matches(reopened, "tigers") == [0]
+    reopened.close()
@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+
+from query_cache import LRUCache, QueryCache
+
+
+def test_lru_evicts_least_recently_used_and_expires_entries(monkeypatch):
+    cache = LRUCache(max_size=2, ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+    later = time.time() + 11
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.get("a") is None
+    assert len(cache) == 1
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_result_keys_change_with_the_store_version():
+    cache = QueryCache("unused.npz")
+    key = cache.result_key("  apple   pie ", 3, k=5, mode="vector")
+    cache.put_results(key, {"results": ["r"]})
+    assert cache.get_results(cache.result_key("apple pie", 3, mode="vector", k=5)) == {"results": ["r"]}
+    assert cache.get_results(cache.result_key("apple pie", 4, mode="vector", k=5)) is None
+    assert cache.get_results(cache.result_key("apple pie", 3, mode="vector", k=10)) is None
+
+
+def test_query_embeddings_persist_across_restarts(tmp_path):
+    path = tmp_path / "query_cache.npz"
+    cache = QueryCache(path, save_every=2)
+    cache.put_embedding("first query", np.ones(4))
+    assert not path.exists()
+    cache.put_embedding("second  query", np.zeros(4))
+    assert path.exists()
+    cache.embeddings.put("expired", np.ones(4, dtype=np.float32), expires_at=time.time() - 1)
+    cache.save()
+
+    restored = QueryCache(path).load()
+    np.testing.assert_array_equal(restored.get_embedding("first query"), np.ones(4))
+    np.testing.assert_array_equal(restored.get_embedding("second query"), np.zeros(4))
+    assert len(restored.embeddings) == 2
+
+
+def test_unreadable_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "query_cache.npz"
+    path.write_bytes(b"not an npz file")
+    assert len(QueryCache(path).load().embeddings) == 0
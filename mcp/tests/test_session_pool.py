@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import session_pool
+from session_pool import MCPSessionPool
+
+
+class FakeSession:
+    """Stands in for PooledSession: no SSE server, scripted ping answers"""
+
+    opened = []
+
+    def __init__(self, url):
+        self.url = url
+        self.session = object()
+        self.catalog = None
+        self.suspect = False
+        self.last_used = 0.0
+        self.alive = True
+        self.pings = 0
+
+    @property
+    def closed(self):
+        return not self.alive
+
+    async def open(self, timeout):
+        FakeSession.opened.append(self)
+        return self
+
+    async def ping(self, timeout):
+        self.pings += 1
+        return self.alive
+
+    async def close(self):
+        self.alive = False
+
+
+@pytest.fixture
+def fake_sessions(monkeypatch):
+    FakeSession.opened = []
+    monkeypatch.setattr(session_pool, "PooledSession", FakeSession)
+    return FakeSession.opened
+
+
+def test_sessions_are_reused_and_bounded(fake_sessions):
+    async def run():
+        pool = MCPSessionPool("http://mcp/sse", max_size=2)
+        async with pool.session() as first:
+            pass
+        async with pool.session() as again:
+            assert again is first
+
+        entered = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hold():
+            async with pool.session() as conn:
+                entered.set()
+                await release.wait()
+                return conn
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await entered.wait()
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        # Both sessions are checked out: the third query waits instead of connecting
+        assert len(fake_sessions) == 2 and not waiter.done()
+        release.set()
+        conns = await asyncio.gather(*holders, waiter)
+        assert conns[2] in conns[:2]
+        await pool.close()
+        assert all(conn.closed for conn in fake_sessions)
+
+    asyncio.run(run())
+
+
+def test_session_of_a_failed_query_is_checked_and_replaced(fake_sessions):
+    async def run():
+        pool = MCPSessionPool("http://mcp/sse", max_size=1)
+        with pytest.raises(ConnectionError):
+            async with pool.session() as broken:
+                broken.alive = False
+                raise ConnectionError("stream closed")
+        async with pool.session() as conn:
+            assert conn is not broken
+        assert len(fake_sessions) == 2
+
+        # A healthy session of a failed query is pinged once, then reused
+        with pytest.raises(ValueError):
+            async with pool.session():
+                raise ValueError("tool error")
+        async with pool.session() as reused:
+            assert reused is conn and reused.pings == 1 and not reused.suspect
+        await pool.close()
+
+    asyncio.run(run())
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+
+import llm
+from memory import MemoryItem
+from perception import PerceptionResult
+from step_pipeline import plan_step
+
+PLAN = 'FUNCTION_CALL: {"func_name":"add","param":{"input":{"a":2,"b":3}}}'
+
+
+class ScriptedBackend:
+    """LLM backend answering perception and planning prompts, recording every call"""
+
+    def __init__(self, plan: str = PLAN):
+        self.plan = plan
+        self.calls = []
+        self.perception_started = asyncio.Event()
+        self.recall_started = None
+
+    def reply(self, prompt, config):
+        if config and config.get("response_schema"):
+            self.calls.append("fused")
+            return json.dumps({"objective": "add numbers", "objects": ["2", "3"], "tool_hint": "add",
+                               "action": self.plan})
+        if "extracts structured facts" in prompt:
+            self.calls.append("perception")
+            return str({"objective": "add numbers", "objects": ["2", "3"], "tool_hint": "add"})
+        self.calls.append("plan")
+        return "Let me think.\n" + self.plan
+
+    async def generate(self, prompt, config=None):
+        text = self.reply(prompt, config)
+        if self.calls[-1] == "perception" and self.recall_started is not None:
+            self.perception_started.set()
+            # Only finishes if recall runs at the same time
+            await asyncio.wait_for(self.recall_started.wait(), timeout=2)
+        return llm.MockResponse(text)
+
+    async def stream(self, prompt, config=None):
+        text = self.reply(prompt, config)
+        for i in range(0, len(text), 5):
+            yield llm.MockResponse(text[i:i + 5])
+
+
+class FakeMemory:
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.queries = []
+
+    async def recall(self, query, session_id=None):
+        self.queries.append((query, session_id))
+        if self.backend is not None and self.backend.recall_started is not None:
+            self.backend.recall_started.set()
+            await asyncio.wait_for(self.backend.perception_started.wait(), timeout=2)
+        return [MemoryItem(text="the user likes sums")]
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = ScriptedBackend()
+    monkeypatch.setattr(llm, "_llm", llm.LLMClient(backend=backend))
+    return backend
+
+
+def test_perception_and_recall_run_concurrently(backend):
+    async def run():
+        backend.recall_started = asyncio.Event()
+        memory = FakeMemory(backend)
+        return await plan_step("What is 2+3?", memory, session_id="s1"), memory
+
+    step, memory = asyncio.run(run())
+    assert step.plan == PLAN
+    assert step.perception.objective == "add numbers"
+    assert [m.text for m in step.memories] == ["the user likes sums"]
+    assert memory.queries == [("What is 2+3?", "s1")]
+    assert backend.calls == ["perception", "plan"]
+    assert {"perception", "recall", "perceive+recall", "plan"} <= step.timings.keys()
+
+
+def test_tool_result_step_reuses_the_previous_perception(backend):
+    previous = PerceptionResult(user_input="What is 2+3?", objective="add numbers", objects=["2", "3"], tool_hint="add")
+    step = asyncio.run(plan_step("Result is 5. What next?", FakeMemory(), previous_perception=previous))
+    assert backend.calls == ["plan"]
+    assert step.perception.user_input == "Result is 5. What next?"
+    assert step.perception.objective == "add numbers"
+    assert "perception" not in step.timings
+
+
+def test_fused_mode_perceives_and_plans_in_one_call(backend):
+    step = asyncio.run(plan_step("What is 2+3?", FakeMemory(), mode="fused"))
+    assert backend.calls == ["fused"]
+    assert step.plan == PLAN
+    assert (step.perception.user_input, step.perception.tool_hint) == ("What is 2+3?", "add")
+    assert set(step.timings) == {"recall", "decide"}
+
+
+def test_fused_mode_answers_unknown_on_malformed_output(backend, monkeypatch):
+    monkeypatch.setattr(backend, "reply", lambda prompt, config: backend.calls.append("fused") or "not json")
+    step = asyncio.run(plan_step("What is 2+3?", FakeMemory(), mode="fused"))
+    assert step.plan == "FINAL_ANSWER: [unknown]"
+    assert step.perception.objects == []
+
+
+def test_unknown_mode_is_rejected(backend):
+    with pytest.raises(ValueError, match="Unknown decision mode"):
+        asyncio.run(plan_step("What is 2+3?", FakeMemory(), mode="turbo"))
+    assert backend.calls == []
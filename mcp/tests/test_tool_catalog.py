@@ -0,0 +1,66 @@
+import asyncio
+import re
+from typing import List, Optional
+
+import pytest
+from mcp.server.fastmcp import FastMCP
+
+from data_model import AddInput, AddListInput
+from tool_catalog import ToolCatalog, get_catalog
+
+
+def server_tools():
+    """Tool list as the MCP server advertises it, schemas generated by FastMCP"""
+    server = FastMCP("test")
+
+    @server.tool()
+    def add(input: AddInput) -> int:
+        """Add two numbers"""
+
+    @server.tool()
+    def add_list(input: AddListInput) -> int:
+        """Add all numbers in a list"""
+
+    @server.tool()
+    def search_documents(query: str, k: int = 5, tags: Optional[List[str]] = None) -> str:
+        """Search documents"""
+
+    return asyncio.run(server.list_tools())
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return ToolCatalog(server_tools())
+
+
+def test_accepts_arguments_matching_the_schema(catalog):
+    catalog.validate("add", {"input": {"a": 1, "b": 2}})
+    # The server coerces in pydantic's lax mode, so numeric strings pass too
+    catalog.validate("add", {"input": {"a": "3", "b": 4.0}})
+    catalog.validate("add_list", {"input": {"l": [1, 2, 3]}})
+    catalog.validate("search_documents", {"query": "q"})
+    catalog.validate("search_documents", {"query": "q", "k": 3, "tags": None})
+
+
+@pytest.mark.parametrize("name, arguments, error", [
+    ("multiply", {}, "not found"),
+    ("add", {}, "add.input: missing required parameter"),
+    ("add", {"input": {"a": 1}}, "add.input.b: missing required parameter"),
+    ("add", {"input": {"a": 1.5, "b": 2}}, "add.input.a: expected integer, got float"),
+    ("add", {"input": {"a": True, "b": 2}}, "add.input.a: expected integer, got bool"),
+    ("add_list", {"input": {"l": [1, "x"]}}, "add_list.input.l[1]: expected integer"),
+    ("add_list", {"input": {"l": 3}}, "add_list.input.l: expected array"),
+    ("search_documents", {"query": 5}, "search_documents.query: expected string"),
+    ("search_documents", {"query": "q", "tags": "a"}, "search_documents.tags: does not match any allowed type"),
+])
+def test_rejects_invalid_arguments(catalog, name, arguments, error):
+    with pytest.raises(ValueError, match=re.escape(error)):
+        catalog.validate(name, arguments)
+
+
+def test_description_and_shared_catalog_are_built_once():
+    tools = server_tools()
+    catalog = get_catalog(tools)
+    assert catalog.description.splitlines()[0] == "1. add(input: AddInput(a:integer, b:integer)) - Add two numbers"
+    assert get_catalog(server_tools()) is catalog
+    assert get_catalog(tools[:1]) is not catalog
@@ -0,0 +1,223 @@
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from ann_index import IndexConfig, build_index, index_ids
+from vector_store import VectorStore
+
+DIM = 32
+PAGES = 30
+CHUNKS_PER_PAGE = 100
+
+
+def page_vectors(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((PAGES * CHUNKS_PER_PAGE, DIM), dtype=np.float32)
+
+
+def add_pages(store: VectorStore, vectors: np.ndarray) -> None:
+    for page in range(PAGES):
+        rows = vectors[page * CHUNKS_PER_PAGE:(page + 1) * CHUNKS_PER_PAGE]
+        metadata = [{"url": f"page{page}", "chunk": f"chunk {page}.{i}"} for i in range(len(rows))]
+        store.add(list(rows), metadata, key=f"page{page}", content_hash=f"hash{page}", replace=True)
+
+
+def wait_for_promotion(store: VectorStore, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while store._promoting or store.index.ntotal < PAGES * CHUNKS_PER_PAGE:
+        assert time.monotonic() < deadline, "index promotion did not finish"
+        time.sleep(0.05)
+
+
+def top_urls(store: VectorStore, vector: np.ndarray, k: int = 3) -> list:
+    return [r["metadata"]["url"] for r in store.search(vector, k=k)]
+
+
+def assert_index_matches_rows(store: VectorStore) -> None:
+    rows = {r[0] for r in store.metadata.conn.execute("SELECT id FROM chunks")}
+    assert set(index_ids(store.index).tolist()) - store.tombstones == rows
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_pq"])
+def test_ivf_delete_twice_search_and_vacuum(tmp_path, index_type):
+    config = IndexConfig(index_type=index_type, promote_threshold=2000, nlist=16, nprobe=16, pq_m=8, pq_bits=4)
+    vectors = page_vectors()
+    store = VectorStore(tmp_path, index_config=config).load()
+    add_pages(store, vectors)
+    wait_for_promotion(store)
+    assert isinstance(store.index, faiss.IndexIVF)
+
+    # Each removal used to desync IndexIDMap2 from the IVF lists; the second aborted the process
+    assert store.delete("page10") == CHUNKS_PER_PAGE
+    assert store.delete("page11") == CHUNKS_PER_PAGE
+    for page in (25, 5, 29):
+        assert top_urls(store, vectors[page * CHUNKS_PER_PAGE + 7])[0] == f"page{page}"
+    assert "page10" not in top_urls(store, vectors[10 * CHUNKS_PER_PAGE])
+    assert_index_matches_rows(store)
+
+    # Replacing a page removes from the IVF index too
+    replacement = np.random.default_rng(1).random((5, DIM), dtype=np.float32)
+    store.add(list(replacement), [{"url": "page3", "chunk": "new"}] * 5, key="page3", replace=True)
+    assert top_urls(store, replacement[0])[0] == "page3"
+    assert store.size == (PAGES - 2) * CHUNKS_PER_PAGE - CHUNKS_PER_PAGE + 5
+
+    store.vacuum()
+    assert top_urls(store, vectors[25 * CHUNKS_PER_PAGE + 7])[0] == "page25"
+    assert_index_matches_rows(store)
+    store.close()
+
+    reloaded = VectorStore(tmp_path, index_config=config).load()
+    assert isinstance(reloaded.index, faiss.IndexIVF)
+    assert reloaded.size == store.size
+    assert top_urls(reloaded, vectors[25 * CHUNKS_PER_PAGE + 7])[0] == "page25"
+    reloaded.delete("page25")
+    assert "page25" not in top_urls(reloaded, vectors[25 * CHUNKS_PER_PAGE + 7])
+    reloaded.close()
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf_pq"])
+def test_rebuilds_train_on_full_precision_vectors(tmp_path, monkeypatch, index_type):
+    import vector_store
+
+    trained = []
+
+    def recording_build_index(vectors, ids, config):
+        trained.append((ids.copy(), vectors.copy()))
+        return build_index(vectors, ids, config)
+
+    monkeypatch.setattr(vector_store, "build_index", recording_build_index)
+    config = IndexConfig(index_type=index_type, promote_threshold=2000, nlist=16, nprobe=16, pq_m=8, pq_bits=4)
+    vectors = page_vectors()
+    store = VectorStore(tmp_path, index_config=config, vacuum_ratio=0.0).load()
+    add_pages(store, vectors)
+    wait_for_promotion(store)
+    store.delete("page4")
+    # HNSW cannot remove vectors: they stay as tombstones until vacuum; IVF removes them at once
+    assert bool(store.tombstones) == (index_type == "hnsw")
+    if not store.tombstones:
+        # Nothing for vacuum to rebuild on IVF otherwise
+        store.tombstones.add(int(index_ids(store.index)[0]))
+    store.vacuum()
+    store.delete("page5")
+    assert bool(store.tombstones) == (index_type == "hnsw")
+
+    assert len(trained) == 2  # promotion and vacuum
+    for ids, used in trained:
+        # Chunk ids are allocated in insertion order, so id i holds vectors[i]
+        np.testing.assert_array_equal(used, vectors[ids])
+    store.close()
+
+
+def test_vector_scores_are_squared_l2_distances(tmp_path):
+    store = VectorStore(tmp_path).load()
+    vectors = np.array([[0, 0], [3, 4], [1, 0]], dtype=np.float32)
+    store.add(list(vectors), [{"url": f"u{i}", "chunk": str(i)} for i in range(3)])
+    results = store.search(np.array([0, 0], dtype=np.float32), k=3)
+    assert [r["score_type"] for r in results] == ["squared_l2_distance"] * 3
+    assert [r["score"] for r in results] == [0.0, 1.0, 25.0]
+    assert [r["metadata"]["url"] for r in results] == ["u0", "u2", "u1"]
+    store.close()
+
+
+def test_store_stays_resident_and_reloads_from_disk(tmp_path):
+    vectors = page_vectors()[:300]
+    store = VectorStore(tmp_path).load()
+    store.add(list(vectors[:200]), [{"url": "a", "chunk": str(i)} for i in range(200)], key="a")
+    index = store.index
+    store.add(list(vectors[200:]), [{"url": "b", "chunk": str(i)} for i in range(100)], key="b")
+    # Loading again is a no-op, and searches use the in-memory index
+    assert store.load() is store and store.index is index
+    assert store.search(vectors[250], k=1)[0]["metadata"] == {"url": "b", "chunk": "50"}
+    store.close()
+
+    reloaded = VectorStore(tmp_path).load()
+    assert reloaded.size == 300
+    assert reloaded.search(vectors[7], k=1)[0]["metadata"] == {"url": "a", "chunk": "7"}
+    reloaded.close()
+
+
+def crash(store: VectorStore) -> None:
+    """Drop a store without the final snapshot close() would write"""
+    store._stop.set()
+    store.metadata.close()
+
+
+def test_replays_logged_adds_and_deletes_after_a_crash(tmp_path):
+    vectors = page_vectors()[:30]
+    store = VectorStore(tmp_path).load()
+    store.add(list(vectors[:10]), [{"url": "a", "chunk": str(i)} for i in range(10)], key="a")
+    store.save()
+    snapshot = (tmp_path / "index.bin").read_bytes()
+    store.add(list(vectors[10:30]), [{"url": "b", "chunk": str(i)} for i in range(20)], key="b")
+    store.delete("a")
+    crash(store)
+    # Neither change reached the snapshot
+    assert (tmp_path / "index.bin").read_bytes() == snapshot
+    # A snapshot write torn by the crash is ignored
+    (tmp_path / "index.bin.tmp").write_bytes(b"partial")
+
+    reloaded = VectorStore(tmp_path).load()
+    assert reloaded.size == 20
+    assert top_urls(reloaded, vectors[3], k=20) == ["b"] * 20
+    assert reloaded.search(vectors[15], k=1)[0]["metadata"] == {"url": "b", "chunk": "5"}
+    assert_index_matches_rows(reloaded)
+
+    # Compacting absorbs the log: the next load replays nothing
+    reloaded.close()
+    again = VectorStore(tmp_path).load()
+    assert again._dirty == 0 and again.size == 20
+    again.close()
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_reindexing_a_page_replaces_its_chunks(tmp_path, index_type):
+    config = IndexConfig(index_type=index_type, promote_threshold=PAGES * CHUNKS_PER_PAGE)
+    vectors = page_vectors()
+    store = VectorStore(tmp_path, index_config=config).load()
+    add_pages(store, vectors)
+    wait_for_promotion(store)
+
+    new = np.random.default_rng(2).random((3, DIM), dtype=np.float32)
+    store.add(list(new), [{"url": "page7", "chunk": f"v2.{i}"} for i in range(3)],
+              key="page7", content_hash="hash7b", replace=True)
+    assert store.size == (PAGES - 1) * CHUNKS_PER_PAGE + 3
+    assert store.indexed_hash("page7") == "hash7b"
+    assert len(store.metadata.ids_for_source("page7")) == 3
+    # The old chunks are gone from results, not shadowed by duplicates
+    assert all(r["metadata"]["url"] != "page7" or r["metadata"]["chunk"].startswith("v2")
+               for r in store.search(vectors[7 * CHUNKS_PER_PAGE + 1], k=50))
+    assert store.search(new[1], k=1)[0]["metadata"]["chunk"] == "v2.1"
+    assert bool(store.tombstones) == (index_type == "hnsw")
+
+    store.vacuum()
+    assert not store.tombstones and store.index.ntotal == store.size
+    assert_index_matches_rows(store)
+    store.close()
+
+
+def test_hybrid_search_fuses_keyword_and_vector_rankings(tmp_path):
+    store = VectorStore(tmp_path).load()
+    vectors = page_vectors()[:4]
+    store.add(list(vectors), [
+        {"url": "a", "chunk": "error code E1234 in the billing service"},
+        {"url": "b", "chunk": "how to reset a password"},
+        {"url": "c", "chunk": "billing overview"},
+        {"url": "d", "chunk": "weather report"},
+    ])
+    # Exact keyword hit that the embedding does not rank first
+    assert [r["metadata"]["url"] for r in store.lexical_search("E1234")] == ["a"]
+    results = store.hybrid_search("E1234", vectors[3], k=2)
+    assert {r["metadata"]["url"] for r in results} == {"a", "d"}
+    assert all(r["score_type"] == "rrf" for r in results)
+    ranks = {r["metadata"]["url"]: r["ranks"] for r in results}
+    assert ranks["a"]["lexical"] == 1 and ranks["d"] == {"vector": 1}
+
+    # Found in both lists beats found in one
+    top = store.hybrid_search("billing", vectors[2], k=1)[0]
+    assert top["metadata"]["url"] == "c" and set(top["ranks"]) == {"vector", "lexical"}
+
+    # Deleted chunks leave the keyword index too
+    store.delete("a")
+    assert store.lexical_search("E1234") == []
+    store.close()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from agent import log
+except ImportError:
+    import datetime
+    def log(stage: str, msg: str):
+        now = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{now}] [{stage}] {msg}")
+
+
+# validator(value, path) -> list of error messages
+Validator = Callable[[Any, str], List[str]]
+
+def _as_number(value) -> Optional[float]:
+    # Mirror pydantic's lax mode, which the server applies: "3" is a valid int
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+JSON_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: _as_number(v) is not None and float(_as_number(v)).is_integer(),
+    "number": lambda v: _as_number(v) is not None,
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def resolve_ref(ref, schema):
+    """Resolve a $ref in a JSON schema."""
+    parts = ref.strip('#/').split('/')
+    resolved = schema
+    for part in parts:
+        resolved = resolved.get(part, {})
+    return resolved
+
+
+def format_param(name, schema, root_schema):
+    """Format a parameter description"""
+    if '$ref' in schema:
+        ref_schema = resolve_ref(schema['$ref'], root_schema)
+        inner_props = ref_schema.get('properties', {})
+        inner_details = []
+        for inner_name, inner_info in inner_props.items():
+            inner_type = inner_info.get('type', 'unknown')
+            inner_details.append(f"{inner_name}:{inner_type}")
+        return f"{name}: {ref_schema.get('title', name)}({', '.join(inner_details)})"
+    else:
+        param_type = schema.get('type', 'unknown')
+        return f"{name}: {param_type}"
+
+
+def compile_schema(schema: Dict[str, Any], root: Dict[str, Any], depth: int = 0) -> Validator:
+    """Compile the subset of JSON schema FastMCP emits (types, required, properties, items, $ref, anyOf)"""
+    if depth > 20:
+        return lambda value, path: []
+    if '$ref' in schema:
+        schema = resolve_ref(schema['$ref'], root)
+
+    checks: List[Validator] = []
+
+    if 'anyOf' in schema:
+        options = [compile_schema(s, root, depth + 1) for s in schema['anyOf']]
+        def check_any(value, path):
+            if any(not option(value, path) for option in options):
+                return []
+            return [f"{path}: does not match any allowed type"]
+        checks.append(check_any)
+
+    expected = schema.get('type')
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        tests = [JSON_TYPES[t] for t in types if t in JSON_TYPES]
+        def check_type(value, path):
+            if tests and not any(test(value) for test in tests):
+                return [f"{path}: expected {'/'.join(types)}, got {type(value).__name__}"]
+            return []
+        checks.append(check_type)
+
+    required = schema.get('required', [])
+    properties = {name: compile_schema(sub, root, depth + 1) for name, sub in schema.get('properties', {}).items()}
+    if required or properties:
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return []
+            errors = [f"{path}.{name}: missing required parameter" for name in required if name not in value]
+            for name, validator in properties.items():
+                if name in value:
+                    errors.extend(validator(value[name], f"{path}.{name}"))
+            return errors
+        checks.append(check_object)
+
+    if 'items' in schema:
+        item_validator = compile_schema(schema['items'], root, depth + 1)
+        def check_items(value, path):
+            if not isinstance(value, list):
+                return []
+            errors = []
+            for i, item in enumerate(value):
+                errors.extend(item_validator(item, f"{path}[{i}]"))
+            return errors
+        checks.append(check_items)
+
+    def validate(value, path):
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+        return errors
+    return validate
+
+
+def catalog_version(tools: List[Any]) -> str:
+    """Hash of the tool names, descriptions and schemas"""
+    payload = [(t.name, getattr(t, 'description', None), t.inputSchema) for t in tools]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ToolCatalog:
+    """Tool list with its prompt description, name lookup and argument validators built once"""
+
+    def __init__(self, tools: List[Any], version: Optional[str] = None):
+        self.tools = list(tools)
+        self.version = version or catalog_version(self.tools)
+        self.by_name = {t.name: t for t in self.tools}
+        self.description = self._describe()
+        self.validators = {t.name: compile_schema(t.inputSchema or {}, t.inputSchema or {}) for t in self.tools}
+
+    def get(self, name: str) -> Optional[Any]:
+        return self.by_name.get(name)
+
+    def validate(self, name: str, arguments: Dict[str, Any]) -> None:
+        """Raise ValueError if the tool is unknown or the arguments do not match its schema"""
+        validator = self.validators.get(name)
+        if validator is None:
+            raise ValueError(f"Tool '{name}' not found in registered tools")
+        errors = validator(arguments, name)
+        if errors:
+            raise ValueError(f"Invalid arguments for '{name}': {'; '.join(errors)}")
+
+    def _describe(self) -> str:
+        tools_description = []
+        for i, tool in enumerate(self.tools):
+            try:
+                params = tool.inputSchema
+                desc = getattr(tool, 'description', 'No description available')
+                name = getattr(tool, 'name', f'tool_{i}')
+
+                if 'properties' in params:
+                    param_details = [
+                        format_param(param_name, param_info, params)
+                        for param_name, param_info in params['properties'].items()
+                    ]
+                    params_str = ', '.join(param_details)
+                else:
+                    params_str = 'no parameters'
+
+                tools_description.append(f"{i+1}. {name}({params_str}) - {desc}")
+            except Exception as e:
+                log("catalog", f"Error processing tool {i}: {e}")
+                tools_description.append(f"{i+1}. Error processing tool")
+        return "\n".join(tools_description)
+
+
+_catalogs: Dict[str, ToolCatalog] = {}
+
+
+def get_catalog(tools: List[Any]) -> ToolCatalog:
+    """Shared catalog for a tool list; only rebuilt when the tool list changes"""
+    version = catalog_version(tools)
+    catalog = _catalogs.get(version)
+    if catalog is None:
+        catalog = ToolCatalog(tools, version=version)
+        _catalogs.clear()  # only the current server tool list is worth keeping
+        _catalogs[version] = catalog
+        log("catalog", f"Built tool catalog {version[:8]} ({len(tools)} tools)")
+    return catalog
@@ -0,0 +1,461 @@
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+
+from ann_index import (
+    IndexConfig, build_index, empty_index, index_ids, is_flat, is_id_mapped,
+    ivf_of, needs_promotion, removal_strategy, search_params, unwrap_ivf,
+)
+from log_util import make_logger
+from metadata_store import MetadataStore
+
+
+# Reciprocal-rank fusion constant: higher values flatten the advantage of top ranks
+RRF_K = 60
+
+
+store_log = make_logger("store")
+
+
+class VectorStore:
+    """FAISS index kept resident in memory, with chunk metadata and hash cache in SQLite.
+
+    The store is loaded once and shared by every ingestion path and by search,
+    so queries only pay for the search itself. All access goes through a lock
+    because pages can be added while searches are running.
+
+    Vectors live under stable chunk ids (in an IndexIDMap2, or in the IVF
+    index itself), so a changed page replaces its old chunks instead of
+    piling up duplicates. Deletes follow the backend's removal strategy
+    (see ann_index.REMOVAL_STRATEGIES): flat and IVF remove vectors at
+    once; HNSW cannot, so deleted ids become tombstones that search skips
+    until `vacuum()` rebuilds the index.
+
+    Persistence is incremental: each add commits the chunk rows, their vectors
+    (to a write-ahead log table) and the source hash in one SQLite
+    transaction. index.bin is only a snapshot; a background compactor
+    rewrites it atomically and records which logged vectors it holds. On
+    load, logged vectors and deletes newer than the snapshot are replayed.
+    The logged vectors are kept at full precision, so vacuum and promotion
+    rebuild from the real embeddings rather than from lossy IVF-PQ codes.
+
+    The same chunk rows are indexed for BM25 keyword search in the metadata
+    store, so `lexical_search` works without an embedder and
+    `hybrid_search` fuses both rankings.
+    """
+
+    def __init__(self, index_dir: Path, index_config: Optional[IndexConfig] = None,
+                 compact_interval: float = 60.0, compact_min_pending: int = 1,
+                 vacuum_ratio: float = 0.2):
+        self.index_dir = Path(index_dir)
+        self.index_config = index_config or IndexConfig()
+        self.index_file = self.index_dir / "index.bin"
+        self.metadata_db = self.index_dir / "metadata.db"
+        # Legacy JSON files, imported into the metadata DB on first load
+        self.metadata_file = self.index_dir / "metadata.json"
+        self.cache_file = self.index_dir / "doc_index_cache.json"
+        self.compact_interval = compact_interval
+        self.compact_min_pending = compact_min_pending
+        self.vacuum_ratio = vacuum_ratio
+
+        self.index: Optional[faiss.Index] = None
+        self.metadata: Optional[MetadataStore] = None
+        self.tombstones: Set[int] = set()
+        # Bumped on every change to the indexed content; used to key result caches
+        self.version = 0
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._vacuum_lock = threading.Lock()
+        self._promoting = False
+        self._dirty = 0
+        self._compactor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def load(self) -> "VectorStore":
+        """Read the index snapshot and replay logged vectors and deletes (once)"""
+        with self._lock:
+            if self.loaded:
+                return self
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            self.metadata = MetadataStore(self.metadata_db)
+            self.metadata.migrate_json(self.metadata_file, self.cache_file)
+            self.index = self._read_snapshot()
+
+            # Vectors committed after the snapshot was taken
+            ids, vectors = self.metadata.wal_vectors()
+            if ids:
+                if self.index is None:
+                    self.index = empty_index(vectors.shape[1])
+                present = set(index_ids(self.index).tolist())
+                missing = [i for i, chunk_id in enumerate(ids) if chunk_id not in present]
+                if missing:
+                    self.index.add_with_ids(vectors[missing], np.array(ids, dtype=np.int64)[missing])
+                    self._dirty += len(missing)
+                    store_log("INFO", f"Replayed {len(missing)} vectors from the write-ahead log")
+
+            # Deletes the snapshot may not reflect yet
+            deleted, _ = self.metadata.deleted_ids()
+            if deleted and self.index is not None:
+                self._remove_from_index(deleted)
+
+            self.loaded = True
+            store_log("INFO", f"Vector store loaded with {self.size} vectors")
+            self._maybe_promote()
+            return self
+
+    def _read_snapshot(self) -> Optional[faiss.Index]:
+        if not self.index_file.is_file():
+            return None
+        index = faiss.read_index(str(self.index_file))
+        if ivf_of(index) is not None and is_id_mapped(index):
+            # Snapshots from when IVF was wrapped in IndexIDMap2
+            store_log("INFO", "Converting ID-mapped IVF snapshot to a plain IVF index")
+            self._dirty += 1
+            ivf = unwrap_ivf(index)
+            if ivf is None:
+                # Its vectors cannot be matched to chunks any more: forget the
+                # content hashes so every page and document is indexed again
+                store_log("ERROR", "IVF snapshot ids were corrupted by a removal; re-index pages and documents")
+                self.metadata.forget_hashes()
+            return ivf
+        if isinstance(index, faiss.IndexIDMap2) or ivf_of(index) is not None:
+            return index
+        # Snapshots from before stable ids: position i held chunk id i
+        store_log("INFO", "Converting index snapshot to an ID-mapped index")
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+        mapped = empty_index(index.d)
+        mapped.add_with_ids(vectors, np.arange(index.ntotal, dtype=np.int64))
+        self._dirty += 1
+        return mapped
+
+    @property
+    def size(self) -> int:
+        """Number of live vectors (tombstones excluded)"""
+        return self.index.ntotal - len(self.tombstones) if self.index is not None else 0
+
+    def is_unchanged(self, key: str, content_hash: str) -> bool:
+        """True if `key` was already indexed with the same content hash"""
+        return self.indexed_hash(key) == content_hash
+
+    def indexed_hash(self, key: str) -> Optional[str]:
+        """Content hash `key` was last indexed with, if any"""
+        with self._lock:
+            self.load()
+            return self.metadata.get_hash(key)
+
+    def mark_indexed(self, key: str, content_hash: str) -> None:
+        with self._lock:
+            self.load()
+            self.metadata.set_hash(key, content_hash)
+
+    def add(self, embeddings: List[np.ndarray], metadata: List[Dict[str, Any]],
+            key: Optional[str] = None, content_hash: Optional[str] = None,
+            replace: bool = False) -> List[int]:
+        """Durably add embeddings and metadata, then add them to the in-memory index.
+
+        When `key`/`content_hash` are given, the source's hash is committed in
+        the same transaction. With `replace=True` the chunks previously indexed
+        for `key` are deleted in that transaction too. Returns the new chunk ids.
+        """
+        if len(embeddings) != len(metadata):
+            raise ValueError("embeddings and metadata must have the same length")
+        vectors = np.stack(embeddings).astype(np.float32) if embeddings else None
+
+        with self._lock:
+            self.load()
+            old_ids = self.metadata.ids_for_source(key) if replace and key is not None else []
+            if vectors is None and not old_ids:
+                if key is not None and content_hash is not None:
+                    self.metadata.set_hash(key, content_hash)
+                return []
+
+            ids = self.metadata.commit(
+                metadata, vectors if vectors is not None else [],
+                key=key, content_hash=content_hash, replace_ids=old_ids,
+            )
+            if old_ids:
+                self._remove_from_index(old_ids)
+                store_log("INFO", f"Replaced {len(old_ids)} old chunks of {key}")
+            if vectors is not None:
+                if self.index is None:
+                    self.index = empty_index(vectors.shape[1])
+                self.index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+            self._dirty += 1
+            self.version += 1
+            self._maybe_promote()
+            return ids
+
+    def delete(self, key: str) -> int:
+        """Delete every chunk of a URL or document; returns how many were removed"""
+        with self._lock:
+            self.load()
+            ids = self.metadata.delete_source(key)
+            if ids and self.index is not None:
+                self._remove_from_index(ids)
+            self._dirty += 1
+            self.version += 1
+            return len(ids)
+
+    def _remove_from_index(self, ids: List[int]) -> None:
+        """Remove ids from the index, or tombstone them if it cannot remove (HNSW)"""
+        if removal_strategy(self.index) == "tombstone":
+            present = set(index_ids(self.index).tolist())
+            self.tombstones.update(i for i in ids if i in present)
+        else:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+
+    def vacuum(self) -> Dict[str, int]:
+        """Rebuild the index without tombstones and reclaim database space.
+
+        Like promotion, the rebuild (training, for IVF/HNSW) runs on a
+        snapshot without holding the lock; adds and deletes made meanwhile
+        are applied to the new index before it is swapped in.
+        """
+        with self._vacuum_lock:
+            with self._lock:
+                self.load()
+                index = self.index
+                tombstones = set(self.tombstones)
+                if index is not None and tombstones:
+                    ids = index_ids(index)
+
+            removed = 0
+            if index is not None and tombstones:
+                kept, vectors = self._full_vectors(index, [i for i in ids.tolist() if i not in tombstones])
+                if is_flat(index):
+                    rebuilt = empty_index(index.d)
+                    rebuilt.add_with_ids(vectors, kept)
+                else:
+                    rebuilt = build_index(vectors, kept, self.index_config)
+
+                with self._lock:
+                    if self.index is index:
+                        # Catch up with adds and deletes made during the rebuild
+                        before = set(ids.tolist())
+                        now = set(index_ids(index).tolist())
+                        added = [i for i in now if i not in before]
+                        if added:
+                            added_ids, added_vectors = self._full_vectors(index, added)
+                            rebuilt.add_with_ids(added_vectors, added_ids)
+                        deleted = (before - now) | (self.tombstones - tombstones)
+                        self.index = rebuilt
+                        self.tombstones = set()
+                        if deleted:
+                            self._remove_from_index(list(deleted))
+                        removed = len(tombstones)
+                        self._dirty += 1
+                        self.version += 1
+                    else:
+                        store_log("WARN", "Index was replaced during vacuum, keeping the new one")
+            with self._lock:
+                self.metadata.vacuum()
+        self.compact(force=True)
+        store_log("SUCCESS", f"Vacuumed index, reclaimed {removed} deleted vectors")
+        return {"removed": removed, "vectors": self.size}
+
+    def _maybe_promote(self) -> None:
+        """Start a background retrain into the configured ANN index if due"""
+        if self._promoting or not needs_promotion(self.index, self.index_config):
+            return
+        self._promoting = True
+        threading.Thread(target=self._promote, name="faiss-promote", daemon=True).start()
+
+    def _promote(self) -> None:
+        try:
+            with self._lock:
+                flat = self.index
+                ids = index_ids(flat)
+            kept, vectors = self._full_vectors(flat, ids.tolist())
+            store_log("INFO", f"Training {self.index_config.index_type} index on {len(kept)} vectors")
+
+            # Training is the slow part and runs without holding the lock
+            promoted = build_index(vectors, kept, self.index_config)
+
+            with self._lock:
+                if self.index is not flat:
+                    return
+                # Catch up with adds and deletes made while we were training
+                before = set(ids.tolist())
+                now = index_ids(flat)
+                added = [i for i in now.tolist() if i not in before]
+                if added:
+                    added_ids, added_vectors = self._full_vectors(flat, added)
+                    promoted.add_with_ids(added_vectors, added_ids)
+                removed = list(before - set(now.tolist()))
+                self.index = promoted
+                if removed:
+                    self._remove_from_index(removed)
+                self._dirty += 1
+                self.version += 1
+            store_log("SUCCESS", f"Promoted index to {self.index_config.index_type} ({promoted.ntotal} vectors)")
+            self.compact(force=True)
+        except Exception as e:
+            store_log("ERROR", f"Index promotion failed, staying on flat index: {e}")
+        finally:
+            self._promoting = False
+
+    def _full_vectors(self, index: faiss.Index, ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids and full-precision vectors of the chunks `ids`, for rebuilding `index`.
+
+        Vectors come from the metadata store. Chunks indexed before it kept
+        every vector are reconstructed from `index` instead (approximately,
+        for IVF-PQ); ids deleted in the meantime are left out.
+        """
+        stored = self.metadata.vectors(ids)
+        missing = [i for i in ids if i not in stored]
+        if missing:
+            store_log("WARN", f"Reconstructing {len(missing)} vectors without a stored copy from the index")
+            with self._lock:
+                for chunk_id in missing:
+                    try:
+                        stored[chunk_id] = index.reconstruct(chunk_id)
+                    except RuntimeError:
+                        pass
+        kept = [i for i in ids if i in stored]
+        vectors = np.stack([stored[i] for i in kept]) if kept else np.zeros((0, index.d), dtype=np.float32)
+        return np.array(kept, dtype=np.int64), np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def compact(self, force: bool = False) -> None:
+        """Write a new index.bin snapshot, then mark the vector log as applied and prune the delete log.
+
+        The snapshot is written to a temp file and renamed into place, so a
+        crash leaves either the old or the new snapshot, never a torn one.
+        """
+        with self._compact_lock:
+            with self._lock:
+                if self.index is None or (not force and self._dirty < self.compact_min_pending):
+                    return
+                # Serializing is a memory copy; the disk write happens outside the lock
+                data = faiss.serialize_index(self.index)
+                wal_cutoff = self.metadata.next_id()
+                _, deleted_seq = self.metadata.deleted_ids()
+                tombstones = set(self.tombstones)
+                dirty = self._dirty
+
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.index_file.with_suffix(".bin.tmp")
+            with open(tmp_file, "wb") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.index_file)
+
+            self.metadata.mark_snapshot(wal_cutoff)
+            # Tombstoned ids are still in the snapshot; keep their deletes logged
+            self.metadata.prune_deleted(deleted_seq, keep=tombstones)
+            with self._lock:
+                self._dirty -= dirty
+            store_log("INFO", f"Compacted index snapshot ({self.size} vectors)")
+
+    def save(self) -> None:
+        """Write an index snapshot now (data is already durable in the log)"""
+        self.compact(force=True)
+
+    def start_compactor(self) -> None:
+        """Compact (and vacuum when tombstones pile up) in a background thread"""
+        if self._compactor is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.compact_interval):
+                try:
+                    if self.index is not None and len(self.tombstones) > self.vacuum_ratio * max(self.index.ntotal, 1):
+                        self.vacuum()
+                    else:
+                        self.compact()
+                except Exception as e:
+                    store_log("ERROR", f"Background compaction failed: {e}")
+
+        self._compactor = threading.Thread(target=run, name="faiss-compactor", daemon=True)
+        self._compactor.start()
+
+    def close(self) -> None:
+        """Stop the compactor and write a final snapshot"""
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join(timeout=5)
+            self._compactor = None
+        if self.loaded:
+            self.compact()
+
+    def _vector_hits(self, query_embedding: np.ndarray, k: int, nprobe: Optional[int],
+                     ef_search: Optional[int]) -> List[Tuple[int, float]]:
+        """Top-k (chunk id, squared L2 distance) pairs from the FAISS index, closest (lowest) first"""
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            self.load()
+            if self.index is None or self.size == 0:
+                return []
+            params = search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+            # Over-fetch so tombstoned hits do not shrink the result list
+            fetch = min(k + len(self.tombstones), self.index.ntotal)
+            distances, indices = self.index.search(query, fetch, params=params)
+            return [
+                (int(idx), float(dist)) for idx, dist in zip(indices[0], distances[0])
+                if idx != -1 and int(idx) not in self.tombstones
+            ][:k]
+
+    def _lexical_hits(self, query: str, k: int) -> List[Tuple[int, float]]:
+        with self._lock:
+            self.load()
+            return self.metadata.lexical_search(query, k)
+
+    def _results(self, hits: List[Tuple[int, float]], score_type: str,
+                 extra: Optional[Dict[int, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        # Only the k matching rows are read from the metadata store
+        rows = self.metadata.get_many(idx for idx, _ in hits)
+        results = []
+        for idx, score in hits:
+            item = rows.get(idx)
+            if item is not None:  # Valid index
+                result = {"score": score, "score_type": score_type, "metadata": item}
+                if extra:
+                    result.update(extra.get(idx, {}))
+                results.append(result)
+        return results
+
+    def search(self, query_embedding: np.ndarray, k: int = 5,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the k nearest chunks as {"score", "score_type", "metadata"} dicts.
+
+        Scores are squared L2 distances (score_type "squared_l2_distance"), as
+        FAISS returns them: lower is closer, 0 is an exact match.
+
+        `nprobe` (IVF) and `ef_search` (HNSW) trade recall for latency per query
+        and are ignored by the flat index.
+        """
+        return self._results(self._vector_hits(query_embedding, k, nprobe, ef_search), "squared_l2_distance")
+
+    def lexical_search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Return the k best BM25 keyword matches (score_type "bm25", higher is better); needs no embedding"""
+        return self._results(self._lexical_hits(query, k), "bm25")
+
+    def hybrid_search(self, query: str, query_embedding: np.ndarray, k: int = 5,
+                      nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      candidates: Optional[int] = None, rrf_k: int = RRF_K) -> List[Dict[str, Any]]:
+        """Fuse vector and BM25 rankings with reciprocal-rank fusion.
+
+        Each list contributes 1 / (rrf_k + rank) for the chunks it ranks within
+        its top `candidates` (default 4k), so exact keyword hits the embedding
+        misses still surface, and vice versa. Results carry the fused score
+        (score_type "rrf", higher is better) and the chunk's rank in each list ({"vector": .., "lexical": ..}).
+        """
+        candidates = candidates or 4 * k
+        rankings = {
+            "vector": self._vector_hits(query_embedding, candidates, nprobe, ef_search),
+            "lexical": self._lexical_hits(query, candidates),
+        }
+        fused: Dict[int, float] = {}
+        ranks: Dict[int, Dict[str, Any]] = {}
+        for name, hits in rankings.items():
+            for rank, (idx, _) in enumerate(hits, start=1):
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (rrf_k + rank)
+                ranks.setdefault(idx, {"ranks": {}})["ranks"][name] = rank
+        top = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return self._results(top, "rrf", ranks)